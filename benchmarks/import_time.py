@@ -0,0 +1,70 @@
+"""Check the time taken by `import meep_adjoint` in a headless environment.
+
+Usage:
+
+    python benchmarks/import_time.py [--budget SEC] [--repeat N] [--real-meep]
+
+Each measurement runs in a fresh interpreter with no display, imports meep
+(the stand-in in benchmarks/standin unless --real-meep is given) and then
+meep_adjoint, and records the time taken by the latter. The script exits with
+nonzero status if the best of --repeat measurements exceeds --budget, or if
+the import pulled in any of the heavy optional dependencies (sympy,
+matplotlib, PyQt5, dolfin), which should be loaded only on first use.
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+HEAVY_MODULES = ['sympy', 'matplotlib', 'PyQt5', 'dolfin']
+
+PROBE = """
+import sys, time, json
+import meep
+t0 = time.perf_counter()
+import meep_adjoint
+t1 = time.perf_counter()
+heavy = sorted(set(m.split('.')[0] for m in sys.modules) & set({heavy!r}))
+print(json.dumps({{'seconds': t1-t0, 'heavy': heavy}}))
+""".format(heavy=HEAVY_MODULES)
+
+
+def measure(real_meep=False):
+    """Time `import meep_adjoint` once in a fresh headless interpreter."""
+    env = dict(os.environ)
+    for var in ['DISPLAY', 'WAYLAND_DISPLAY', 'MPLBACKEND']:
+        env.pop(var, None)
+    path = [ROOT] + ([] if real_meep else [os.path.join(HERE, 'standin')])
+    env['PYTHONPATH'] = os.pathsep.join(path + [env.get('PYTHONPATH', '')])
+    output = subprocess.check_output([sys.executable, '-c', PROBE], env=env, cwd=HERE)
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--budget', type=float, default=0.5, help='maximum import time (s)')
+    parser.add_argument('--repeat', type=int, default=3, help='number of measurements')
+    parser.add_argument('--real-meep', action='store_true', help='use installed pymeep instead of the stand-in')
+    args = parser.parse_args(argv)
+
+    results = [ measure(args.real_meep) for _ in range(args.repeat) ]
+    best    = min(r['seconds'] for r in results)
+    heavy   = sorted(set(m for r in results for m in r['heavy']))
+    print('import meep_adjoint: {:.3f} s (best of {}, budget {:.3f} s)'.format(best, args.repeat, args.budget))
+
+    status = 0
+    if best > args.budget:
+        print('FAILED: import time exceeds budget')
+        status = 1
+    if heavy:
+        print('FAILED: import loaded heavy optional dependencies: {}'.format(', '.join(heavy)))
+        status = 1
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,436 @@
+"""Timing benchmarks for the Python-side hot paths of meep_adjoint.
+
+Usage:
+
+    python benchmarks/run_benchmarks.py [--output FILE] [--compare FILE]
+                                        [--repeat N] [--min-time SEC]
+                                        [--filter SUBSTR] [--real-meep]
+
+By default the benchmarks run against the lightweight libmeep stand-in in
+benchmarks/standin (a fake ``mp.Simulation`` returning synthetic DFT arrays),
+so they do not require a working meep installation and time only the
+meep_adjoint code itself. Pass --real-meep to import the installed pymeep
+instead.
+
+Results are written as JSON (by default to benchmarks/results/<git commit>.json).
+With --compare, the results are compared to those of a previous run and the
+script exits with nonzero status if any benchmark slowed down by more than
+--threshold (default 25%).
+"""
+import os
+import sys
+import json
+import time
+import socket
+import platform
+import argparse
+import tempfile
+import threading
+import subprocess
+from datetime import datetime
+from collections import OrderedDict
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+BENCHMARKS = OrderedDict()
+OPTIONS    = argparse.Namespace(repeat=5, real_meep=False)   # set by main()
+
+
+def benchmark(name):
+    """Register a benchmark.
+
+    The decorated function performs any setup and returns a zero-argument
+    callable, whose execution time is what gets measured. It may raise
+    ImportError to indicate that the benchmark is unavailable (e.g. because
+    an optional dependency is not installed), in which case it is skipped.
+    """
+    def _register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return _register
+
+
+######################################################################
+# shared fixtures
+######################################################################
+def hat_basis(n=6, size=(2.0, 2.0)):
+    """Tensor-product piecewise-linear ('hat') basis on an n x n lattice of nodes."""
+    import meep_adjoint as ma
+    from meep_adjoint.basis import Basis
+
+    class HatBasis(Basis):
+        def __init__(self):
+            super().__init__(n*n, size=[size[0], size[1], 0], center=[0, 0, 0])
+            self.nodes = [np.linspace(-0.5*s, 0.5*s, n) for s in size]
+            self.h     = [s/(n-1) for s in size]
+
+        def get_bvector(self, p):
+            p = ma.v3(p)
+            bx, by = [ np.maximum(0, 1-np.abs(p[d]-self.nodes[d])/self.h[d]) for d in range(2) ]
+            return np.outer(bx, by).flatten()
+
+    return HatBasis()
+
+
+def fake_simulation(resolution=20):
+    import meep as mp
+    return mp.Simulation(cell_size=mp.Vector3(4, 4), resolution=resolution)
+
+
+def dft_cells(sim, nfreq=None):
+    """A flux cell (index 0) and a design cell (index 1) registered in sim."""
+    import meep as mp
+    import meep_adjoint as ma
+    freqs  = {} if nfreq is None else {'fcen': 1.0, 'df': 0.4, 'nfreq': nfreq}
+    flux   = ma.DFTCell(ma.Subregion(center=[1.5, 0, 0], size=[0, 3, 0], normal=mp.X, name='east'), **freqs)
+    design = ma.DFTCell(ma.Subregion(center=[0, 0, 0], size=[2, 2, 0], name='design'),
+                        components=ma.E_CPTS, **freqs)
+    for cell in (flux, design):
+        cell.register(sim)
+    sim.run(until=100.0)
+    for cell in (flux, design):
+        cell.save_fields('forward')
+        cell.save_fields('incident')
+    return [flux, design]
+
+
+######################################################################
+# Basis
+######################################################################
+@benchmark('basis.project')
+def bench_basis_project():
+    import meep_adjoint as ma
+    basis, grid = hat_basis(), ma.make_grid([2, 2, 0], dims=[81, 81])
+    samples = np.random.RandomState(0).rand(*grid.shape)
+    basis.project(samples, grid=grid)      # warm caches, as in an optimization loop
+    return lambda: basis.project(samples, grid=grid)
+
+
+@benchmark('basis.gram_matrix')
+def bench_basis_gram_matrix():
+    import meep_adjoint as ma
+    basis, grid = hat_basis(), ma.make_grid([2, 2, 0], dims=[31, 31])
+    def _assemble():
+        basis.invalidate_cache()       # time assembly, not a lookup in the Gram-matrix cache
+        return basis.gram_matrix(grid=grid)
+    return _assemble
+
+
+@benchmark('basis.inner_product')
+def bench_basis_inner_product():
+    import meep_adjoint as ma
+    basis, grid = hat_basis(), ma.make_grid([2, 2, 0], dims=[31, 31])
+    g = np.random.RandomState(0).rand(*grid.shape)
+    return lambda: basis.inner_product(g, grid=grid)
+
+
+@benchmark('basis.grid_samples.expression')
+def bench_grid_samples_expression():
+    import meep_adjoint as ma
+    from meep_adjoint.basis import grid_samples
+    grid = ma.make_grid([2, 2, 0], dims=[81, 81])
+    return lambda: grid_samples('1.0 + x*x*y', grid)
+
+
+@benchmark('basis.grid_samples.callable')
+def bench_grid_samples_callable():
+    import meep_adjoint as ma
+    from meep_adjoint.basis import grid_samples
+    grid = ma.make_grid([2, 2, 0], dims=[81, 81])
+    return lambda: grid_samples(lambda p: 1.0 + p[...,0]*p[...,0]*p[...,1], grid)
+
+
+@benchmark('basis.parameterized_function')
+def bench_basis_parameterized_function():
+    import meep_adjoint as ma
+    basis = hat_basis()
+    beta  = np.random.RandomState(0).rand(basis.dim)
+    f     = basis.parameterized_function(beta, grid=ma.make_grid([2, 2, 0], dims=[81, 81]))
+    points = [ np.array([x, y, 0.0]) for x, y in np.random.RandomState(1).uniform(-1, 1, (1000, 2)) ]
+    return lambda: [f(p) for p in points]
+
+
+@benchmark('fe_basis.parameterized_function')
+def bench_fe_parameterized_function():
+    import dolfin   # optional dependency; ImportError means 'skip'
+    from meep_adjoint import FiniteElementBasis
+    basis  = FiniteElementBasis(size=[2, 2, 0], element_length=0.1)
+    beta   = np.random.RandomState(0).rand(basis.dim)
+    f      = basis.parameterized_function(beta)
+    points = [ np.array([x, y, 0.0]) for x, y in np.random.RandomState(1).uniform(-1, 1, (1000, 2)) ]
+    return lambda: [f(p) for p in points]
+
+
+@benchmark('simple_fe_basis.interpolation_matrix')
+def bench_simple_fe_interpolation_matrix():
+    import meep_adjoint as ma
+    basis = ma.SimpleFiniteElementBasis(size=[2, 2, 0], element_length=0.1)
+    grid  = ma.make_grid([2, 2, 0], dims=[81, 81])
+    return lambda: basis.get_bmatrix(ma.grid_points(grid))
+
+
+@benchmark('simple_fe_basis.project')
+def bench_simple_fe_project():
+    import meep_adjoint as ma
+    basis = ma.SimpleFiniteElementBasis(size=[2, 2, 0], element_length=0.1)
+    basis.project('1.0 + x*x*y')
+    return lambda: basis.project('1.0 + x*x*y')
+
+
+######################################################################
+# DFTCell
+######################################################################
+def bench_dft_cell(qcode, ncell):
+    def _setup():
+        cells = dft_cells(fake_simulation())
+        cells[ncell](qcode, mode=1)      # eigenmode slices are cached after the first call
+        return lambda: cells[ncell](qcode, mode=1)
+    return _setup
+
+for qcode, ncell in [('S', 0), ('s', 0), ('P', 0), ('M', 0), ('p', 0),
+                     ('UE', 1), ('UH', 0), ('UEH', 0)]:
+    benchmark('dft_cell.{}'.format(qcode))(bench_dft_cell(qcode, ncell))
+
+
+@benchmark('dft_cell.make_grid.3d')
+def bench_make_grid():
+    import meep_adjoint as ma
+    return lambda: ma.make_grid([2, 2, 2], dims=[60, 60, 60])
+
+
+@benchmark('dft_cell.save_fields')
+def bench_dft_cell_save_fields():
+    cells = dft_cells(fake_simulation())
+    return lambda: [cell.save_fields('forward') for cell in cells]
+
+
+######################################################################
+# ObjectiveFunction and adjoint sources
+######################################################################
+def objective(cells):
+    import meep_adjoint as ma
+    return ma.ObjectiveFunction(fstr='Abs(P1_east)**2 / (Abs(P1_east)**2 + Abs(M1_east)**2) + 0.1*S_east')
+
+
+@benchmark('objective.__call__')
+def bench_objective_call():
+    cells = dft_cells(fake_simulation())
+    obj_func = objective(cells)
+    return lambda: obj_func(cells)
+
+
+@benchmark('objective.__call__.broadband')
+def bench_objective_call_broadband():
+    cells = dft_cells(fake_simulation(), nfreq=8)
+    obj_func = objective(cells)
+    obj_func(cells, nf=None)
+    return lambda: obj_func(cells, nf=None)
+
+
+@benchmark('objective.get_dfdq')
+def bench_objective_get_dfdq():
+    cells = dft_cells(fake_simulation())
+    obj_func = objective(cells)
+    obj_func(cells)
+    return obj_func.get_dfdq
+
+
+@benchmark('timestepper.get_adjoint_sources')
+def bench_adjoint_sources():
+    import meep as mp
+    import meep_adjoint as ma
+    sim      = fake_simulation()
+    cells    = dft_cells(sim)
+    obj_func = objective(cells)
+    obj_func(cells)
+    sources  = [ mp.Source(mp.GaussianSource(1.0, fwidth=0.2), mp.Ez, center=mp.Vector3(-1.5)) ]
+    stepper  = ma.TimeStepper(obj_func, cells, hat_basis(), sim, sources)
+    return stepper.get_adjoint_sources
+
+
+def bench_prepare(reuse):
+    """Preparation of a forward run after a design change, with or without
+       recycling the simulation of the previous run (the stand-in's
+       set_materials is free, so this times only the Python-side work)."""
+    def _setup():
+        import meep as mp
+        import meep_adjoint as ma
+        from meep_adjoint.adjoint_options import set_adjoint_options
+        sim      = fake_simulation()
+        cells    = dft_cells(sim)
+        sources  = [ mp.Source(mp.GaussianSource(1.0, fwidth=0.2), mp.Ez, center=mp.Vector3(-1.5)) ]
+        stepper  = ma.TimeStepper(objective(cells), cells, hat_basis(), sim, sources)
+        def _prepare():
+            set_adjoint_options({'reuse_simulation': reuse})
+            stepper.state, stepper.eps_stale = 'forward.complete', True
+            stepper.prepare('forward')
+            set_adjoint_options({'reuse_simulation': False})
+        return _prepare
+    return _setup
+
+benchmark('timestepper.prepare.fresh')(bench_prepare(False))
+benchmark('timestepper.prepare.reuse')(bench_prepare(True))
+
+
+######################################################################
+# log and dashboard I/O
+######################################################################
+@benchmark('util.log')
+def bench_log():
+    import meep_adjoint as ma
+    logfile = os.path.join(tempfile.mkdtemp(), 'bench.log')
+    ma.init_log(filename=logfile, loglevel='info')
+    def _run():
+        for n in range(1000):
+            ma.log('   ** t={} MRD={} ** ', 0.1*n, 1.0/(n+1))
+            ma.debug('   ** next check interval {} ** ', n)
+        ma.flush_log()
+    return _run
+
+
+@benchmark('dashboard.update')
+def bench_dashboard():
+    from meep_adjoint import dashboard_client as dbc
+    ours, theirs = socket.socketpair()
+    def _drain():
+        while theirs.recv(65536):
+            pass
+    threading.Thread(target=_drain, daemon=True).start()
+    dbc.dashboard_socket = ours
+    def _run():
+        for n in range(1000):
+            dbc.update_dashboard(['progress {}'.format(n), 'ms_per_timestep {}'.format(0.1*n)])
+    return _run
+
+
+######################################################################
+# package import (timed in fresh interpreters; see import_time.py)
+######################################################################
+@benchmark('import.meep_adjoint')
+def bench_import():
+    from import_time import measure
+    def _run():
+        repeat = OPTIONS.repeat
+        times  = [ measure(real_meep=OPTIONS.real_meep)['seconds'] for _ in range(repeat) ]
+        return OrderedDict([ ('min', min(times)), ('median', float(np.median(times))),
+                             ('mean', float(np.mean(times))), ('std', float(np.std(times))),
+                             ('number', 1), ('repeat', repeat) ])
+    return _run
+
+
+######################################################################
+# timing and reporting
+######################################################################
+def time_callable(func, repeat, min_time):
+    """Time func() as timeit does: calibrate a loop count so that each of
+       `repeat` measurements takes at least min_time seconds. A warm-up call
+       and the calibration passes are not measurements."""
+    func()
+    number, elapsed = 1, 0.0
+    while True:
+        t0 = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - t0
+        if elapsed >= min_time or number >= 1<<20:
+            break
+        number = max(2*number, int(1.2*number*min_time/max(elapsed, 1e-9)))
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(number):
+            func()
+        times.append((time.perf_counter()-t0)/number)
+    return OrderedDict([ ('min', min(times)), ('median', float(np.median(times))),
+                         ('mean', float(np.mean(times))), ('std', float(np.std(times))),
+                         ('number', number), ('repeat', repeat) ])
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare(results, baseline, threshold):
+    """Print a comparison table and return the names of regressed benchmarks."""
+    regressions = []
+    print('\n{:40s} {:>12s} {:>12s} {:>8s}'.format('benchmark', 'baseline', 'current', 'ratio'))
+    for name, r in results.items():
+        b = baseline.get(name)
+        if not b or 'min' not in r or 'min' not in b:
+            continue
+        ratio = r['min']/b['min']
+        flag  = ' <-- slower' if ratio > 1.0+threshold else ''
+        print('{:40s} {:12.3e} {:12.3e} {:8.2f}{}'.format(name, b['min'], r['min'], ratio, flag))
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--output', default=None, help='JSON output file')
+    parser.add_argument('--compare', default=None, help='JSON results of a previous run to compare against')
+    parser.add_argument('--threshold', type=float, default=0.25, help='relative slowdown counted as a regression')
+    parser.add_argument('--repeat', type=int, default=5, help='number of timing measurements per benchmark')
+    parser.add_argument('--min-time', type=float, default=0.05, help='minimum duration of each measurement (s)')
+    parser.add_argument('--filter', default='', help='run only benchmarks whose names contain this string')
+    parser.add_argument('--real-meep', action='store_true', help='use installed pymeep instead of the stand-in')
+    args = parser.parse_args(argv)
+    OPTIONS.repeat, OPTIONS.real_meep = args.repeat, args.real_meep
+
+    if not args.real_meep:
+        sys.path.insert(0, os.path.join(HERE, 'standin'))
+    sys.path.insert(0, ROOT)
+    os.environ.setdefault('MPLBACKEND', 'Agg')
+    import meep_adjoint as ma
+    ma.set_option_defaults({'dashboard_size': 0.0, 'silence_meep': False}, search_env=False)
+
+    results = OrderedDict()
+    for name, setup in BENCHMARKS.items():
+        if args.filter not in name:
+            continue
+        try:
+            func = setup()
+        except ImportError as e:
+            print('{:40s} skipped ({})'.format(name, e))
+            results[name] = {'skipped': str(e)}
+            continue
+        results[name] = func() if name.startswith('import.') else time_callable(func, args.repeat, args.min_time)
+        print('{:40s} {:12.3e} s  (median {:.3e}, {} x {})'.format(
+               name, results[name]['min'], results[name]['median'], args.repeat, results[name]['number']))
+
+    commit = git_commit()
+    report = OrderedDict([
+        ('meta', OrderedDict([ ('commit', commit),
+                               ('date', datetime.now().isoformat(timespec='seconds')),
+                               ('python', platform.python_version()),
+                               ('numpy', np.__version__),
+                               ('machine', platform.machine()),
+                               ('meep', 'real' if args.real_meep else 'standin') ])),
+        ('results', results) ])
+
+    output = args.output or os.path.join(HERE, 'results', '{}.json'.format(commit))
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print('\nwrote {}'.format(output))
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print('\n{} benchmark(s) regressed: {}'.format(len(regressions), ', '.join(regressions)))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
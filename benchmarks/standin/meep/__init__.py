@@ -0,0 +1,317 @@
+"""Lightweight stand-in for pymeep, for benchmarking meep_adjoint without libmeep.
+
+This module implements just enough of the pymeep API used by meep_adjoint
+to exercise its Python-side code paths: vectors and field-component constants,
+source and region descriptors, and a fake ``Simulation`` whose DFT objects
+return synthetic (but deterministic) frequency-domain field arrays instead
+of running an FDTD solve. Timestepping merely advances the clock, and the
+synthetic DFT fields approach their asymptotic values exponentially in time,
+so that convergence checks in TimeStepper.run terminate as they would in a
+real calculation.
+
+It is placed on sys.path by benchmarks/run_benchmarks.py (unless the real
+meep is requested) and by tests/conftest.py (if the real meep cannot be
+imported), and is not intended for any other use: the synthetic fields
+exercise meep_adjoint's bookkeeping and numerics, not its physics.
+"""
+import numpy as np
+
+######################################################################
+# vectors, field components, misc constants
+######################################################################
+class Vector3(object):
+    def __init__(self, x=0.0, y=0.0, z=0.0):
+        self.x, self.y, self.z = float(x), float(y), float(z)
+
+    def __array__(self, dtype=None, copy=None):
+        return np.array([self.x, self.y, self.z], dtype=dtype)
+
+    def __getitem__(self, i):
+        return (self.x, self.y, self.z)[i]
+
+    def __repr__(self):
+        return 'Vector3({}, {}, {})'.format(self.x, self.y, self.z)
+
+
+class vec(Vector3):
+    """Stand-in for the low-level meep::vec."""
+    pass
+
+
+Ex, Ey, Er, Ep, Ez, Hx, Hy, Hr, Hp, Hz = 0, 1, 2, 3, 4, 5, 6, 7, 8, 9
+Dielectric, Permeability = 100, 101
+X, Y, Z = 0, 1, 2
+ALL = -1
+
+_component_names = {Ex:'ex', Ey:'ey', Ez:'ez', Hx:'hx', Hy:'hy', Hz:'hz',
+                    Dielectric:'eps', Permeability:'mu'}
+
+def component_name(c):
+    return _component_names.get(c, 'c{}'.format(c))
+
+inf = 1.0e20
+
+def am_master():
+    return True
+
+def am_really_master():
+    return True
+
+def count_processors():
+    return 1
+
+def with_mpi():
+    return False
+
+def divide_parallel_processes(numgroups):
+    return 0
+
+def merge_subgroup_data(data):
+    return np.asarray(data)[..., None]
+
+def my_rank():
+    return 0
+
+def abort(msg):
+    raise RuntimeError(msg)
+
+######################################################################
+# materials and geometry
+######################################################################
+class Medium(object):
+    def __init__(self, epsilon=1.0, mu=1.0, epsilon_func=None, **kwargs):
+        self.epsilon, self.mu, self.epsilon_func = epsilon, mu, epsilon_func
+        self.__dict__.update(kwargs)
+
+vacuum = Medium()
+
+
+class Block(object):
+    def __init__(self, size=None, center=None, material=None, epsilon_func=None, **kwargs):
+        self.size, self.center = size, center
+        self.material = material if material is not None else Medium(epsilon_func=epsilon_func)
+        self.__dict__.update(kwargs)
+
+
+class PML(object):
+    def __init__(self, thickness, direction=ALL, **kwargs):
+        self.thickness, self.direction = thickness, direction
+
+
+class Volume(object):
+    def __init__(self, center=None, size=None, **kwargs):
+        self.center, self.size = center or Vector3(), size or Vector3()
+
+
+class FluxRegion(Volume):
+    def __init__(self, center=None, size=None, direction=None, **kwargs):
+        super().__init__(center, size)
+        self.direction = direction
+
+######################################################################
+# sources
+######################################################################
+class _SourceTime(object):
+    """Stand-in for the low-level meep::src_time."""
+    def __init__(self, last_time):
+        self._last_time = last_time
+
+    def last_time(self):
+        return self._last_time
+
+
+class GaussianSource(object):
+    def __init__(self, frequency=None, fwidth=0.1, width=None, start_time=0.0, cutoff=5.0, **kwargs):
+        self.frequency = frequency
+        self.fwidth    = fwidth if width is None else 1.0/width
+        self.width     = 1.0/self.fwidth
+        self.swigobj   = _SourceTime(start_time + 2.0*cutoff*self.width)
+
+    def fourier_transform(self, f):
+        return self.width*np.exp(-0.5*((f-self.frequency)*2.0*np.pi*self.width)**2)
+
+
+class CustomSource(object):
+    def __init__(self, src_func, start_time=-1.0e20, end_time=1.0e20, center_frequency=0.0, fwidth=0.0, **kwargs):
+        self.src_func, self.frequency, self.fwidth = src_func, center_frequency, fwidth
+        self.swigobj = _SourceTime(end_time)
+
+
+class Source(object):
+    def __init__(self, src, component, center=None, size=None, amplitude=1.0,
+                       amp_func=None, amp_data=None, **kwargs):
+        self.src, self.component, self.center, self.size = src, component, center, size
+        self.amplitude, self.amp_func, self.amp_data = amplitude, amp_func, amp_data
+
+
+class EigenModeSource(Source):
+    def __init__(self, src, center=None, size=None, eig_band=1, component=None, **kwargs):
+        super().__init__(src, component or Ez, center, size, **kwargs)
+        self.eig_band = eig_band
+
+######################################################################
+# step functions
+######################################################################
+def at_every(dt, *step_funcs):
+    return (dt, step_funcs)
+
+######################################################################
+# synthetic DFT data
+######################################################################
+class _DFTObject(object):
+    """Fake DFT object holding synthetic asymptotic field arrays.
+
+       Field component c at frequency index nf is a smooth complex
+       pattern over the grid, seeded by (c, nf) so that repeated runs
+       produce identical data; its value at simulation time t is the
+       asymptotic pattern times (1 - exp(-(t-t0)/tau)), where t0 is the
+       time at which the registers were last zeroed by scale_dfts(0).
+    """
+    tau = 10.0
+
+    def __init__(self, sim, components, nfreq, shape):
+        self.sim, self.components, self.nfreq = sim, components, nfreq
+        self.shape, self.scale, self.data = tuple(shape), 1.0, {}
+        self.t0, self.swigobj = 0.0, self
+
+    def pattern(self, c, nf):
+        if (c, nf) not in self.data:
+            rng    = np.random.RandomState(1000*(c+1) + nf)
+            axes   = np.meshgrid(*[np.linspace(0, 1, n) for n in self.shape], indexing='ij')
+            phase  = sum(rng.uniform(1, 4)*a for a in axes)
+            if c in (Dielectric, Permeability):
+                self.data[c, nf] = (1.0 + rng.uniform(0, 11)*np.cos(np.pi*phase)**2).astype(complex)
+            else:
+                self.data[c, nf] = rng.uniform(0.5, 2)*np.exp(2.0j*np.pi*phase)
+        return self.data[c, nf]
+
+    def array(self, c, nf):
+        if c in (Dielectric, Permeability):
+            return self.pattern(c, nf).copy()
+        if c not in self.components:
+            return np.array(0.0)       # mimic pymeep's rank-0 result for missing components
+        return self.scale*(1.0-np.exp(-(self.sim.time-self.t0)/self.tau))*self.pattern(c, nf)
+
+    def scale_dfts(self, s):
+        if s == 0.0:       # zeroed registers accumulate afresh from now on
+            self.scale, self.t0 = 1.0, self.sim.time
+        else:
+            self.scale *= s
+
+
+class _EigenmodeData(object):
+    def __init__(self, band, freq):
+        self.band, self.freq, self.swigobj = band, freq, (band, freq)
+
+    def amplitude(self, point, component):
+        # as in pymeep: convert the point to a meep::vec on every call
+        return eigenmode_amplitude(self.swigobj, vec(point.x, point.y, point.z), component)
+
+
+def eigenmode_amplitude(data, v, c):
+    """Closed-form fake eigenmode profile: a transverse Gaussian of the given band."""
+    band, freq = data
+    r2 = v.x*v.x + v.y*v.y + v.z*v.z
+    return complex((1.0+0.1*c)*np.exp(-r2*band), freq*(v.x+v.y+v.z))
+
+
+def get_dft_array(sim, dft_obj, c, nf):
+    return sim.get_dft_array(dft_obj, c, nf)
+
+######################################################################
+# fake simulation
+######################################################################
+class _Structure(object):
+    pass
+
+
+class Simulation(object):
+    def __init__(self, cell_size=None, resolution=10, geometry=None, sources=None,
+                       boundary_layers=None, eps_averaging=True, **kwargs):
+        self.cell_size       = cell_size or Vector3()
+        self.resolution      = resolution
+        self.geometry        = geometry or []
+        self.sources         = sources or []
+        self.boundary_layers = boundary_layers or []
+        self.structure       = None
+        self.fields          = None
+        self.dft_objects     = []
+        self.time            = 0.0
+        self.force_complex_fields = False
+        self.__dict__.update(kwargs)
+
+    # initialization and reconfiguration
+    def init_sim(self):
+        self.structure = self.fields = _Structure()
+
+    def set_materials(self, geometry=None, default_material=None):
+        if geometry is not None:
+            self.geometry = geometry
+
+    def restart_fields(self):
+        self.time = 0.0
+
+    def change_sources(self, sources):
+        self.sources = sources
+
+    def reset_meep(self):
+        self.structure = self.fields = None
+        self.dft_objects, self.time = [], 0.0
+
+    # timestepping
+    def round_time(self):
+        return float(np.round(self.time, 6))
+
+    def meep_time(self):
+        return self.time
+
+    def run(self, *step_funcs, until=None, **kwargs):
+        if self.structure is None:
+            self.init_sim()
+        t0, t1 = self.time, (until if until is not None else self.time)
+        for step in step_funcs:
+            dt, funcs = step if isinstance(step, tuple) else (None, (step,))
+            for t in (np.arange(t0, t1, dt) if dt else [t1]):
+                self.time = t
+                for f in funcs:
+                    f(self)
+        self.time = max(t1, self.time)
+
+    # grid metadata
+    def get_array_metadata(self, vol=None, center=None, size=None, collapse=False, snap=False, **kwargs):
+        c, s = np.array(center or Vector3()), np.array(size or Vector3())
+        tics = [ np.linspace(cc-0.5*ss, cc+0.5*ss, int(round(ss*self.resolution))+1) if ss>0
+                 else np.array([cc]) for cc, ss in zip(c, s) ]
+        dV   = np.prod([1.0/self.resolution for ss in s if ss>0])
+        w    = dV*np.ones([len(t) for t in tics if len(t)>1] or [1])
+        return [tics[0], tics[1], tics[2], w]
+
+    def _grid_shape(self, center, size):
+        xyzw = self.get_array_metadata(center=center, size=size)
+        return xyzw[3].shape
+
+    # DFT objects
+    def add_flux(self, fcen, df, nfreq, *regions):
+        r = regions[0]
+        components = [Ex, Ey, Ez, Hx, Hy, Hz]
+        dft = _DFTObject(self, components, nfreq, self._grid_shape(r.center, r.size))
+        self.dft_objects.append(dft)
+        return dft
+
+    def add_dft_fields(self, components, fmin, fmax, nfreq, center=None, size=None, **kwargs):
+        dft = _DFTObject(self, list(components), nfreq, self._grid_shape(center, size))
+        self.dft_objects.append(dft)
+        return dft
+
+    def get_dft_array(self, dft_obj, c, nf):
+        return dft_obj.array(c, nf)
+
+    def get_eigenmode(self, freq, direction, where, band_num, kpoint, **kwargs):
+        return _EigenmodeData(band_num, freq)
+
+    def get_epsilon(self):
+        n = [max(1, int(round(s*self.resolution))) for s in np.array(self.cell_size)]
+        return np.ones([m for m in n if m>1])
+
+    def get_source_slice(self, component, vol=None, **kwargs):
+        return np.zeros((1,))
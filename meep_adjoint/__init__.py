@@ -4,31 +4,30 @@ Author: Homer Reid <homer@homerreid.com>
 Documentation: https://meep.readthedocs.io/en/latest/Python_Tutorials/AdjointSolver.md
 """
 import sys
+import importlib
 
 import meep as mp
 
 ######################################################################
 ######################################################################
 ######################################################################
-from .util import (init_log, log, warn, get_exception_info)
+from .util import (init_log, log, debug, flush_log, warn, get_exception_info,
+                   array_digest)
 
 from .option_almanac import (OptionTemplate, OptionAlmanac)
 
 from .adjoint_options import get_adjoint_option, set_adjoint_option_defaults
 
-from .dashboard_server import run_dashboard
-
 from .dashboard_client import (launch_dashboard, update_dashboard, close_dashboard)
 
 from .dft_cell import (ORIGIN, XHAT, YHAT, ZHAT, E_CPTS, H_CPTS, EH_CPTS,
                        v3, V3, Subregion, DFTCell, Grid, fix_array_metadata,
-                       make_grid, dft_cell_names, rescale_sources)
-
-from .objective import ObjectiveFunction
+                       make_grid, grid_points, grid_key, dft_cell_names,
+                       rescale_sources)
 
 from .basis import Basis
 
-from .finite_element_basis import FiniteElementBasis
+from .simple_finite_element_basis import SimpleFiniteElementBasis
 
 from .timestepper import TimeStepper
 
@@ -36,15 +35,51 @@ from .visualization_options import (get_visualization_option,
                                     get_visualization_options,
                                     set_visualization_option_defaults)
 
-from .visualization import visualize_sim
-
 from .console_manager import ConsoleManager, termsty
 
+from .design_cache import DesignCache
+
 from .optimization_problem import OptimizationProblem
 
+######################################################################
+# subsystems with heavy dependencies---sympy (objective), dolfin
+# (finite_element_basis), matplotlib (visualization), and PyQt5
+# (dashboard_server)---are imported only on first access to their
+# public names, so that e.g. headless MPI ranks never load them
+######################################################################
+_LAZY_ATTRIBUTES = { 'ObjectiveFunction':  'objective',
+                     'FiniteElementBasis': 'finite_element_basis',
+                     'visualize_sim':      'visualization',
+                     'run_dashboard':      'dashboard_server' }
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        module = importlib.import_module('.' + _LAZY_ATTRIBUTES[name], __name__)
+        globals()[name] = getattr(module, name)
+        return globals()[name]
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES))
+
 ######################################################################
 ######################################################################
 ######################################################################
 def set_option_defaults(custom_defaults={}, search_env=True):
     set_adjoint_option_defaults(custom_defaults, search_env)
     set_visualization_option_defaults(custom_defaults, search_env)
+
+
+# public names for star imports: the eager ones above only, since listing
+# the lazy ones would make a star import load all their subsystems (they
+# remain accessible as attributes of the package)
+__all__ = [ 'init_log', 'log', 'debug', 'flush_log', 'warn', 'get_exception_info', 'array_digest',
+            'OptionTemplate', 'OptionAlmanac', 'get_adjoint_option', 'set_adjoint_option_defaults',
+            'launch_dashboard', 'update_dashboard', 'close_dashboard',
+            'ORIGIN', 'XHAT', 'YHAT', 'ZHAT', 'E_CPTS', 'H_CPTS', 'EH_CPTS',
+            'v3', 'V3', 'Subregion', 'DFTCell', 'Grid', 'fix_array_metadata',
+            'make_grid', 'grid_points', 'grid_key', 'dft_cell_names', 'rescale_sources',
+            'Basis', 'SimpleFiniteElementBasis', 'TimeStepper',
+            'get_visualization_option', 'get_visualization_options', 'set_visualization_option_defaults',
+            'ConsoleManager', 'termsty', 'DesignCache', 'OptimizationProblem',
+            'set_option_defaults' ]
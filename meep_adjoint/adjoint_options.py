@@ -83,14 +83,28 @@ option_categories['Options affecting FDTD geometries/computation'] = [
     OptionTemplate('source_component', 'Ez',   'forward source component (str)'),
     OptionTemplate('source_mode',         1,   'forward source eigenmode index'),
     OptionTemplate('nfreq',               1,   'number of DFT frequencies'),
+    OptionTemplate('broadband',       False,   'evaluate objective function at all nfreq DFT frequencies (not just the first)'),
+    OptionTemplate('freq_aggregate',  'sum',   'rule for combining objective values at multiple frequencies (sum|min|max|weighted)'),
+    OptionTemplate('freq_weights',       '',   'comma-separated per-frequency weights for freq_aggregate=weighted'),
     OptionTemplate('dpml',             -1.0,   'PML width (-1 --> auto-select)'),
     OptionTemplate('dair',             -1.0,   'gap width between material bodies and PMLs (-1 --> auto-select)'),
     OptionTemplate('eps_design',      '1.0',   'function of (x,y,z) giving initial design permittivity'),
     OptionTemplate('dft_reltol',     1.0e-6,   'convergence tolerance for terminating timestepping'),
     OptionTemplate('dft_timeout',      10.0,   'max runtime in units of last_source_time'),
     OptionTemplate('dft_interval',     0.25,   'meep time between DFT convergence checks in units of last_source_time'),
+    OptionTemplate('dft_adaptive',     False,  'adapt interval between convergence checks to the observed rate of convergence'),
+    OptionTemplate('dft_interval_min', 0.05,   'minimum adaptive convergence-check interval in units of last_source_time'),
+    OptionTemplate('dft_interval_max',  1.0,   'maximum adaptive convergence-check interval in units of last_source_time'),
+    OptionTemplate('dft_proxy',       False,   'use a cheap proxy metric for intermediate convergence checks of adjoint runs'),
+    OptionTemplate('dft_proxy_stride',    7,   'subsampling stride of design-grid points for the proxy convergence metric'),
     OptionTemplate('complex_fields',  False,   'use complex fields in forward calculation'),
-    OptionTemplate('reuse_simulation',False,   'reuse (do not reallocate) simulation data structure')
+    OptionTemplate('reuse_simulation',False,   'reuse (do not reallocate) simulation structure and DFT registers across runs (forces complex fields and registers all DFT cells for adjoint runs too)'),
+    OptionTemplate('cache_size',          8,   'number of recently visited designs for which results are memoized'),
+    OptionTemplate('cache_fields',     True,   'memoize forward fields as well as objective values and gradients'),
+    OptionTemplate('cache_memory',   1024.0,   'memory bound (MB) on memoized forward fields'),
+    OptionTemplate('dft_cache_dir',      '',   'directory for disk-backed storage of saved DFT fields (empty --> keep in memory)'),
+    OptionTemplate('dft_cache_hot',       2,   'number of frequencies of disk-backed DFT fields kept resident in RAM'),
+    OptionTemplate('dft_distributed', False,   'in MPI runs, keep only a per-rank slab of saved DFT fields and reduce objective quantities over ranks')
  ]
 
     #--------------------------------------------------
@@ -100,19 +114,26 @@ option_categories['Options affecting basis-set expansions'] = [
     OptionTemplate('beta_min',        0.0,    'lower bound on basis expansion coefficient'),
     OptionTemplate('beta_max',     np.inf,    'upper bound on basis expansion coefficient'),
     OptionTemplate('element_type',   'CG 1',  'finite-element family and degree'),
-    OptionTemplate('element_length',  0.0,    'finite-element discretization length')
+    OptionTemplate('element_length',  0.0,    'finite-element discretization length'),
+    OptionTemplate('tabulate_eps',    False,  'tabulate design permittivity on a half-pixel grid and interpolate (approximate) instead of evaluating the basis pointwise')
 ]
 
     #--------------------------------------------------
-    #- options affecting gradient-descent optimizer
+    #- options affecting optimizers
     #--------------------------------------------------
-option_categories['Options affecting gradient-duhscent optimizer'] = [
-    OptionTemplate('alpha',          1.0,     'initial value of alpha (update relaxation parameter)'),
+option_categories['Options affecting optimizers'] = [
+    OptionTemplate('optimizer',      'lbfgs', "['lbfgs'|'duhscent'] optimizer used by OptimizationProblem.optimize"),
+    OptionTemplate('lbfgs_memory',   10,      'number of step/gradient-change pairs retained by L-BFGS'),
+    OptionTemplate('gtol',           1.0e-6,  'convergence threshold on projected-gradient inf-norm (L-BFGS)'),
+    OptionTemplate('ftol',           1.0e-8,  'convergence threshold on relative change in objective (L-BFGS)'),
+    OptionTemplate('alpha',          1.0,     'initial value of alpha (update relaxation parameter; L-BFGS: length of first step)'),
     OptionTemplate('alpha_min',      1.0e-3,  'minimum value of alpha'),
     OptionTemplate('alpha_max',      10.0,    'maximum value of alpha'),
     OptionTemplate('boldness',       1.25,    'sometimes you just gotta live a little (explain me)'),
     OptionTemplate('timidity',       0.75,    'can\'t be too cautious in this dangerous world (explain me)'),
     OptionTemplate('max_iters',      100,     'max number of optimization iterations'),
+    OptionTemplate('line_search_groups', 1,   'in MPI runs, number of process groups evaluating line-search trial points concurrently'),
+    OptionTemplate('adjoint_workers',    1,   'in serial runs, number of forked processes computing per-quantity adjoint gradients concurrently (not with MPI builds of meep)'),
 ]
 
     #--------------------------------------------------
@@ -121,7 +142,10 @@ option_categories['Options affecting gradient-duhscent optimizer'] = [
 option_categories['Options affecting console/file/GUI output'] = [
     OptionTemplate('filebase',                '',         'base name of output files'),
     OptionTemplate('silence_meep',           True,        'suppress MEEP console messages when timestepping'),
-    OptionTemplate('loglevel',               'info',      "['info'|'debug']"),
+    OptionTemplate('loglevel',               'info',      "['info'|'debug'|'warning'] minimum level of logfile messages"),
+    OptionTemplate('checkpoint_file',        '',          'checkpoint file (empty --> <filebase>.checkpoint.npz)'),
+    OptionTemplate('checkpoint_interval',    0.0,         'minimum wall-clock seconds between automatic checkpoints after forward runs (0 --> none)'),
+    OptionTemplate('resume',                 False,       'restore design, history, and forward fields from checkpoint_file at startup'),
     OptionTemplate('visualization',          'auto',      "['on'|'off'|'auto'] to enable/disable/automate graphical visualization"),
     OptionTemplate('termcolors',              True,       "output colorized terminal text"),
     OptionTemplate('dashboard',              'auto',      "['on'|'off'|'auto'] to enable/disable/automate GUI dashboard"),
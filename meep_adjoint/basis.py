@@ -28,12 +28,24 @@
 
 from numbers import Number
 import sys
-from sympy import lambdify, Symbol
+from math import floor
+from itertools import product
+from functools import lru_cache
 import re
 import numpy as np
+from scipy.sparse import csr_matrix, csc_matrix, diags, identity
+from scipy.sparse.linalg import splu
 import meep as mp
 
-from . import v3, V3, Subregion
+from . import v3, V3, Subregion, grid_points, grid_key
+
+@lru_cache(maxsize=64)
+def compiled_expression(expr):
+    """Function f(x,y,z) evaluating the sympy expression string expr, compiled
+       by lambdify to operate on numpy arrays (cached per string)."""
+    from sympy import lambdify, Symbol   # deferred: sympy is slow to import
+    return lambdify([Symbol(v) for v in 'xyz'], expr, modules='numpy')
+
 
 class GridFunc(object):
     """Given a grid of spatial points {x_n} and a scalar function of a
@@ -41,12 +53,24 @@ class GridFunc(object):
        of several possible forms), return a scalar function of a
        single integer GridFunc(n) defined by GridFunc(n) == f(x_n).
 
+       The values at all points are computed at once, on first use, by
+       GridFunc.values(): expression strings are compiled (once per
+       string) to numpy functions evaluated on the coordinate arrays,
+       and callables are invoked once with the (N,3) array of all points.
+       Callables that cannot handle arrays (detected by an exception, a
+       result of the wrong shape, or a spot check of the result against
+       calls with single rows) are instead invoked once per point, with
+       the coordinates of the point as an array of length 3, or, if that
+       fails too, as an mp.Vector3 (the argument of callables written for
+       pointwise evaluation by meep, which may access p.x, p.y, p.z).
+
     Arguments
     ---------
         f: function-like
-           specification of function f(x)
+           specification of function f(x): array of samples, number,
+           callable, or expression string in the variables x, y, z
 
-        grid: array-like
+        grid: Grid
            grid of points {x_n} for integers n=0,1,...,
 
     Returns
@@ -55,28 +79,214 @@ class GridFunc(object):
     """
 
     def __init__(self,f,grid):
-        self.p=grid.points
-        self.fm=self.fv=self.ff=None
-        if isinstance(f,np.ndarray) and f.shape==grid.shape:
-            self.fm = f.flatten()
-        elif isinstance(f,Number):
-            self.fv = f
-        elif callable(f):
-            self.ff = lambda n: f(self.p[n])
-        elif isinstance(f,str):
-            ffunc=lambdify( [Symbol(v) for v in 'xyz'],f)
-            self.ff = lambda n:ffunc(self.p[n][0],self.p[n][1],self.p[n][2])
+        self.grid, self.vals = grid, None
+        if isinstance(f,np.ndarray) and f.shape==tuple(grid.shape):
+            self.vals = f.flatten()
+        elif isinstance(f,(Number,str)) or callable(f):
+            self.f = f
         else:
             raise ValueError("GridFunc: failed to construct function")
 
+    def values(self):
+        """Flat array of the values f(x_n) at all points of the grid."""
+        if self.vals is None:
+            N, f = len(self.grid), self.f
+            if isinstance(f,Number):
+                vals = f
+            elif isinstance(f,str):
+                vals = compiled_expression(f)(*np.transpose(self.grid.points))
+            else:
+                vals = vectorized_call(f, self.grid.points)
+            self.vals = np.array(np.broadcast_to(vals, (N,)))
+        return self.vals
+
     def __call__(self, n):
-        return self.fm[n] if self.fm is not None else self.fv if self.fv is not None else self.ff(n)
+        return self.values()[n]
+
+
+def vectorized_call(f, points):
+    """Values of the scalar function f at all rows of the (N,3) array points,
+       computed by one call f(points) if f handles arrays, or one call per row if not
+       (passing each row as an mp.Vector3 if f does not accept it as an array)."""
+    try:
+        with np.errstate(all='ignore'):
+            vals = np.asarray(f(points))
+        if vals.shape in [(len(points),), (len(points),1)]:
+            vals = vals.reshape(-1)
+            spot = [ np.ravel(f(points[n:n+1])) for n in (0, len(points)-1) ]
+            if all( s.shape==(1,) for s in spot ) and \
+               np.allclose(vals[[0,-1]], np.concatenate(spot), equal_nan=True):
+                return vals
+    except Exception:
+        pass
+    try:
+        return np.array([f(p) for p in points])
+    except Exception:
+        return np.array([f(V3(p)) for p in points])
+
+
+def grid_samples(g, grid):
+    """Return the values of g at the points of grid, as an array of shape grid.shape
+       (arrays of samples, or stacks of them, are returned as is)."""
+    if isinstance(g, np.ndarray):
+        return g
+    return np.reshape(GridFunc(g, grid).values(), grid.shape)
+
+
+class GridInterpolant(object):
+    """Given a rectangular grid of points and the values of a scalar
+       function f(x) at those points, return a callable that evaluates
+       f(x) at arbitrary points x by piecewise-multilinear interpolation.
+
+       This is used to tabulate a parameterized function in bulk (one
+       sparse matrix-vector product over all grid points) and then
+       service pointwise queries from libmeep by cheap table lookups.
+
+    Arguments
+    ---------
+        grid: Grid
+           rectangular grid of points
+
+        values: array-like, optional
+           function values at grid points, in the ordering of grid_points(grid)
+
+    Returns
+    -------
+        GridInterpolant (callable) satisfying GridInterpolant(p)==f(p)
+        for all grid points p.
+    """
+
+    def __init__(self, grid, values=None):
+        tics          = [np.ravel(t) for t in (grid.xtics, grid.ytics, grid.ztics)]
+        self.axes     = [d for d,t in enumerate(tics) if len(t)>1]
+        self.origin   = [tics[d][0] for d in self.axes]
+        self.delta    = [(tics[d][-1]-tics[d][0])/(len(tics[d])-1) for d in self.axes]
+        self.nmax     = [len(tics[d])-2 for d in self.axes]
+        shape         = [len(t) for t in tics]
+        self.strides  = [int(np.prod(shape[d+1:])) for d in self.axes]
+        self.corners  = list(product([0,1], repeat=len(self.axes)))
+        self.set_values(values)
+
+    def set_values(self, values):
+        self.values = None if values is None else np.ravel(values).tolist()
+
+    def __call__(self, p):
+        p, n0, t = v3(p), 0, []
+        for d, p0, h, nmax, stride in zip(self.axes, self.origin, self.delta, self.nmax, self.strides):
+            s = (p[d]-p0)/h
+            n = min(max(int(floor(s)), 0), nmax)
+            n0 += n*stride
+            t.append(min(max(s-n, 0.0), 1.0))
+        f = 0.0
+        for c in self.corners:
+            w, n = 1.0, n0
+            for cd, td, stride in zip(c, t, self.strides):
+                w *= td if cd else 1.0-td
+                n += cd*stride
+            f += w*self.values[n]
+        return f
+
+
+class GridOperator(object):
+    """Precomputed linear operators connecting a Basis to a Grid.
+
+       Given the sparse (npoints x D) matrix B of basis-function values at
+       the points of a grid, with cubature weights W, a GridOperator
+       offers the two grid-level operations needed by the adjoint solver:
+
+           (1) tabulation: coefficients beta --> samples f_0 + B*beta
+               (used by the forward path to fill the design permittivity)
+
+           (2) projection: samples g --> coefficients (B^T W B)^{-1} B^T W (g-f_0)
+               (used by the adjoint path to project df/deps onto the basis)
+
+       Projection solves with the discrete Gram matrix B^T W B of the grid
+       cubature rather than with the exact (e.g. finite-element) mass matrix.
+       This is the least-squares fit consistent with the cubature used for
+       the right-hand side: it reproduces elements of the space exactly and
+       differs from the exact L2 projection only by the cubature error,
+       O(h) in the grid spacing h. (Solving the exact mass matrix against the
+       same cubature right-hand side is far less accurate on coarse grids.)
+
+       The product B^T W, the sparse Gram matrix B^T W B and its LU
+       factorization are computed on first use and retained, so that
+       each subsequent projection costs one sparse matrix-vector product
+       and one back-substitution.
+
+    Arguments
+    ---------
+        B: sparse matrix (npoints x D)
+           basis-function values at grid points
+
+        weights: array-like (npoints)
+           cubature weights of grid points
+    """
+
+    def __init__(self, B, weights):
+        self.B, self.weights = B.tocsr(), np.ravel(weights)
+        self.BtW, self.gram_matrix, self.gram_lu = None, None, None
+
+    def tabulate(self, beta_vector, offset=0.0):
+        return offset + self.B.dot(beta_vector)
+
+    def gram(self):
+        """sparse (D x D) Gram matrix B^T W B"""
+        if self.BtW is None:
+            self.BtW = (self.B.T @ diags(self.weights)).tocsr()
+        if self.gram_matrix is None:
+            self.gram_matrix = (self.BtW @ self.B).tocsr()
+        return self.gram_matrix
+
+    def inner(self, samples, offset=0.0, points=None):
+        """inner products B^T W (g-f_0) of samples (array of shape grid.shape,
+           or a stack of such arrays with leading batch axis) with the basis
+           functions; the result has shape (D, nbatch) for stacked samples.
+
+           If points (a slice of grid-point indices) is specified, samples
+           covers only those points, and the result is the partial inner
+           product over them (as used for grids distributed over MPI ranks).
+        """
+        self.gram()
+        BtW     = self.BtW if points is None else self.BtW[:,points]
+        npoints = BtW.shape[1]
+        g       = np.reshape(samples, (-1, npoints)) - offset
+        g_dot_b = np.asarray(BtW.dot(g.T))
+        return g_dot_b if np.size(samples) > npoints else g_dot_b[:,0]
+
+    def solve(self, rhs):
+        """coefficients (B^T W B)^{-1} rhs for inner products rhs as returned by inner()"""
+        if self.gram_lu is None:
+            self.gram_lu = factorize(self.gram())
+        coeffs = self.gram_lu.solve(rhs)
+        return coeffs.T if np.ndim(coeffs)>1 else coeffs
+
+    def project(self, samples, offset=0.0):
+        """project samples (array of shape grid.shape, or a stack of
+           such arrays with leading batch axis) onto the basis.
+        """
+        return self.solve(self.inner(samples, offset=offset))
+
+
+def factorize(gram):
+    """Sparse LU factorization of a symmetric positive (semi)definite Gram matrix.
+
+       If the matrix is singular (as happens for basis functions without any
+       cubature points in their support), a tiny diagonal shift is added so
+       that such functions receive zero coefficients instead of breaking the
+       factorization.
+    """
+    gram = csc_matrix(gram)
+    try:
+        return splu(gram)
+    except RuntimeError:
+        shift = 1.0e-12*np.amax(np.abs(gram.diagonal()))
+        return splu((gram + shift*identity(gram.shape[0])).tocsc())
 
 
 ######################################################################
 #invoke python's 'abstract base class' formalism in a version-agnostic way
 ######################################################################
-from abc import ABCMeta, abstractmethod
+from abc import ABCMeta
 ABC = ABCMeta('ABC', (object,), {'__slots__': ()}) # compatible with Python 2 and 3
 
 
@@ -136,16 +346,18 @@ class Basis(ABC):
 
     ** Pure virtual methods and class-method overrides **
 
-    Although the `Basis` parent class is an *abstract* base class, in fact it has only
-    one pure-virtual method: `get_bvector(x),` which returns the full vector of
-    basis-function values at a given point $x\in \Gamma$. For all other methods,
-    including `project`, the `Basis` parent class provides default implementations
-    that access the details of specific bases only via calls to `get_bvector`.
-    Needless to say, these default implementations are not optimized for
-    performance, but their existence makes it easy to experiment with custom-designed
-    function spaces---for quick-and-dirty testing of a new basis, you need only
+    Although the `Basis` parent class is an *abstract* base class, in fact a
+    subclass need only implement one of two methods: `get_bvector(x),` which
+    returns the full vector of basis-function values at a given point
+    $x\in \Gamma$, or its bulk counterpart `get_bmatrix(points)`, which returns
+    the sparse (npoints x dim) matrix of basis-function values at many points at
+    once. Each has a default implementation in terms of the other. For all other
+    methods, including `project`, the `Basis` parent class provides default
+    implementations that access the details of specific bases only via calls to
+    `get_bmatrix`. For quick-and-dirty testing of a new basis, you need only
     implement a subclass with the single overridden routine `get_bvector`, relying
-    on the default implementations of all other methods.
+    on the default implementations of all other methods; overriding `get_bmatrix`
+    with a vectorized implementation instead makes all of them fast.
     Of course, once you have determined that your new basis is useful, you will
     want to implement performance-optimized versions of `project` and other
     routines that exploit the particular structure of your basis for maximum
@@ -170,11 +382,15 @@ class Basis(ABC):
     $$ \int_\Gamma \psi(\mathbf{x})d\mathbf{x} \approx \sum_p w_p \psi(\mathbf{x}_p)$$
     where $\{\mathbf{x}_p, w_p\}$ are the points and weights of a caller-provided
     cubature rule for approximating integrals over $\Gamma.$
+    In terms of the sparse matrix $B_{pn}=b_n(\mathbf{x}_p)$ returned by `get_bmatrix`
+    and the diagonal matrix $W$ of cubature weights, this is
+    $\mathbf{M} = B^T W B$ and $\mathbf{g} = B^T W g(\mathbf{x}_p)$.
     (If $\Gamma$ is a rectangular 2D or 3D subregion of a MEEP geometry,
      the points and weights in the cubature rule are just the data returned by
      `mp.sim.get_array_metadata()`.)
     The evaluation of these numerical cubatures is the task of the base-class
-    helper methods `gram_matrix` and `inner_product`. If your basis
+    helper methods `gram_matrix` (a dense array; its sparse counterpart
+    `sparse_gram_matrix` is the one used internally) and `inner_product`. If your basis
     has special structure that allows efficient calculation of these integrals,
     you may provide
 
@@ -183,11 +399,26 @@ class Basis(ABC):
     furnish efficient overriding implementations of these routines directly
     then you need not bother overriding `gram_matrix` or `inner_product`. For
     an example of such a situation, see the implementation of `FiniteElementBasis.
+
+    **Caching**
+
+    Quantities that are expensive to compute but depend only on the basis and
+    (possibly) a grid---interpolation matrices, Gram matrices and their sparse
+    LU factorizations---are computed on first use and retained in a cache
+    (see `cache` and `factorization`), so that the repeated projections
+    performed by adjoint runs cost only back-substitutions. Subclasses whose
+    discretization may change after construction should override `mesh_key`;
+    the cache is discarded whenever its value changes, or explicitly by
+    `invalidate_cache`.
     """
 
     def __init__(self, dim, region=None, size=None, center=v3(), offset=0.0):
+        if type(self).get_bvector is Basis.get_bvector and type(self).get_bmatrix is Basis.get_bmatrix:
+            raise TypeError("Can't instantiate {} without get_bvector() or get_bmatrix()"
+                            .format(type(self).__name__))
         self.dim, self.offset = dim, offset
         self.region = region if region else Subregion(center=center,size=size)
+        self.grid_cache, self.cache_key = {}, None  # see cache()
 
     @property
     def dimension(self):
@@ -202,20 +433,51 @@ class Basis(ABC):
         return [ 'b{}'.format(n) for n in range(self.dim) ]
 
     ######################################################################
-    # get full vector of basis-function values at a single evaluation point
-    #  (pure virtual method, must be overriden by subclasses)
+    # get full vector of basis-function values at a single evaluation point,
+    # or sparse matrix of basis-function values at many points
+    #  (subclasses must override at least one of these)
     ######################################################################
-    @abstractmethod
     def get_bvector(self, p):
-        raise NotImplementedError("derived class must implement get_bvector()")
+        if type(self).get_bmatrix is Basis.get_bmatrix:
+            raise NotImplementedError("derived class must implement get_bvector() or get_bmatrix()")
+        return self.get_bmatrix(np.reshape(v3(p),(1,3))).toarray()[0]
+
+    def get_bmatrix(self, points):
+        """
+        Return the sparse (npoints x dim) matrix B with B_{pn} = b_n(x_p)
+        for the points x_p in the rows of the (npoints x 3) array points.
+
+        The default implementation calls get_bvector once per point.
+        """
+        if type(self).get_bvector is Basis.get_bvector:
+            raise NotImplementedError("derived class must implement get_bvector() or get_bmatrix()")
+        rows, cols, vals = [], [], []
+        for n, p in enumerate(points):
+            bvec = self.get_bvector(p)
+            nz   = np.flatnonzero(bvec)
+            rows += [n]*len(nz)
+            cols += list(nz)
+            vals += list(bvec[nz])
+        return csr_matrix((vals, (rows, cols)), shape=(len(points), self.dim))
 
     ######################################################################
     # basis expansion coefficients of an arbitrary function g
     ######################################################################
-    def project(self,g,grid=None):
-        rhs = self.inner_product(g,grid=grid)
-        gm  = self.gram_matrix(grid=grid)
-        return np.linalg.solve(gm,rhs)
+    def project(self,g,grid=None,differential=False):
+        """
+        Compute expansion coefficients of the projection of g onto the basis.
+
+        g may be an array of samples at the points of grid, or any other
+        function specification accepted by GridFunc. The projection is
+        computed by the cached GridOperator for grid. The differential
+        flag has the same meaning as in FiniteElementBasis.project: if True,
+        g describes an update to an existing function and the constant
+        offset is not subtracted before projecting.
+        """
+        if grid is None:
+            raise ValueError('Basis.project: projection grid must be specified')
+        offset = 0.0 if differential else self.offset
+        return self.grid_operator(grid).project(grid_samples(g, grid), offset=offset)
 
     # ... and the function defined by those coefficients
     def projection(self,g,grid=None):
@@ -225,7 +487,7 @@ class Basis(ABC):
     ######################################################################
     ######################################################################
     ######################################################################
-    def parameterized_function(self, beta_vector):
+    def parameterized_function(self, beta_vector, grid=None):
         """
         Construct and return a callable, updatable element of the function space.
 
@@ -236,39 +498,128 @@ class Basis(ABC):
             func(p) = f_0 + \sum_n beta_n * b_n(p)
         2. func has a set_coefficients method for updating the expansion coefficients
             func.set_coefficients(new_beta_vector)
+
+        If grid is specified, func is additionally tabulated at all points
+        of grid by a single sparse matrix-vector product whenever its
+        coefficients are set, and func(p) is evaluated by interpolating
+        in this table instead of summing basis functions at p.
+        The tabulated values are available as func.values.
         """
 
         class _ParameterizedFunction(object):
-            def __init__(self, basis, beta_vector):
-                (self.f0, self.b, self.beta) = (basis.offset, basis.get_bvector, beta_vector)
+            def __init__(self, basis, beta_vector, grid):
+                (self.f0, self.b) = (basis.offset, basis.get_bvector)
+                self.op = basis.grid_operator(grid) if grid is not None else None
+                self.table = GridInterpolant(grid) if grid is not None else None
+                self.set_coefficients(beta_vector)
             def set_coefficients(self, beta_vector):
                 self.beta = beta_vector
+                if self.op is not None:
+                    self.values = self.op.tabulate(beta_vector, offset=self.f0)
+                    self.table.set_values(self.values)
             def __call__(self, p):
+                if self.table is not None:
+                    return self.table(p)
                 return self.f0 + np.dot( self.beta, self.b(p) )
             def func(self):
                 def _f(p):
                     return self(p)
                 return _f
 
-        return _ParameterizedFunction(self, beta_vector)
+        return _ParameterizedFunction(self, beta_vector, grid)
+
+
+    ######################################################################
+    # cached data
+    ######################################################################
+    def mesh_key(self):
+        """
+        Hashable description of the discretization (e.g. mesh and element type)
+        on which cached data depend. The default (None) means the basis
+        never changes after construction.
+        """
+        return None
+
+
+    def cache(self):
+        """
+        Return the dict of cached data for the current discretization,
+        first emptying it if mesh_key() has changed since the last call.
+        Grid-dependent entries are keyed on grid_key(grid).
+        """
+        key = self.mesh_key()
+        if key != self.cache_key:
+            self.grid_cache, self.cache_key = {}, key
+        return self.grid_cache
+
+
+    def invalidate_cache(self):
+        """
+        Discard all cached data, e.g. after the discretization has been
+        modified in a way that mesh_key() does not detect.
+        """
+        self.grid_cache = {}
+
+
+    def factorization(self, name, matrix):
+        """
+        Return the cached sparse LU factorization (see factorize) of a
+        matrix that depends only on the discretization, identified by name
+        and computed if necessary by calling matrix().
+        """
+        cache, key = self.cache(), ('factorization', name)
+        if key not in cache:
+            cache[key] = factorize(matrix())
+        return cache[key]
+
+
+    ######################################################################
+    # sparse matrix of basis-function values at all points of a grid
+    ######################################################################
+    def interpolation_matrix(self, grid):
+        """
+        Return the sparse (npoints x dim) matrix B with B_{pn} = b_n(x_p)
+        for all points x_p in grid (ordered as in grid_points(grid)).
+        The matrix is computed on the first call for a given grid and cached.
+        """
+        cache, key = self.cache(), ('interpolation_matrix', grid_key(grid))
+        if key not in cache:
+            cache[key] = csr_matrix(self.get_bmatrix(grid_points(grid)))
+        return cache[key]
+
+
+    def grid_operator(self, grid):
+        """
+        Return the GridOperator connecting this basis to grid, shared by the
+        forward (tabulation) and adjoint (projection) paths. Constructed on
+        the first call for a given grid and cached.
+        """
+        cache, key = self.cache(), ('grid_operator', grid_key(grid))
+        if key not in cache:
+            cache[key] = GridOperator(self.interpolation_matrix(grid), grid.weights)
+        return cache[key]
 
 
     #######################################################################
     # inner products of basis functions with an arbitrary function g
     ######################################################################
     def inner_product(self, g, grid=None):
+        """vector of inner products <b_n | g-f_0>, computed as B^T W (g-f_0)"""
         if grid is None:
             raise ValueError('Basis.inner_product: integration grid must be specified')
-        gn, g_dot_b = GridFunc(g, grid), 0.0*gn(0)*np.zeros(self.dim)
-        for n, (p,w) in enumerate(zip(grid.points,grid.weights)):
-            g_dot_b += w * ( gn(n)-self.offset ) * self.get_bvector(p)
-        return g_dot_b
+        return self.grid_operator(grid).inner(grid_samples(g, grid), offset=self.offset)
 
 
     ##########################################################
     # basis_function overlap matrix, gm_{ij} = <b_i | b_j>.
     ##########################################################
     def gram_matrix(self,grid=None):
-        def bxb(p):
-            return np.outer(self.get_bvector(p),self.get_bvector(p))
-        return np.sum([w*bxb(p) for p,w in zip(grid.points,grid.weights)], axis=0)
+        """Gram matrix as a dense (D x D) numpy array (see sparse_gram_matrix)"""
+        return self.sparse_gram_matrix(grid=grid).toarray()
+
+    def sparse_gram_matrix(self,grid=None):
+        """Gram matrix as a scipy.sparse matrix, computed as B^T W B; subclasses
+           with special structure override this rather than gram_matrix"""
+        if grid is None:
+            raise ValueError('Basis.gram_matrix: integration grid must be specified')
+        return self.grid_operator(grid).gram()
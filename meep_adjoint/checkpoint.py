@@ -0,0 +1,88 @@
+"""Checkpoint files for restarting interrupted optimizations.
+
+   A checkpoint is a single .npz archive holding a nested dict of arrays,
+   strings and numbers (the design vector, optimizer state, objective
+   history, and saved forward DFT fields), with nested keys joined by
+   '/'. Files are written to a temporary file in the same directory, flushed to disk,
+   and then atomically renamed over the target, so that an interruption
+   at any point leaves either the previous or the new checkpoint intact.
+"""
+import os
+import tempfile
+
+import numpy as np
+import meep as mp
+
+from .distributed import is_distributed
+from .parallel import am_root
+
+SEP = '/'
+
+
+def flatten(state, prefix=''):
+    """Flatten nested dicts into a single dict {path: array}; None values are omitted."""
+    flat = {}
+    for k, v in state.items():
+        if isinstance(v, dict):
+            flat.update(flatten(v, prefix + str(k) + SEP))
+        elif v is not None:
+            flat[prefix + str(k)] = to_array(v)
+    return flat
+
+
+def unflatten(flat):
+    """Inverse of flatten (0-dimensional arrays are converted back to scalars)."""
+    state = {}
+    for path, value in flat.items():
+        keys, d = path.split(SEP), state
+        for k in keys[:-1]:
+            d = d.setdefault(k, {})
+        d[keys[-1]] = value.item() if value.ndim==0 else value
+    return state
+
+
+def to_array(v):
+    """Convert a value (number, string, array, or array-like such as a FieldStore) to an ndarray."""
+    if isinstance(v, np.ndarray) or np.isscalar(v):
+        return np.asarray(v)
+    if hasattr(v, '__len__') and hasattr(v, '__getitem__'):   # e.g. disk-backed FieldStore
+        return np.stack([ np.asarray(v[n]) for n in range(len(v)) ])
+    return np.asarray(v)
+
+
+def checkpoint_filename(filename):
+    """Per-rank file name for distributed DFT data, otherwise filename itself."""
+    if not is_distributed():
+        return filename
+    base, ext = os.path.splitext(filename)
+    return '{}.rank{}{}'.format(base, mp.my_rank(), ext)
+
+
+def write_checkpoint(filename, state):
+    """Atomically write the nested dict state to filename (on one process
+       only, unless DFT data are distributed, in which case each rank
+       writes its own file)."""
+    if not (is_distributed() or am_root()):
+        return
+    filename  = checkpoint_filename(filename)
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, tmp   = tempfile.mkstemp(prefix='.checkpoint_', suffix='.npz', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **flatten(state))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, filename)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def read_checkpoint(filename):
+    """Return the state stored in filename, or None if there is no such file."""
+    filename = checkpoint_filename(filename)
+    if not os.path.isfile(filename):
+        return None
+    with np.load(filename, allow_pickle=False) as data:
+        return unflatten({ k: data[k] for k in data.files })
@@ -56,7 +56,7 @@ class ConsoleManager(object):
                 matches  = [ re.search(p,line) for p in [r'time=([.\d]*)', r'([.\d]*) s/step'] ]
                 meep_time, meep_rate = [ float(m[1]) if m else None for m in matches ]
                 if meep_time is not None and meep_rate is not None:
-                    log('parsed meep output: time={}, secs per timestep ={}'.format(meep_time,meep_rate))
+                    log('parsed meep output: time={}, secs per timestep ={}', meep_time, meep_rate)
                     update_dashboard('progress',int(meep_time))
                     update_dashboard('ms_per_timestep',1.0e3*meep_rate)
 
@@ -20,7 +20,6 @@ import meep as mp
 
 from . import log, warn, get_exception_info
 from . import get_adjoint_option as adj_opt
-from . import run_dashboard
 
 
 """module-global variables describing dashboard connection status"""
@@ -46,6 +45,7 @@ def launch_dashboard(name=None):
     # if port==0, try to launch GUI dashboard as a multiprocessing.Process()
     if port==0:
         try:
+            from .dashboard_server import run_dashboard
             dashboard_socket, sock2 = socket.socketpair()
             dashboard_process = multiprocessing.Process(target=run_dashboard, args=(sock2,))
             dashboard_process.start()
@@ -0,0 +1,90 @@
+"""Memoization of objective-function values, gradients, and forward fields.
+
+   Optimizers routinely request the objective function and its gradient
+   at the same design point more than once (line searches, optimizers
+   that ask for values and gradients through separate callbacks, etc.).
+   DesignCache remembers the results of recent calculations, keyed on
+   a digest of the design vector, so that repeated requests can be
+   served without timestepping.
+"""
+from collections import OrderedDict
+
+import numpy as np
+
+from . import log, array_digest
+
+
+class DesignCache(object):
+    """Least-recently-used cache of results of calculations for design vectors.
+
+    Each entry is a dict with (some of) the following items:
+
+        'fq':     np.array of objective-function and objective-quantity values
+        'gradf':  np.array of objective-function gradient components
+        'fields': snapshot of forward DFT fields, as returned by
+                  OptimizationProblem.get_forward_fields(), from which
+                  an adjoint run may be launched without a new forward run
+
+    Parameters
+    ----------
+    max_entries : int
+        Maximum number of design vectors to remember.
+
+    max_bytes : float
+        Bound on the total memory occupied by cached field snapshots.
+        When exceeded, the field snapshots of the least-recently-used
+        entries are discarded first (their values and gradients are retained).
+    """
+    def __init__(self, max_entries=8, max_bytes=np.inf):
+        self.max_entries, self.max_bytes = max_entries, max_bytes
+        self.entries = OrderedDict()
+
+
+    @staticmethod
+    def key(beta_vector):
+        """Cache key for a design vector."""
+        return array_digest(beta_vector)
+
+
+    def lookup(self, key):
+        """Return the entry for key (marking it as most recently used), or None."""
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        return entry
+
+
+    def store(self, key, **items):
+        """Add items (fq, gradf, fields) to the entry for key, creating it if necessary."""
+        if self.max_entries <= 0:
+            return
+        entry = self.entries.setdefault(key, {})
+        entry.update( { k:v for k,v in items.items() if v is not None } )
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        for old_key, old_entry in self.entries.items():
+            if self.field_bytes() <= self.max_bytes:
+                break
+            if old_entry.pop('fields', None) is not None:
+                log('design cache: evicted forward fields for design {}', old_key[:8])
+
+
+    def field_bytes(self):
+        """Total memory occupied by cached field snapshots."""
+        return sum( snapshot_bytes(e['fields']) for e in self.entries.values() if 'fields' in e )
+
+
+    def clear(self):
+        self.entries.clear()
+
+
+def snapshot_bytes(x):
+    """Memory occupied by the numpy arrays in a nested structure of lists, tuples, and dicts."""
+    if isinstance(x, np.ndarray):
+        return x.nbytes
+    if isinstance(x, dict):
+        x = list(x.values())
+    if isinstance(x, (list, tuple)):
+        return sum(snapshot_bytes(y) for y in x)
+    return 0
@@ -11,12 +11,17 @@
    to describe sets of frequency-domain field components.
 """
 
+import os
+import tempfile
 import numpy as np
 import meep as mp
 import warnings
-from collections import namedtuple
+from collections import OrderedDict
 
 from . import get_adjoint_option as adj_opt
+from . import array_digest
+from .distributed import local_range, allreduce
+from .distributed import gather as gather_slabs
 
 ######################################################################
 # general-purpose constants and utility routines
@@ -61,7 +66,45 @@ def fix_array_metadata(xyzw, center, size):
 ######################################################################
 # 'Grid' is a convenience extension of 'array metadata'
 ######################################################################
-Grid = namedtuple('Grid', ['xtics', 'ytics', 'ztics', 'points', 'weights', 'shape'])
+class Grid(object):
+    """Set of points at which a function is sampled, with cubature weights.
+
+    Usually a rectangular grid, described by the 1D arrays of its tics in
+    each direction, with points ordered as in np.flatten() applied to
+    arrays of shape grid.shape (x index slowest, z index fastest). The
+    coordinates of all points are materialized only if the points
+    attribute is accessed, and then as a single (N,3) float64 array.
+    Scattered points (e.g. cubature nodes) are described by tics=None
+    and an explicit (N,3) array of points.
+
+    Attributes
+    ----------
+    xtics, ytics, ztics: 1D np.arrays of coordinates (None for scattered points)
+    weights:             1D np.array of length N of cubature weights
+    shape:               list of the dimensions of sample arrays on the grid
+    points:              (N,3) np.array of point coordinates (read-only)
+    """
+    def __init__(self, xtics, ytics, ztics, points=None, weights=None, shape=None):
+        self.xtics, self.ytics, self.ztics = \
+            [ None if t is None else np.ravel(np.asarray(t, dtype=float)) for t in (xtics, ytics, ztics) ]
+        self.weights = np.asarray(weights).reshape(-1)
+        self.shape   = list(shape)
+        self._points = None if points is None else np.asarray(points, dtype=float).reshape(-1,3)
+
+    @property
+    def points(self):
+        if self._points is None:
+            tics = (self.xtics, self.ytics, self.ztics)
+            self._points = np.stack(np.meshgrid(*tics, indexing='ij'), axis=-1).reshape(-1,3)
+            self._points.flags.writeable = False
+        return self._points
+
+    def __len__(self):
+        return len(self.weights)
+
+    def __repr__(self):
+        return 'Grid(shape={}, npoints={})'.format(self.shape, len(self))
+
 
 def make_grid(size, center=np.zeros(3), dims=None, length=None):
     """Construct a Grid for a rectangular subregion.
@@ -92,18 +135,36 @@ def make_grid(size, center=np.zeros(3), dims=None, length=None):
     tics = [np.linspace(a, b, n) for (a, b, n) in zip(pmin, pmax, dims)]
     if len(tics)==2:
         tics.append([0])
-    points = [np.array([x, y, z]) for x in tics[0] for y in tics[1] for z in tics[2] ]
     vol, ntot = np.prod([s for s in size if s>0]), np.prod(dims)
-    weights = (vol/ntot) * np.ones(ntot)
+    weights = np.broadcast_to(vol/ntot, (ntot,))     # uniform: one value shared by all points
     shape = [len(t) for t in tics if len(t)>1]
-    return Grid(tics[0], tics[1], tics[2], points, weights, shape)
+    return Grid(tics[0], tics[1], tics[2], weights=weights, shape=shape)
+
+
+def grid_points(grid):
+    """Return an (N,3) array of the coordinates of all points in grid.
+
+    Points are ordered as in grid.points (x index slowest, z index fastest),
+    which is also the ordering of np.flatten() applied to arrays of shape grid.shape.
+    """
+    return grid.points
+
+
+def grid_key(grid):
+    """Return a hashable summary of the extents and resolution of grid (for keying caches).
+
+    Scattered grids, which have no tics, are keyed on digests of their
+    points and cubature weights.
+    """
+    if any(t is None for t in (grid.xtics, grid.ytics, grid.ztics)):
+        return ('scattered', array_digest(grid.points), array_digest(grid.weights))
+    return tuple( (len(t), float(t[0]), float(t[-1])) for t in
+                  [np.ravel(t) for t in (grid.xtics, grid.ytics, grid.ztics)] )
 
 
 def xyzw2grid(xyzw):
-    """Construct Grid from lists of points and weights."""
-    return Grid(xyzw[0], xyzw[1], xyzw[2],
-                [mp.Vector3(x,y,z) for x in xyzw[0] for y in xyzw[1] for z in xyzw[2]],
-                 xyzw[3].flatten(), xyzw[3].shape)
+    """Construct Grid from array metadata (tics and weights)."""
+    return Grid(xyzw[0], xyzw[1], xyzw[2], weights=xyzw[3], shape=np.shape(xyzw[3]))
 
 
 class Subregion(object):
@@ -181,8 +242,18 @@ class DFTCell(object):
        to save an internally cached snapshot of the fields computed on a
        given timestepping run.
 
-       Note: for now, all arrays are stored in memory. For large calculations with
-       many DFT frequencies it might make sense to implement a disk-caching scheme.
+       By default, all arrays are stored in memory. For large calculations with
+       many DFT frequencies, setting the 'dft_cache_dir' option moves saved
+       fields and eigenmode slices to memory-mapped files in that directory
+       (see FieldStore), with only recently accessed frequencies kept in RAM.
+
+       In parallel runs with the 'dft_distributed' option set, each rank keeps
+       only its own slab of the grid (a range of indices along the leading grid
+       axis; see distributed.py) in saved fields and eigenmode slices, objective
+       quantities are computed from partial sums over the local slab added up
+       over ranks, and full arrays are assembled only on request (see gather).
+       Unless otherwise noted, the arrays returned by the methods below are
+       then of shape local_shape rather than grid.shape.
 
        The internally-stored frequency-domain fields at a single frequency
        may be fetched via the get_EH_slice (single component) or
@@ -228,6 +299,10 @@ class DFTCell(object):
 
         self.EH_cache   = {}    # cache of frequency-domain field data computed in previous simulations
         self.eigencache = {}    # cache of eigenmode field data to avoid redundant recalculations
+        self.grid_vecs  = None  # grid points as low-level meep::vecs, for eigenmode sampling
+        self.slab       = None  # range of leading-axis grid indices stored on this rank
+        self.local_shape= None  # shape of the local portion of the grid
+        self.cache_dir  = adj_opt('dft_cache_dir') or None  # directory for disk-backed caches
 
         global dft_cell_names
         if region.name is not None:
@@ -268,10 +343,46 @@ class DFTCell(object):
             xyzw=sim.get_array_metadata(center=V3(self.region.center), size=V3(self.region.size), collapse=True, snap=True)
             fix_array_metadata(xyzw, self.region.center, self.region.size)
             self.grid = xyzw2grid(xyzw)
+            start, stop      = local_range(self.grid.shape[0])
+            self.slab        = slice(start, stop)
+            self.local_shape = (stop-start,) + tuple(self.grid.shape[1:])
 
     ######################################################################
+    # local (per-rank) portions of grid arrays
     ######################################################################
-    def get_EH_slice(self, c, nf=0):
+    def local(self, a):
+        """Local slab of an array whose trailing axes span the grid."""
+        return a[ (Ellipsis, self.slab) + (slice(None),)*(len(self.grid.shape)-1) ]
+
+    def local_weights(self):
+        """Cubature weights of the local grid points, as array of shape local_shape."""
+        return self.local(np.reshape(self.grid.weights, self.grid.shape))
+
+    def local_points(self):
+        """Range of indices of the local grid points in the ordering of grid_points()."""
+        stride = int(np.prod(self.grid.shape[1:]))
+        return slice(self.slab.start*stride, self.slab.stop*stride)
+
+    def gather(self, a, root=0):
+        """Assemble the full array from the local slabs a of all ranks.
+
+        The full array is returned on rank root (None on other ranks),
+        or on all ranks if root is None. Must be called on all ranks.
+        """
+        return gather_slabs(a, axis=np.ndim(a)-len(self.grid.shape), root=root)
+
+    def zero_dfts(self):
+        """Reset the DFT registers of the cell to zero without unregistering it.
+
+        This allows the cell to be reused for a new timestepping run in the
+        same simulation (see `TimeStepper.recycle_simulation`).
+        """
+        dft = getattr(self.dft_obj, 'swigobj', self.dft_obj)
+        dft.scale_dfts(0.0)
+
+    ######################################################################
+    ######################################################################
+    def get_EH_slice(self, c, nf=0, full=False):
         """Fetch array of frequency-domain amplitudes for a single field component.
 
         Compute an array of frequency-domain field amplitudes, i.e. a
@@ -290,6 +401,9 @@ class DFTCell(object):
             Field component to fetch.
         nf : int, optional
             Frequency index, by default 0
+        full : bool, optional
+            If True, return the array over the full grid even if the
+            cell is distributed, by default False
 
         Returns
         -------
@@ -297,10 +411,12 @@ class DFTCell(object):
             Complex-valued array giving field amplitude at grid points.
         """
         EH = self.sim.get_dft_array(self.dft_obj, c, nf)
-        return EH if np.ndim(EH)>0 else 0.0j*np.zeros(self.grid.shape)
+        if np.ndim(EH)==0:
+            EH = 0.0j*np.zeros(self.grid.shape)
+        return EH if full else self.local(EH)
 
 
-    def get_EH_slices(self, label=None, nf=0):
+    def get_EH_slices(self, label=None, nf=0, full=False):
         """Fetch arrays of frequency-domain field amplitudes for all stored components.
 
         Return a 1D array (list) of arrays of frequency-domain field amplitudes,
@@ -315,37 +431,60 @@ class DFTCell(object):
         ----------
         label : [str], optional
             Label of saved data to retrieve.
-        nf : int, optional
-            Frequency index, by default 0
+        nf : int or None, optional
+            Frequency index, by default 0. If None, data for all
+            frequencies are returned in a single array.
+        full : bool, optional
+            If True, return arrays over the full grid even if the cell is
+            distributed, by default False. (For saved data this involves
+            communication and must be done on all ranks.)
 
         Returns
         -------
-        list of np.array
-            Arrays of field-component amplitudes at grid points
+        list of np.array, or np.array
+            Arrays of field-component amplitudes at grid points. If nf is None,
+            a single array of shape (nfreq, ncomponents, *grid.shape).
 
         Raises
         ------
         ValueError
             if no data exists for the specified label.
         """
+        if label is not None and full and label in self.EH_cache:
+            return self.gather(self.get_EH_slices(label=label, nf=nf), root=None)
+        if nf is None:
+            if isinstance(self.EH_cache.get(label), np.ndarray):
+                return self.EH_cache[label]
+            return np.stack([ self.get_EH_slices(label=label, nf=n, full=full) for n in range(len(self.freqs)) ])
         if label is None:
-            return [ self.get_EH_slice(c, nf=nf) for c in self.components ]
+            return [ self.get_EH_slice(c, nf=nf, full=full) for c in self.components ]
         elif label in self.EH_cache:
-            return self.EH_cache[label][nf]
+            return self.EH_cache[label][nf]   # (ncomponents, *local_shape) array view
         raise ValueError("DFTCell {} has no saved data for label '{}'".format(self.name, label))
 
 
+    def get_material_slice(self, c, nf=0):
+        """Fetch array of permittivity (c=mp.Dielectric) or permeability (c=mp.Permeability)
+           at grid points, at frequency nf or (nf=None) stacked for all frequencies."""
+        if nf is None:
+            return np.stack([ self.get_material_slice(c, nf=n) for n in range(len(self.freqs)) ])
+        return self.local(self.sim.get_dft_array(self.dft_obj, c, nf))
+
+
     def subtract_incident_fields(self, EHT, nf=0):
         """Substract incident from total fields to yield scattered fields.
 
         Parameters
         ----------
-        EHT : list of arrays of field component amplitudes, as
+        EHT : list or array of arrays of field component amplitudes, as
               returned by get_EH_slices, for the **total** fields
-        nf : int, optional
-             frequency index, by default 0
+        nf : int or None, optional
+             frequency index (None for all frequencies), by default 0
         """
         EHI = self.get_EH_slices(label='incident', nf=nf)
+        if nf is None:
+            EHT -= EHI
+            return
         for nc, c in enumerate(self.components):
             EHT[nc] -= EHI[nc]
 
@@ -365,8 +504,18 @@ class DFTCell(object):
         ----------
         label : str
             Label assigned to data set, used subsequently for retrieval.
+
+        The data are stored as a single array of shape (nfreq, ncomponents, *local_shape),
+        in memory or (if the 'dft_cache_dir' option is set) in a disk-backed FieldStore.
         """
-        self.EH_cache[label] = [self.get_EH_slices(nf=nf) for nf in range(len(self.freqs))]
+        shape = (len(self.freqs), len(self.components)) + tuple(self.local_shape)
+        if self.cache_dir:
+            EH = FieldStore(shape, directory=self.cache_dir, hot_size=adj_opt('dft_cache_hot'))
+        else:
+            EH = np.zeros(shape, dtype=complex)
+        for nf in range(len(self.freqs)):
+            EH[nf] = self.get_EH_slices(nf=nf)
+        self.EH_cache[label] = EH
 
 
     def get_eigenmode_slices(self, mode, nf=0):
@@ -381,31 +530,36 @@ class DFTCell(object):
         ----------
         mode : int
             Eigenmode index.
-        nf : int, optional
-            Frequency index, by default 0
+        nf : int or None, optional
+            Frequency index, by default 0; None for all frequencies
 
         Returns
         ----------
-        list of np.arrays (same format as returned by get_EH_slices)
+        np.array of shape (len(components), *grid.shape); indexing
+        the leading axis yields arrays in the same format as returned by get_EH_slices.
+        If nf is None, an array of shape (nfreq, len(components), *grid.shape).
         """
+        if nf is None:
+            return np.stack([ self.get_eigenmode_slices(mode, nf=n) for n in range(len(self.freqs)) ])
 
         # look for data in cache
         tag='M{}.F{}'.format(mode,nf)
         if self.eigencache and tag in self.eigencache:
             return self.eigencache[tag]
 
-        # data not in cache; compute eigenmode and populate slice arrays
+        # data not in cache; compute eigenmode and tabulate all components at all grid points
         freq, dir, k0 = self.freqs[nf], self.normal, mp.Vector3()
         vol = mp.Volume(V3(self.region.center),V3(self.region.size))
         eigenmode = self.sim.get_eigenmode(freq, dir, vol, mode, k0)
-
-        def get_eigenslice(eigenmode, grid, c):
-            return np.reshape( [eigenmode.amplitude(p,c) for p in grid.points], grid.shape )
-
-        eh_slices=[get_eigenslice(eigenmode,self.grid,c) for c in self.components]
+        if self.grid_vecs is None:
+            self.grid_vecs = [mp.vec(*p) for p in grid_points(self.grid)[self.local_points()]]
+        eh_slices = sample_eigenmode(eigenmode, self.grid_vecs, self.components, self.local_shape)
 
         # store in cache before returning
         if self.eigencache is not None:
+            if self.cache_dir:
+                eh_slices, data = disk_array(eh_slices.shape, self.cache_dir), eh_slices
+                eh_slices[...] = data
             self.eigencache[tag]=eh_slices
 
         return eh_slices
@@ -423,42 +577,155 @@ class DFTCell(object):
             Objective quantity code.
         mode : int, optional
             Eigenmode index, by default 0
-        nf : int, optional
-            Frequency index, by default 0
+        nf : int or None, optional
+            Frequency index, by default 0. If None, the quantity is
+            computed at all frequencies at once.
 
         Returns
         -------
-        float64 or complex128
-            value of objective quantity
+        float64 or complex128, or np.array
+            value of objective quantity, or array of its values at all
+            frequencies if nf is None
         """
-        w  = np.reshape(self.grid.weights,self.grid.shape)
-        EH = self.get_EH_slices(nf=nf)
+        # with nf==None, all field arrays carry a leading frequency axis;
+        # in either case, sums run over the trailing (grid) axes only,
+        # and (for distributed cells) over the local slab of the grid,
+        # with the partial sums then added up over ranks
+        w     = self.local_weights()
+        gaxes = tuple(range(-len(self.grid.shape), 0))
+        EH    = self.get_EH_slices(nf=nf)
         quantity=qcode.upper()
         if qcode.islower():
+             EH = np.array(EH)
              self.subtract_incident_fields(EH,nf)
+        if nf is None:
+             EH = np.moveaxis(EH, 1, 0)   # component axis first
         if quantity=='S':
-            return np.real(np.sum(w*( np.conj(EH[0])*EH[3] - np.conj(EH[1])*EH[2]) ))
+            return allreduce( np.real(np.sum(w*( np.conj(EH[0])*EH[3] - np.conj(EH[1])*EH[2]), axis=gaxes )) )
         if quantity.upper() in 'PFMB':
             eh = self.get_eigenmode_slices(mode, nf)  # EHList of eigenmode fields
-            eH = np.sum( w*(np.conj(eh[0])*EH[3] - np.conj(eh[1])*EH[2]) )
-            hE = np.sum( w*(np.conj(eh[3])*EH[0] - np.conj(eh[2])*EH[1]) )
+            if nf is None:
+                eh = np.moveaxis(eh, 1, 0)
+            eH = np.sum( w*(np.conj(eh[0])*EH[3] - np.conj(eh[1])*EH[2]), axis=gaxes )
+            hE = np.sum( w*(np.conj(eh[3])*EH[0] - np.conj(eh[2])*EH[1]), axis=gaxes )
             sign=1.0 if qcode in ['P','F'] else -1.0
-            return (eH + sign*hE)/4.0
+            return allreduce( (eH + sign*hE)/4.0 )
         if quantity in ['UE', 'UH', 'UM', 'UEH', 'UEM', 'UT']:
            q=0.0
            if quantity in ['UE', 'UEH', 'UEM', 'UT']:
-               eps = self.sim.get_dft_array(self.dft_obj, mp.Dielectric, nf)
+               eps = self.get_material_slice(mp.Dielectric, nf)
                E2  = np.sum( [np.conj(EH[nc])*EH[nc] for nc,c in enumerate(self.components) if c in E_CPTS], axis=0 )
-               q  += 0.5*np.sum(w*eps*E2)
+               q  += 0.5*np.sum(w*eps*E2, axis=gaxes)
            if quantity in ['UH', 'UM', 'UEH', 'UEM', 'UT']:
-               mu  = self.sim.get_dft_array(self.dft_obj, mp.Permeability, nf)
+               mu  = self.get_material_slice(mp.Permeability, nf)
                H2  = np.sum( [np.conj(EH[nc])*EH[nc] for nc,c in enumerate(self.components) if c in H_CPTS], axis=0 )
-               q  += 0.5*np.sum(w*mu*H2)
-           return q
+               q  += 0.5*np.sum(w*mu*H2, axis=gaxes)
+           return allreduce(q)
         else: # TODO: support other types of objectives quantities?
             ValueError('DFTCell {}: unsupported quantity type {}'.format(self.name,qcode))
 
 
+######################################################################
+# disk-backed storage for cached field data
+######################################################################
+def disk_array(shape, directory=None):
+    """Allocate a complex array backed by a memory-mapped .npy file.
+
+       The file is created in directory and unlinked immediately (on
+       platforms that allow it), so that its storage is reclaimed
+       automatically when the array is garbage-collected.
+    """
+    fd, filename = tempfile.mkstemp(suffix='.npy', prefix='dftcell_', dir=directory)
+    os.close(fd)
+    data = np.lib.format.open_memmap(filename, mode='w+', dtype=complex, shape=shape)
+    try:
+        os.remove(filename)
+    except OSError:
+        pass
+    return data
+
+
+class FieldStore(object):
+    """Disk-backed stack of frequency-domain field arrays.
+
+       A FieldStore is a drop-in replacement for an in-memory array of shape
+       (nfreq, ncomponents, *grid.shape), as stored by DFTCell.save_fields().
+       The data for all frequencies are written to a single preallocated
+       memory-mapped file, and store[nf] returns the data for frequency nf.
+       The hot_size most recently accessed frequencies are kept resident
+       in RAM; if hot_size is 0, store[nf] returns a zero-copy view of the
+       memory-mapped file.
+
+       Parameters
+       ----------
+       shape : tuple
+           (nfreq, ncomponents, *grid.shape)
+       directory : str, optional
+           directory in which to create the backing file
+       hot_size : int, optional
+           number of frequencies to keep resident in RAM
+    """
+    def __init__(self, shape, directory=None, hot_size=2):
+        self.data     = disk_array(shape, directory)
+        self.hot      = OrderedDict()
+        self.hot_size = hot_size
+
+    def __len__(self):
+        return len(self.data)
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    def __setitem__(self, nf, EH):
+        self.data[nf] = EH
+        self.hot.pop(nf, None)
+
+    def __getitem__(self, nf):
+        if nf in self.hot:
+            self.hot.move_to_end(nf)
+            return self.hot[nf]
+        if self.hot_size <= 0:
+            return self.data[nf]
+        self.hot[nf] = np.array(self.data[nf])
+        while len(self.hot) > self.hot_size:
+            self.hot.popitem(last=False)
+        return self.hot[nf]
+
+
+######################################################################
+######################################################################
+######################################################################
+def sample_eigenmode(eigenmode, vecs, components, shape):
+    """Tabulate field components of an eigenmode at a set of points.
+
+       pymeep's EigenmodeData.amplitude() converts its point argument to a
+       new meep::vec on every call. Here the caller supplies the meep::vecs
+       (constructed once per grid and reused for all modes, frequencies, and
+       components) and we hand them with the raw eigenmode data directly to
+       the low-level evaluator, filling one contiguous row per component.
+
+       This is still one evaluator call per point and component: pymeep
+       exposes no array-valued (bulk) eigenmode evaluator, so the savings
+       are only the per-call point conversions and list reshaping. The
+       results are identical to EigenmodeData.amplitude() point by point.
+
+       Args:
+           eigenmode: EigenmodeData returned by mp.Simulation.get_eigenmode
+           vecs: list of mp.vec, the evaluation points
+           components: list of field components
+           shape: shape of grid over which the points are laid out
+
+       Returns:
+           complex np.array of shape (len(components), *shape)
+    """
+    amplitude, data = mp.eigenmode_amplitude, eigenmode.swigobj
+    EH = np.empty( (len(components), len(vecs)), dtype=complex)
+    for nc, c in enumerate(components):
+        EH[nc] = [amplitude(data, v, c) for v in vecs]
+    return np.reshape(EH, [len(components)] + list(shape))
+
+
 ######################################################################
 ######################################################################
 ######################################################################
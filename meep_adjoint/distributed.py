@@ -0,0 +1,59 @@
+"""Helpers for distributing DFT data over MPI ranks.
+
+    With the 'dft_distributed' option set in a parallel (MPI) run, each
+    DFTCell keeps only a slab of its grid---a contiguous range of indices
+    along the leading grid axis, assigned to the ranks in turn---and
+    objective quantities and gradient projections are computed as partial
+    sums over the local slab, followed by a sum over ranks. Full arrays are
+    assembled only on request (see DFTCell.gather).
+
+    The mpi4py module is required only in this mode, and is imported on
+    first use.
+"""
+import numpy as np
+import meep as mp
+
+from . import get_adjoint_option as adj_opt
+
+
+def communicator():
+    """MPI communicator over all ranks, or None in serial runs."""
+    if mp.count_processors() <= 1:
+        return None
+    try:
+        from mpi4py import MPI
+    except ImportError:
+        raise ImportError("option 'dft_distributed' requires the mpi4py module")
+    return MPI.COMM_WORLD
+
+
+def is_distributed():
+    """True if DFT data are to be distributed over ranks."""
+    return bool(adj_opt('dft_distributed')) and mp.count_processors() > 1
+
+
+def local_range(n):
+    """(start, stop) of this rank's share of n indices."""
+    if not is_distributed():
+        return 0, n
+    comm = communicator()
+    rank, size = comm.Get_rank(), comm.Get_size()
+    return (rank*n)//size, ((rank+1)*n)//size
+
+
+def allreduce(x):
+    """Sum of x (number or array) over all ranks."""
+    return communicator().allreduce(x) if is_distributed() else x
+
+
+def gather(x, axis=0, root=0):
+    """Concatenate the arrays x of all ranks along axis.
+
+    The result is returned on rank root only (None elsewhere), or on
+    all ranks if root is None. Must be called on all ranks.
+    """
+    if not is_distributed():
+        return x
+    comm  = communicator()
+    parts = comm.allgather(x) if root is None else comm.gather(x, root=root)
+    return None if parts is None else np.concatenate(parts, axis=axis)
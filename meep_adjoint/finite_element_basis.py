@@ -4,8 +4,10 @@
 import sys
 import re
 from numbers import Number
+from functools import lru_cache
 
 import numpy as np
+from scipy.sparse import csr_matrix
 
 import meep as mp
 
@@ -107,6 +109,8 @@ class FiniteElementBasis(Basis):
 
         family, degree = element_type.split()[0:2]
         self.fs  = df.FunctionSpace(mesh,family,int(degree))
+        self.fs_key = (mesh.hash(), str(self.fs.ufl_element()))   # see mesh_key
+        self.pmin, self.pmax = [ op(mesh.coordinates(),0) for op in [np.amin, np.amax] ]
         super().__init__(self.fs.dim(), size=size, center=center, offset=offset )
 
 
@@ -116,6 +120,14 @@ class FiniteElementBasis(Basis):
         in FENICS to compute the coefficients {g^p_0, g^p_1, ..., } in the expansion
         g^p(x) == {offset} + \sum_n g^p_n b_n(x).
 
+        If g is an array of samples on grid (as for the df/deps arrays
+        projected on every convergence check of an adjoint run), the
+        projection is done by the cached GridOperator for grid (see
+        Basis.grid_operator), bypassing mesh construction and FEM assembly.
+        Otherwise only the right-hand side is assembled by FENICS; the
+        mass matrix is assembled and factorized once and cached (see
+        Basis.factorization) until the mesh or element type changes.
+
         Parameters:
             g, grid: function specification as in make_dolfin_callable
             differential: True if g(x) describes a *differential* quantity,
@@ -129,12 +141,15 @@ class FiniteElementBasis(Basis):
         Return value:
             Projection coefficients as numpy array of dimension self.dim
         """
+        if isinstance(g, np.ndarray) and grid is not None:
+            return super().project(g, grid=grid, differential=differential)
         ofs = 0.0 if differential else -1.0*self.offset
         g = make_dolfin_callable(g, grid=grid, fs=self.fs, offset=ofs)
-        return df.project(g, self.fs).vector().vec().array
+        rhs = df.assemble( g*df.TestFunction(self.fs)*dx ).get_local()
+        return self.factorization('mass_matrix', self.sparse_gram_matrix).solve(rhs)
 
 
-    def parameterized_function(self, beta_vector):
+    def parameterized_function(self, beta_vector, grid=None):
         """
         Construct and return a callable, updatable element of the function space.
 
@@ -142,6 +157,13 @@ class FiniteElementBasis(Basis):
             beta_vector (numpy array of dimension self.dim, datatype float):
                initial expansion coefficients
 
+            grid (Grid, optional):
+               If specified, the function is tabulated in bulk at the points
+               of grid via the cached sparse interpolation matrix, and pointwise
+               evaluations interpolate in this table instead of calling into
+               dolfin (see Basis.parameterized_function). This is much faster
+               when the function is handed to libmeep as an epsilon_func.
+
         Returns:
              The return value is an instance of a class that provides (at minimum)
              two methods:
@@ -159,6 +181,9 @@ class FiniteElementBasis(Basis):
                    of adding a class method 'func' that returns a standalone callable
                    interface to __call__() that mp.Simulation accepts as an epsilon_func.
         """
+        if grid is not None:
+            return super().parameterized_function(beta_vector, grid=grid)
+
         class _ParameterizedFunction(object):
             def __init__(self, basis, beta_vector):
                 (self.offset, self.f) = (basis.offset, df.Function(basis.fs))
@@ -176,6 +201,24 @@ class FiniteElementBasis(Basis):
         return _ParameterizedFunction(self, beta_vector)
 
 
+    def get_bmatrix(self, points):
+        """
+        Sparse matrix of basis-function values at many points, computed
+        by locating each point in the mesh once and storing only the
+        values of the basis functions supported on the containing cell.
+        (Basis.interpolation_matrix caches the result per grid, so repeated
+        updates of a parameterized function tabulated on the same grid
+        cost one sparse matrix-vector product.)
+        """
+        rows, cols, vals = [], [], []
+        for n, p in enumerate(points):
+            indices, values = self.get_local_bvector(p)
+            rows += [n]*len(indices)
+            cols += list(indices)
+            vals += list(values)
+        return csr_matrix((vals, (rows, cols)), shape=(len(points), self.dim))
+
+
     ############################################################
     # the self-contained implementations above suffice to handle
     # everything needed for mp.adjoint, so the remaining
@@ -184,25 +227,42 @@ class FiniteElementBasis(Basis):
     # implementations just for reference.
     ############################################################
     def get_bvector(self, p):
-        # get mesh cell containing p
+        indices, values = self.get_local_bvector(p)
+        bvec = np.zeros(self.dim)
+        bvec[indices]=values
+        return bvec
+
+
+    def get_local_bvector(self, p):
+        """global indices and values at p of the basis functions supported on the mesh cell containing p"""
+        # get mesh cell containing p (points on or just outside the
+        # boundary due to roundoff are snapped into the mesh bounding box)
         p, fs       = v3(p), self.fs
+        p[0:len(self.pmin)] = np.clip(p[0:len(self.pmin)], self.pmin, self.pmax)
         dm, el, msh = fs.dofmap(), fs.element(), fs.mesh()
         cidx        = msh.bounding_box_tree().compute_first_entity_collision(df.Point(p))
         cell        = df.Cell(msh,cidx)
         cdofs, cdir = cell.get_vertex_coordinates(), cell.orientation()
 
         # get global indices and values (at p) of this cell's basis functions
-        indices, values = dm.cell_dofs(cidx), el.evaluate_basis_all(p,cdofs,cdir)
+        return dm.cell_dofs(cidx), el.evaluate_basis_all(p,cdofs,cdir)
 
-        bvec = np.zeros(self.dim)
-        bvec[indices]=values
-        return bvec
+
+    def mesh_key(self):
+        """mesh hash and element type, computed once when the function space is
+           set up (hashing the mesh costs O(mesh size)); code that modifies the
+           mesh in place must call invalidate_cache()"""
+        return self.fs_key
 
 
-    # optimized dolfin/FENICS assembly of Gram matrix
-    def gram_matrix(self,grid=None):
-        u,v = df.TrialFunction(self.fs), df.TestFunction(self.fs)
-        return df.assemble(u*v*dx).array()
+    # optimized dolfin/FENICS assembly of (sparse) Gram matrix, cached per mesh and
+    # element (unlike the other methods here, this one is used by project)
+    def sparse_gram_matrix(self,grid=None):
+        cache = self.cache()
+        if 'mass_matrix' not in cache:
+            u,v = df.TrialFunction(self.fs), df.TestFunction(self.fs)
+            cache['mass_matrix'] = dolfin_to_scipy(df.assemble(u*v*dx))
+        return cache['mass_matrix']
 
 
     # optimized dolfin/FENICS assembly of inner-product vector
@@ -216,6 +276,15 @@ class FiniteElementBasis(Basis):
 # the next few routines/classes are general-purpose FENICS helper
 # functions used by class methods in FiniteElementBasis
 #----------------------------------------------------------------------
+def dolfin_to_scipy(A):
+    """Convert an assembled dolfin matrix to a scipy.sparse CSR matrix."""
+    try:
+        indptr, indices, data = df.as_backend_type(A).mat().getValuesCSR()
+        return csr_matrix((data, indices, indptr), shape=(A.size(0), A.size(1)))
+    except (AttributeError, RuntimeError):  # non-PETSc linear-algebra backend
+        return csr_matrix(A.array())
+
+
 def make_dolfin_callable(g, grid=None, fs=None, offset=0.0):
     """
     given a basis of expansion functions (or a 'function space' in FENICS
@@ -295,103 +364,53 @@ def FunctionFromSamples(g_samples, grid, offset=0.0):
     Inputs:  g_samples (np.array): 2D or 3D array of function samples
              grid (Grid):          grid of Points at which function was sampled
     Returns: Callable dolfin function of 2D or 3D coordinate array p
+
+    The mesh, function space, and map from degrees of freedom to samples
+    depend only on the grid and are cached (see sample_space), so each
+    call costs a single fancy-indexed assignment into the dolfin vector.
+    (Arrays of samples projected by adjoint runs do not come through here
+    but go to the GridOperator; this is used by inner_product.)
     """
     n, nd      = np.shape(g_samples), len(np.shape(g_samples))
     x, y, z    = grid.xtics, grid.ytics, grid.ztics
     vmin, vmax = [x[0], y[0], z[0]], [x[-1], y[-1], z[-1]]
-    pmin, pmax = df.Point(vmin[0:nd]), df.Point(vmax[0:nd])
-    if nd==2:
-        mesh = df.RectangleMesh(pmin, pmax, n[0], n[1])
-    else:
-        mesh = df.BoxMesh(pmin, pmax, n[0], n[1], n[2])
-    grid_space = df.FunctionSpace(mesh,'Lagrange',1)
+    delta      = [ t[1]-t[0] if len(t)>1 else 1.0 for t in [x,y,z] ]
+    grid_space, dof_samples = sample_space(tuple(n), tuple(vmin[0:nd]), tuple(vmax[0:nd]), tuple(delta[0:nd]))
     g = df.Function(grid_space)
-    v = g.vector()
-    delta=[ t[2]-t[1] if len(t)>1 else 1.0 for t in [x,y,z] ]
-    for i,p in enumerate(grid_space.tabulate_dof_coordinates()):
-        n = [ int(round((p[d]-pmin[d])/delta[d])) for d in range(nd) ]
-        v[i] = g_samples[tuple(n)] + offset
+    g.vector().set_local(np.ravel(g_samples)[dof_samples] + offset)
+    g.vector().apply('insert')
     g.set_allow_extrapolation(True)
     return g
 
-#----------------------------------------------------------------------
-#----------------------------------------------------------------------
-# end of FiniteElementBasis class
-#----------------------------------------------------------------------
-#----------------------------------------------------------------------
+
+@lru_cache(maxsize=8)
+def sample_space(n, vmin, vmax, delta):
+    """
+    Function space on a mesh over the box [vmin, vmax] with n[d] cells in
+    direction d, together with the (flat) index into an array of samples
+    of shape n, taken at tics spaced by delta starting at vmin, of the
+    sample nearest to each degree of freedom.
+    """
+    pmin, pmax = df.Point(list(vmin)), df.Point(list(vmax))
+    if len(n)==2:
+        mesh = df.RectangleMesh(pmin, pmax, n[0], n[1])
+    else:
+        mesh = df.BoxMesh(pmin, pmax, n[0], n[1], n[2])
+    grid_space  = df.FunctionSpace(mesh,'Lagrange',1)
+    coords      = np.reshape(grid_space.tabulate_dof_coordinates(), (-1, len(n)))
+    return grid_space, nearest_samples(coords, n, vmin, delta)
 
 
+def nearest_samples(coords, n, vmin, delta):
+    """flat indices into an array of samples of shape n, taken at tics
+       spaced by delta starting at vmin, of the samples nearest to the
+       points in the rows of coords"""
+    indices = np.rint( (coords - np.array(vmin))/np.array(delta) ).astype(int)
+    return np.ravel_multi_index(indices.T, n)
+
 #----------------------------------------------------------------------
 #----------------------------------------------------------------------
-# This is a poor man's version of FiniteElementBasis that enables 2D
-# adjoint modeling when the dolfin / FENICS module is not available.
-# Equivalent to FiniteElementBasis for element_type='Lagrange' and
-# element_order=1.
-#
-# How it works: The sides of an (lx x ly) rectangle are subdivided into
-# num_elements[0] x num_elements[1] segments (or into segments of
-# length element_size). To each node in the resulting (NX+1)*(NY+1)
-# grid of nodes we assign a single basis function. The basis function
-# associated with node #n is only supported on those triangles
-# having node #n as a vertex; it takes the value 1 at node #n and
-# falls linearly to zero at the neighboring nodes. Indexing: The
-# node with grid coordinates (nx,ny) (0 \le ni \le N_i) is assigned '
-# index nx*(NY+1) + ny, following the conventional MEEP scheme for grid indexing.
+# end of FiniteElementBasis class
 #----------------------------------------------------------------------
 #----------------------------------------------------------------------
-#
-# class SimpleFiniteElementBasis(Basis):
-#
-#     def __init__(self, size=np.zeros(3), center=np.zeros(3),
-#                        dims=None, element_length=0.25, offset=1.0):
-#         if len(size)>2 and size[2]>0.0:
-#             mp.abort('SimpleFiniteElementBasis not implemented for 3D problems')
-#         self.center = center
-#         self.size   = [size[0], size[1]]
-#         self.dims   = dims if dims is not None else [int(np.ceil(s/element_length)) for s in self.size]
-#         self.delta  = [s/(1.0*dim) for s,dim in zip(self.size,self.dims)]
-#         super().__init__( (self.dims[0]+1)*(self.dims[1]+1), offset=offset )
-#
-#     def in_grid(self, n, ofs=[0,0]):
-#         return np.all([nn+oo in range(0,dim+1) for(nn,oo,dim) in zip(n,ofs,self.dims)])
-#
-#     # scalar index of basis function associated with node n + optional offset
-#     def bindex(self, n, ofs=[0,0]):
-#         return -1 if not self.in_grid(n,ofs) else (n[0]+ofs[0])*(self.dims[1]+1) + (n[1]+ofs[1])
-#
-#     ##############################################################
-#     # on input, p[0,1] are the x,y coordinates of an evaluation
-#     # point in the grid. The return value is a list of
-#     # (bindex,bvalue) pairs giving the index and value of all
-#     # basis functions supported at p.
-#     ##############################################################
-#     def contributors(self, p):
-#         p            = p - self.center
-#         pshift       = [ pp + 0.5*ll for pp,ll in zip(p,self.size) ]
-#         node         = [ int(np.floor(pp/dd)) for pp,dd in zip(pshift,self.delta) ]
-#         xi           = [ (pp-nn*dd)/(1.0*dd) for (pp,nn,dd) in zip(pshift,node,self.delta) ]
-#         xisum, lower = xi[0]+xi[1], xi[0] <= (1.0-xi[1])
-#         indices      = [self.bindex(node,ofs) for ofs in [(1,0), (0,1), (0,0) if lower else (1,1)]]
-#         vals         = [xi[0], xi[1], 1.0-xisum] if lower else [1.0-xi[1],1.0-xi[0],xisum-1.0]
-#         return [ (i,v) for i,v in zip(indices,vals) if i!= -1 ]
-#
-#     def get_bvector(self, p):
-#         bvec = np.zeros(self.dim)
-#         for idx, val in self.contributors(p):
-#             bvec[idx]=val
-#         return bvec
-#
-#     def gram_matrix(self, grid=None):
-#         diag,off_diag=np.array([1.0/2.0,1.0/12.0]) * (self.delta[0]*self.delta[1])
-#         gm = diag*np.identity(self.dim)
-#         offsets=[(dx,dy) for dx in [-1,0,1] for dy in [-1,0,1] if dx!=dy ]
-#         for (i,n) in enumerate([(nx,ny) for nx in range(0,self.dims[0]+1) for ny in range(0,self.dims[1]+1)]):
-#             for j in [ self.bindex(n,ofs) for ofs in offsets if self.in_grid(n,ofs) ]:
-#                 gm[i,j]=gm[j,i]=(diag if i==j else off_diag)
-#         return gm
-#
-#     def inner_product(self,g,grid=None):
-#         if grid is None:
-#             grid=make_grid(self.size,center=self.center,dims=self.dims)
-#         return super().inner_product(g,grid=grid)
-#
+# (see simple_finite_element_basis.py for a dolfin-free alternative)
@@ -1,30 +1,35 @@
 """Bare-bones gradient-descent optimizer.
 """
 import os
-from os.path import isfile
 import numpy as np
-from numpy import clip, amax
 
+from .line_search import line_search as interpolating_line_search
 
-_DEFAULTS = { 'alpha_min': 1.0e-3,
+
+_DEFAULTS = {    'alpha0': 1.0,
+              'alpha_min': 1.0e-3,
               'alpha_max': 10.0,
                    'xmin': 0.0,
                    'xmax': None,
                'timidity': 0.75,
                'boldness': 1.25,
                    'hook': None,
+                  'state': None,
+            'line_search': None,
               'max_iters': 100,
                'stopfile': 'gradient_duhscent.stopfile'
             }
 
 
-def line_search(f_func, x0, f0, alpha, dir, options={}):
+def line_search(f_func, x0, f0, alpha, dir, options={}, df0=None):
     """one-dimensional line search
 
     Given the coordinates of a D-dimensional point x0 and a D-dimensional
     vector dir, we attempt to find a value of the (scalar) quantity alpha
     such that f(x0 + alpha*dir) > f(x0). We return as soon as we find such
-    a point.
+    a point. After an unsuccessful trial, alpha is reduced to the maximizer
+    of an interpolant of the function values and the directional derivative
+    already known (see line_search.py), but by at least the factor timidity.
 
     Parameters
     ----------
@@ -46,7 +51,13 @@ def line_search(f_func, x0, f0, alpha, dir, options={}):
         (not assumed to be normalized to 1 or anything else)
 
     options: dict
-        optional overrides of default option values.
+        optional overrides of default option values. The 'line_search'
+        option may be set to an alternative line-search engine with the
+        interface of line_search.line_search (see parallel.py).
+
+    df0: array-like, optional
+        gradient of f at x0 (default: dir, i.e. dir is taken to be
+        the gradient, as in gradient_duhscent)
 
 
     Returns
@@ -70,28 +81,18 @@ def line_search(f_func, x0, f0, alpha, dir, options={}):
 
     """
     opts = { k:options.get(k,v) for k,v in _DEFAULTS.items() }
-    for iters in range(1, 1 + opts['max_iters']):
-
-        # move a distance alpha along the line from x0
-        x = clip(x0 + alpha*dir, opts['xmin'], opts['xmax'])
-        f = f_func(x)
-        if opts['hook']:
-            opts['hook']('minor',x,f,alpha,iters)
-
-        # assess termination criteria
-        result =      'success' if f>f0                         \
-                 else 'alpha'   if alpha <= opts['min_alpha']   \
-                 else 'iters'   if iters == opts['max_iters']   \
-                 else 'user'    if isfile(opts['stopfile'])     \
-                 else None
-        if result:
-            # if the line search terminated on the first iteration,
-            # alpha was perhaps too small, so pump it up for next time
-            alpha = (alpha*opts['boldness'] if iters==1 else alpha)
-            return x, f, alpha, result
+    ls_opts = { 'xmin': opts['xmin'], 'xmax': opts['xmax'], 'c1': 0.0,
+                'alpha_min': opts['alpha_min'], 'max_trials': opts['max_iters'],
+                'shrink_max': opts['timidity'], 'hook': opts['hook'],
+                'stopfile': opts['stopfile'] }
+    engine = opts['line_search'] or interpolating_line_search
+    x, f, alpha, result, trials = \
+     engine(f_func, x0, f0, dir if df0 is None else df0, dir, alpha, ls_opts)
 
-        # alpha was too big; reduce for next iteration
-        alpha = amax(alpha*opts['timidity'], opts['min_alpha'])
+    # if the line search terminated on the first iteration,
+    # alpha was perhaps too small, so pump it up for next time
+    alpha = (min(alpha*opts['boldness'], opts['alpha_max']) if trials==1 else alpha)
+    return x, f, alpha, result
 
 
 ######################################################################
@@ -113,7 +114,11 @@ def gradient_duhscent(f_func, df_func, x0, options={}):
     x0: array-like, dimension D
         initial point
 
-    options: optional dict of overrides of default option values
+    options: optional dict of overrides of default option values.
+        In addition to the line-search options, 'state' may be set to
+        a dict of optimizer state {'x', 'alpha', 'iters'} recorded by
+        the 'hook' callback (which is invoked with event 'major' after
+        each iteration) to resume an interrupted optimization.
 
     Returns
     -------
@@ -127,10 +132,16 @@ def gradient_duhscent(f_func, df_func, x0, options={}):
                              'iters':       we executed the maximum allowed number of iterations
     """
     opts = { k:options.get(k, v) for k,v in _DEFAULTS.items() }
-    x, alpha = x0, opts['alpha0']
-    for iters in range(0, opts['max_iters']):
-        f, df = f_func(x), df_func(x)
+    state    = opts['state'] or {}
+    x, alpha = state.get('x', x0), state.get('alpha', opts['alpha0'])
+    f        = state['f'] if 'f' in state else f_func(x)
+    for iters in range(state.get('iters', 0), opts['max_iters']):
+        # f is already known at x (from the line search of the previous
+        # iteration), so only the gradient needs to be computed here
+        df = df_func(x)
         x, f, alpha, status = line_search(f_func, x, f, alpha, df, options=options)
-        if status is not 'success':
+        if opts['hook']:
+            opts['hook']('major', x, f, alpha, iters+1)
+        if status != 'success':
             break
     return x, f, df
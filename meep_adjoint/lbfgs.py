@@ -0,0 +1,165 @@
+"""Limited-memory quasi-Newton (L-BFGS) optimizer with box constraints.
+"""
+from os.path import isfile
+import numpy as np
+
+from .line_search import line_search
+
+
+_DEFAULTS = {    'memory': 10,
+                  'step0': 1.0,
+                   'xmin': None,
+                   'xmax': None,
+                   'gtol': 1.0e-6,
+                   'ftol': 1.0e-8,
+                     'c1': 1.0e-4,
+             'max_trials': 20,
+              'max_iters': 100,
+                   'hook': None,
+                  'state': None,
+            'line_search': None,
+               'stopfile': 'lbfgs.stopfile'
+            }
+
+
+def project(x, xmin, xmax):
+    """Clip x to the box [xmin, xmax] (either bound may be None)."""
+    return x if (xmin is None and xmax is None) else np.clip(x, xmin, xmax)
+
+
+def projected_gradient(x, g, xmin, xmax):
+    """Gradient (of a function to be maximized) with the components that would
+       push x through an active bound set to zero."""
+    pg = np.array(g, dtype=float)
+    if xmin is not None:
+        pg[ (x<=xmin) & (g<0.0) ] = 0.0
+    if xmax is not None:
+        pg[ (x>=xmax) & (g>0.0) ] = 0.0
+    return pg
+
+
+def two_loop(g, S, Y):
+    """Product H*g of the L-BFGS inverse-Hessian approximation defined by the
+       step and gradient-change histories S, Y (rows, oldest first) with g."""
+    q, a = np.array(g, dtype=float), []
+    rho  = [ 1.0/np.dot(s,y) for s,y in zip(S,Y) ]
+    for s, y, r in reversed(list(zip(S, Y, rho))):
+        a.append(r*np.dot(s,q))
+        q -= a[-1]*y
+    if len(S):
+        q *= np.dot(S[-1],Y[-1]) / np.dot(Y[-1],Y[-1])
+    for (s, y, r), ai in zip(zip(S, Y, rho), reversed(a)):
+        q += s*(ai - r*np.dot(y,q))
+    return q
+
+
+def lbfgs(fdf_func, x0, options={}):
+    """bound-constrained L-BFGS optimizer (maximizes the objective function)
+
+    Each iteration computes a quasi-Newton ascent direction from the
+    limited-memory history of steps and gradient changes, restricted to the
+    variables not held at a bound, and backtracks along the projection of
+    that direction onto the box [xmin, xmax], with interpolated step
+    lengths (see line_search.py), until the Armijo condition is met.
+    Trial points are evaluated without gradients; the gradient is
+    requested only at the accepted point, so each iteration costs one
+    forward run per trial plus a single adjoint run.
+
+    Parameters
+    ----------
+    fdf_func: callable
+        function fdf_func(x, need_gradient) returning the 2-tuple (f(x), df(x)),
+        with df=None if need_gradient is False. For OptimizationProblem,
+        see OptimizationProblem.optimize.
+
+    x0: array-like, dimension D
+        initial point
+
+    options: optional dict of overrides of default option values
+        memory:     number of (step, gradient-change) pairs retained
+        step0:      length (inf-norm) of the first step along the gradient
+        xmin, xmax: scalar or array bounds on x (None for unbounded)
+        gtol:       convergence threshold on the inf-norm of the projected gradient
+        ftol:       convergence threshold on the relative change in f
+        c1:         Armijo sufficient-increase parameter
+        max_trials: maximum number of trial points per line search
+        max_iters:  maximum number of iterations
+        hook:       callable invoked as hook('major', state) after each
+                    iteration, where state is a dict of the optimizer state
+                    (x, f, df, S, Y, iters, nfev) from which the optimization
+                    may be resumed by passing it back as the 'state' option
+        state:      optimizer state recorded by hook, to resume an interrupted
+                    optimization with the same curvature model
+        line_search: alternative line-search engine with the interface of
+                    line_search.line_search (see parallel.py)
+
+    Returns
+    -------
+    4-tuple (x*, f*, df*, result), where
+        x* (array-like):   coordinates of optimum point
+        f* (scalar float): objective-function value at optimum
+       df* (array-like):   objective-function gradient at optimum
+       result (str):       reason why the iteration terminated:
+                             'gtol', 'ftol':  converged
+                             'line_search':   no acceptable point found along the search direction
+                             'iters':         maximum number of iterations executed
+                             'user':          the stopfile was found
+    """
+    opts       = { k:options.get(k, v) for k,v in _DEFAULTS.items() }
+    xmin, xmax = opts['xmin'], opts['xmax']
+    state      = dict(opts['state'] or {})
+    if 'df' in state:
+        x, f, g = np.array(state['x'], dtype=float), state['f'], np.array(state['df'], dtype=float)
+    else:
+        x    = project(np.array(x0, dtype=float), xmin, xmax)
+        f, g = fdf_func(x, True)
+    D      = len(x)
+    S      = [ s for s in np.reshape(state.get('S', []), (-1, D)) ]
+    Y      = [ y for y in np.reshape(state.get('Y', []), (-1, D)) ]
+    nfev   = state.get('nfev', 1)
+    result = 'iters'
+    for iters in range(state.get('iters', 0), opts['max_iters']):
+
+        pg = projected_gradient(x, g, xmin, xmax)
+        if np.amax(np.abs(pg)) <= opts['gtol']:
+            result = 'gtol'
+            break
+        if isfile(opts['stopfile']):
+            result = 'user'
+            break
+
+        # quasi-Newton ascent direction on the free variables (falling
+        # back to the gradient if the curvature model is not usable)
+        free = (pg!=0.0)
+        d    = np.zeros(D)
+        d[free] = two_loop(g[free], [s[free] for s in S], [y[free] for y in Y])
+        if not S or np.dot(d, pg) <= 0.0:
+            S, Y = [], []
+            d    = pg * (opts['step0']/np.amax(np.abs(pg)))
+
+        # backtracking line search along the projected path, with trial
+        # step lengths interpolated from the values already computed
+        ls_opts = { 'xmin': xmin, 'xmax': xmax, 'c1': opts['c1'],
+                    'max_trials': opts['max_trials'] }
+        engine  = opts['line_search'] or line_search
+        xt, ft, _, status, trials = engine(lambda z: fdf_func(z, False)[0],
+                                           x, f, g, d, 1.0, ls_opts)
+        nfev += trials
+        if status != 'success':
+            result = 'line_search'
+            break
+
+        _, gt = fdf_func(xt, True)
+        s, y  = xt - x, g - gt          # y is the gradient change of -f
+        if np.dot(s, y) > 1.0e-10*np.dot(y, y):
+            S, Y = (S + [s])[-opts['memory']:], (Y + [y])[-opts['memory']:]
+        fold, x, f, g = f, xt, ft, gt
+
+        if opts['hook']:
+            opts['hook']('major', { 'x': x, 'f': f, 'df': g, 'S': np.array(S).reshape(-1, D),
+                                    'Y': np.array(Y).reshape(-1, D), 'iters': iters+1, 'nfev': nfev })
+        if abs(f-fold) <= opts['ftol']*max(abs(f), abs(fold), 1.0):
+            result = 'ftol'
+            break
+
+    return x, f, g, result
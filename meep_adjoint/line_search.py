@@ -0,0 +1,146 @@
+"""Backtracking line search with quadratic/cubic interpolation of the step length.
+"""
+from os.path import isfile
+import numpy as np
+
+
+_DEFAULTS = {       'xmin': None,
+                    'xmax': None,
+                      'c1': 1.0e-4,
+               'alpha_min': 0.0,
+              'max_trials': 20,
+              'shrink_min': 0.1,
+              'shrink_max': 0.5,
+                    'hook': None,
+                'stopfile': None
+            }
+
+
+def interpolate_step(f0, slope, trials):
+    """Step length maximizing the interpolant of the line function phi(a).
+
+    Parameters
+    ----------
+    f0, slope: float
+        phi(0) and phi'(0) (slope > 0 for an ascent direction)
+
+    trials: list of (a, phi(a)) tuples
+        points at which phi has been evaluated, most recent last; the
+        quadratic interpolant of phi(0), phi'(0), phi(a) is used after
+        the first trial, the cubic through the two most recent trials
+        thereafter
+
+    Returns
+    -------
+    maximizer of the interpolant, or None if it has no usable maximum
+    """
+    a1, f1 = trials[-1]
+    r1     = f1 - f0 - slope*a1
+    if len(trials) >= 2:
+        a0, f0_ = trials[-2]
+        r0      = f0_ - f0 - slope*a0
+        try:
+            b, c = np.linalg.solve( [[a0**2, a0**3], [a1**2, a1**3]], [r0, r1] )
+        except np.linalg.LinAlgError:
+            b, c = 0.0, 0.0
+        if b*b - 3.0*c*slope >= 0.0:
+            # critical points (-b +- sqrt(b^2-3c*slope))/(3c), written in a form
+            # that does not cancel as c --> 0 (e.g. for a quadratic phi)
+            denoms = [ b + sgn*np.sqrt(b*b - 3.0*c*slope) for sgn in (1.0, -1.0) ]
+            roots  = [ -slope/d for d in denoms if d != 0.0 ]
+            roots  = [ a for a in roots if a > 0.0 and 2.0*b + 6.0*c*a < 0.0 ]
+            if roots:
+                return min(roots)
+    return -slope*a1*a1/(2.0*r1) if r1 < 0.0 else None
+
+
+def line_search(f_func, x0, f0, df0, dir, alpha, options={}):
+    """one-dimensional line search for an increase of f along dir
+
+    Starting from step length alpha, trial points x = x0 + alpha*dir
+    (projected onto the box [xmin, xmax]) are evaluated until one satisfies
+    the sufficient-increase (Armijo) condition
+
+        f(x) > f0 + c1 * df0.(x - x0).
+
+    After each failed trial, the next alpha is the maximizer of a quadratic
+    (after the first trial) or cubic (thereafter) interpolant of the values
+    and the directional derivative df0.dir already known, safeguarded to
+    the interval [shrink_min, shrink_max]*alpha. Only function values are
+    computed at trial points; in particular, for OptimizationProblem each
+    trial costs one forward run, and the forward fields of the accepted
+    point are retained for the subsequent adjoint run.
+
+    Parameters
+    ----------
+    f_func: callable
+        function that inputs x (a D-dimensional array of coordinates)
+        and returns a real-valued scalar f(x)
+
+    x0: array-like
+        coordinates of starting point
+
+    f0: float
+        function value at starting point, f(x0)
+
+    df0: array-like
+        gradient of f at x0
+
+    dir: array-like
+        search direction (need not be normalized)
+
+    alpha: float
+        initial step length
+
+    options: dict
+        optional overrides of default option values:
+            xmin, xmax:   scalar or array bounds on x (None for unbounded)
+            c1:           sufficient-increase parameter (0 for any increase)
+            alpha_min:    smallest step length tried
+            max_trials:   maximum number of trial points
+            shrink_min,
+            shrink_max:   safeguards on the ratio of successive step lengths
+            hook:         callable invoked as hook('minor', x, f, alpha, trial)
+                          after each trial
+            stopfile:     name of file whose existence aborts the search
+
+    Returns
+    -------
+    a five-tuple (x, f, alpha, result, trials), where
+        x (array-like): final point
+        f (float)     : f(x)
+        alpha (float) : step length of the final point
+        result (str)  : 'success' if x satisfies the sufficient-increase condition,
+                        otherwise the reason for premature termination:
+                           'alpha':   alpha shrunk to its minimum allowed value
+                           'iters':   maximum number of trials reached
+                           'user':    the stopfile was found
+        trials (int)  : number of function evaluations
+    """
+    opts     = { k:options.get(k,v) for k,v in _DEFAULTS.items() }
+    x0, dir  = np.asarray(x0, dtype=float), np.asarray(dir, dtype=float)
+    slope    = np.dot(df0, dir)
+    history  = []
+    for trial in range(1, 1 + opts['max_trials']):
+
+        x = x0 + alpha*dir
+        if opts['xmin'] is not None or opts['xmax'] is not None:
+            x = np.clip(x, opts['xmin'], opts['xmax'])
+        f = f_func(x)
+        if opts['hook']:
+            opts['hook']('minor', x, f, alpha, trial)
+
+        increase = f > f0 + opts['c1']*np.dot(df0, x - x0) and np.any(x != x0)
+        result   =      'success' if increase                                     \
+                   else 'alpha'   if alpha <= opts['alpha_min']                   \
+                   else 'iters'   if trial == opts['max_trials']                  \
+                   else 'user'    if opts['stopfile'] and isfile(opts['stopfile']) \
+                   else None
+        if result:
+            return x, f, alpha, result, trial
+
+        history.append((alpha, f))
+        a_new = interpolate_step(f0, slope, history) if slope > 0.0 else None
+        a_new = opts['shrink_max']*alpha if a_new is None or not np.isfinite(a_new) else a_new
+        alpha = max(min(max(a_new, opts['shrink_min']*alpha), opts['shrink_max']*alpha),
+                    opts['alpha_min'])
@@ -112,6 +112,15 @@ class ObjectiveFunction(object):
             Optional list of additional objective quantities to be computed
             and returned each time the objective function is evaluated.
 
+        freq_aggregate: str, optional
+            Rule for combining objective-function values at multiple
+            frequencies into a single figure of merit when the objective
+            is evaluated at all DFT frequencies at once (`nf=None`):
+            'sum' (default), 'min', 'max', or 'weighted'.
+
+        freq_weights: array-like, optional
+            Per-frequency weights for `freq_aggregate='weighted'`.
+
     Class instances store the following data:
 
         :`fexpr` (`sympy` expression):
@@ -136,7 +145,13 @@ class ObjectiveFunction(object):
             domain field data stored in DFTCells)
 
         :`qvals` (array-like):
-            cache storing most recently computed values of objective quantities
+            cache storing most recently computed values of objective quantities;
+            of shape (N,) for single-frequency evaluations or (nfreq, N)
+            for evaluations at all frequencies
+
+        :`fvals` (array-like):
+            objective-function values at each frequency from the most recent
+            evaluation at all frequencies (None for single-frequency evaluations)
 
 
         :`riqsyms`, `riqvals`:
@@ -147,8 +162,15 @@ class ObjectiveFunction(object):
             differentiation of non-analytic functions of objective
             quantities such as :math:`|q_i|^2`---which, incidentally,
             would be written within `fstr` like this: 'Abs(q_i)**2'
+
+        :`fdf_func` (callable):
+
+            compiled NumPy function of the `riqsymbols` that evaluates
+            `fexpr` and all `dfexpr` entries in one call, with common
+            subexpressions shared. Used by `evaluate`; the symbolic
+            expressions are retained only for reference.
     """
-    def __init__(self, fstr='S_0', extra_quantities=[]):
+    def __init__(self, fstr='S_0', extra_quantities=[], freq_aggregate='sum', freq_weights=None):
 
         def _parse_absval_bars(s):
             """preprocess sympy input to replace '|...|' with 'Abs(...)' """
@@ -170,6 +192,15 @@ class ObjectiveFunction(object):
 
         # qvals = cached values of objective quantities
         self.qvals = 0.0j*np.zeros(len(self.qnames))
+        self.fvals = None
+
+        # rule for aggregating objective-function values over frequencies
+        if freq_aggregate not in ['sum', 'min', 'max', 'weighted']:
+            raise ValueError('unknown frequency aggregate {}'.format(freq_aggregate))
+        if freq_aggregate=='weighted' and freq_weights is None:
+            raise ValueError('freq_aggregate=weighted requires freq_weights')
+        self.freq_aggregate = freq_aggregate
+        self.freq_weights   = None if freq_weights is None else np.asarray(freq_weights, dtype=float)
 
         # for each (generally complex-valued) objective quantity,
         # we now introduce two real-valued symbols for the real and
@@ -195,6 +226,13 @@ class ObjectiveFunction(object):
             df_diqn = sympy.diff(self.fexpr,self.riqsymbols[2*nq+1])
             self.dfexpr.append( df_drqn - sympy.I*df_diqn )
 
+        # compile f and its partial derivatives into a single fused numpy function
+        exprs = [self.fexpr] + self.dfexpr
+        try:
+            self.fdf_func = sympy.lambdify(self.riqsymbols, exprs, modules='numpy', cse=True)
+        except TypeError:  # sympy < 1.9 does not support common-subexpression elimination in lambdify
+            self.fdf_func = sympy.lambdify(self.riqsymbols, exprs, modules='numpy')
+
 
     def __call__(self, DFTCells, nf=0):
         """Compute objective quantities and objective function.
@@ -208,27 +246,84 @@ class ObjectiveFunction(object):
         DFTCells : list of :class:`dft_cell <meep_adjoint.dft_cell>`
             List that should contain at least all DFT cells for which
             objective quantities are defined.
-        nf : int, optional
-             Frequency index, by default 0
+        nf : int or None, optional
+             Frequency index, by default 0. If None, the objective
+             quantities are computed at all DFT frequencies at once,
+             the objective function is evaluated at each frequency,
+             and the per-frequency values are combined according to
+             `freq_aggregate`.
 
         Returns
         -------
         Array-like
             Array containing objective-function value followed by
-            values of all objective quantities:[ f q0 q1 ...q_{N-1} ]
+            values of all objective quantities:[ f q0 q1 ...q_{N-1} ].
+            If nf is None, f is the aggregated value and the quantity
+            values are listed for each frequency in turn.
         """
+        if nf is None:
+            # each DFT cell returns an array of values over all frequencies
+            self.qvals = np.array([ DFTCells[qr.ncell](qr.code,qr.mode,None) for qr in self.qrules ],
+                                  dtype=complex).T
+            self.fvals, _ = self.evaluate(self.qvals)
+            return np.array( [self.aggregate(self.fvals)] + list(self.qvals.ravel()) )
 
         # fetch updated values for all objective quantities
+        self.qvals, self.fvals = 0.0j*np.zeros(len(self.qnames)), None
         for nq, qr in enumerate(self.qrules):
             self.qvals[nq] = DFTCells[qr.ncell](qr.code,qr.mode,nf)
             self.riqvals[self.riqsymbols[2*nq+0]]=np.real(self.qvals[nq])
             self.riqvals[self.riqsymbols[2*nq+1]]=np.imag(self.qvals[nq])
 
         # plug in objective-quantity values to get value of objective function
-        fval=self.fexpr.evalf(subs=self.riqvals)
-        fval=complex(fval) if fval.is_complex else float(fval)
+        fval, _ = self.evaluate(self.qvals)
+
+        return np.array( [fval] + list(self.qvals) )
+
+
+    def aggregation_weights(self, fvals):
+        """Weights w_n such that dF = sum_n w_n df_n for the aggregate F of per-frequency values fvals."""
+        if self.freq_aggregate=='sum':
+            return np.ones(len(fvals))
+        if self.freq_aggregate=='weighted':
+            if len(self.freq_weights)!=len(fvals):
+                raise ValueError('{} frequency weights given for {} frequencies'.format(len(self.freq_weights),len(fvals)))
+            return self.freq_weights
+        w = np.zeros(len(fvals))
+        w[ np.argmin(fvals) if self.freq_aggregate=='min' else np.argmax(fvals) ] = 1.0
+        return w
 
-        return np.array( [np.real(fval)] + list(self.qvals) )
+
+    def aggregate(self, fvals):
+        """Combine per-frequency objective-function values into a single figure of merit."""
+        if self.freq_aggregate=='min':
+            return np.amin(fvals)
+        if self.freq_aggregate=='max':
+            return np.amax(fvals)
+        return np.dot(self.aggregation_weights(fvals), fvals)
+
+
+    def evaluate(self, qvals):
+        """Evaluate objective function and its partial derivatives numerically.
+
+        Parameters
+        ----------
+        qvals : array-like, complex
+            Values of objective quantities, of shape (N,) or (..., N)
+            with leading batch axes (e.g. over frequencies or designs).
+
+        Returns
+        -------
+        2-tuple (f, dfdq)
+            f : real part of the objective function, of shape qvals.shape[:-1]
+            dfdq : array of partial derivatives :math:`\partial f/\partial q_n`,
+                   of shape qvals.shape
+        """
+        qvals = np.asarray(qvals, dtype=complex)
+        args  = [ a for q in np.moveaxis(qvals,-1,0) for a in (np.real(q), np.imag(q)) ]
+        vals  = [ np.broadcast_to(v, qvals.shape[:-1]) for v in self.fdf_func(*args) ]
+        dfdq  = np.stack(vals[1:], axis=-1).astype(complex) if len(vals)>1 else 0.0j*qvals
+        return np.real(vals[0]), dfdq
 
 
     def get_dfdq(self):
@@ -243,5 +338,11 @@ class ObjectiveFunction(object):
         -------
         array-like
             Array whose *n*th entry is :math:`\partial f/\partial q_n`.
+            If the most recent evaluation was at all frequencies, an array
+            of shape (nfreq, N) of derivatives of the aggregated objective
+            with respect to the quantities at each frequency.
         """
-        return np.array( [ df.evalf(subs=self.riqvals) for df in self.dfexpr ] )
+        fvals, dfdq = self.evaluate(self.qvals)
+        if self.qvals.ndim==1:
+            return dfdq
+        return self.aggregation_weights(fvals)[:,None] * dfdq
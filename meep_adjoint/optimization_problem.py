@@ -1,18 +1,22 @@
 """OptimizationProblem is the top-level class exported by the meep.adjoint module.
 """
 import os
+import time
 import inspect
+import warnings
 
+import numpy as np
 import meep as mp
 
-from . import (DFTCell, ObjectiveFunction, TimeStepper, ConsoleManager,
-               FiniteElementBasis, rescale_sources, E_CPTS, v3, V3,
-               init_log, launch_dashboard, ConsoleManager)
-
-from . import visualize_sim
+from . import (DFTCell, TimeStepper, ConsoleManager,
+               SimpleFiniteElementBasis, rescale_sources, E_CPTS, v3, V3, make_grid,
+               init_log, log, launch_dashboard, ConsoleManager, DesignCache)
 
 from . import get_adjoint_option as adj_opt
 from .adjoint_options import set_adjoint_options
+from .checkpoint import write_checkpoint, read_checkpoint
+from .parallel import (divide_groups, num_groups, group, am_root, merge, owner,
+                       speculative_line_search, pool_map, can_fork)
 
 ######################################################################
 ######################################################################
@@ -107,13 +111,21 @@ class OptimizationProblem(object):
         #-----------------------------------------------------------------------
         # process convenience arguments:
         #  (a) if no basis was specified, create one using the given design
-        #      region plus global option values
+        #      region plus global option values (falling back to the
+        #      dolfin-free SimpleFiniteElementBasis if dolfin is unavailable)
         #  (b) if no sources were specified, create one using the given source
         #      region plus global option values
         #-----------------------------------------------------------------------
-        self.basis = basis or FiniteElementBasis(region=design_region,
-                                                 element_length=adj_opt('element_length'),
-                                                 element_type=adj_opt('element_type'))
+        if basis is None:
+            fe_args = { 'region': design_region,
+                        'element_length': adj_opt('element_length'),
+                        'element_type': adj_opt('element_type') }
+            try:
+                from .finite_element_basis import FiniteElementBasis
+                basis = FiniteElementBasis(**fe_args)
+            except ImportError:
+                basis = SimpleFiniteElementBasis(**fe_args)
+        self.basis = basis
         design_region = self.basis.domain
         design_region.name = design_region.name or 'design'
 
@@ -137,8 +149,12 @@ class OptimizationProblem(object):
         dft_cells       = objective_cells + extra_cells + [design_cell]
 
         # ObjectiveFunction
+        from .objective import ObjectiveFunction
+        freq_weights    = adj_opt('freq_weights')
         obj_func        = ObjectiveFunction(fstr=objective_function,
-                                            extra_quantities=extra_quantities)
+                                            extra_quantities=extra_quantities,
+                                            freq_aggregate=adj_opt('freq_aggregate'),
+                                            freq_weights=[float(w) for w in freq_weights.split(',')] if freq_weights else None)
 
         # initial values of (a) design variables, (b) the spatially-varying
         # permittivity function they define (the 'design function'), (c) the
@@ -148,11 +164,23 @@ class OptimizationProblem(object):
         # Note that sources and DFT cells are not added to the Simulation at
         # this stage; this is done later by internal methods of TimeStepper
         # on a just-in-time basis before starting a timestepping run.
+        # If the 'tabulate_eps' option is set, the design function is tabulated
+        # in bulk on a grid with twice the Yee-grid resolution (so that all Yee
+        # points are covered), sparing libmeep a call into the basis for
+        # each point at which it samples the design permittivity. The
+        # permittivity is then multilinearly interpolated between table
+        # entries, and so only approximates the basis expansion (to within
+        # O(table spacing) x gradient); the option is off by default.
         self.beta_vector     = self.basis.project(adj_opt('eps_design'))
-        self.design_function = self.basis.parameterized_function(self.beta_vector)
+        design_grid          = None
+        if adj_opt('tabulate_eps'):
+            dims        = [ int(np.ceil(2.0*adj_opt('res')*s)) + 1 for s in design_region.size if s>0 ]
+            design_grid = make_grid(design_region.size, center=design_region.center, dims=dims)
+        self.design_function = self.basis.parameterized_function(self.beta_vector, grid=design_grid)
         design_object   = mp.Block(center=V3(design_region.center), size=V3(design_region.size),
                                    epsilon_func = self.design_function.func())
         geometry        = background_geometry + [design_object] + foreground_geometry
+        divide_groups(adj_opt('line_search_groups'))   # must precede simulation setup
         sim             = mp.Simulation(resolution=adj_opt('res'), cell_size=V3(cell_size),
                                         boundary_layers=[mp.PML(adj_opt('dpml'))],
                                         geometry=geometry)
@@ -160,6 +188,23 @@ class OptimizationProblem(object):
         # TimeStepper
         self.stepper    = TimeStepper(obj_func, dft_cells, self.basis, sim, sources)
 
+        # memoized results of calculations for recently visited designs, and the
+        # cache key of the design for which forward fields are currently stored in
+        # the DFT cells (None if there is no such design)
+        self.cache      = DesignCache(max_entries=adj_opt('cache_size'),
+                                      max_bytes=adj_opt('cache_memory')*2**20)
+        self.fields_key = None
+
+        # objective-function values of all forward runs so far, optimizer
+        # state recorded in (or restored from) the most recent checkpoint,
+        # and the last iterate accepted by the optimizer (from which an
+        # interrupted optimization is resumed; the current design may be
+        # a line-search trial point)
+        self.history         = []
+        self.optimizer_state = None
+        self.restart_x       = None
+        self.last_checkpoint = time.time()
+
         #-----------------------------------------------------------------------
         # if the 'filebase' configuration option wasn't specified, set it
         # to the base filename of the caller's script
@@ -169,11 +214,15 @@ class OptimizationProblem(object):
             script_base = os.path.basename(script).split('.')[0]
             set_adjoint_options({'filebase': os.path.basename(script_base)})
 
-        if mp.am_master():
-            init_log(filename=adj_opt('logfile') or adj_opt('filebase') + '.log', usecs=True)
+        if am_root():
+            init_log(filename=adj_opt('logfile') or adj_opt('filebase') + '.log', usecs=True,
+                     loglevel=adj_opt('loglevel'))
 
         self.dashboard_state = None
 
+        if adj_opt('resume'):
+            self.load_checkpoint()
+
 
     #####################################################################
     # The basic task of an OptimizationProblem: Given a candidate design
@@ -215,28 +264,131 @@ class OptimizationProblem(object):
 
             If need_value or need_gradient is False, then fq or gradf in the return
             tuple will be None.
+
+            Results for recently visited designs are memoized (see DesignCache),
+            so repeated requests for the same design are served without timestepping.
         """
-        if beta_vector or design:
+        if beta_vector is not None or design is not None:
             self.update_design(beta_vector=beta_vector, design=design)
 
+        key   = self.cache.key(self.beta_vector)
+        entry = self.cache.lookup(key) or {}
+        fq    = entry.get('fq')    if need_value    else None
+        gradf = entry.get('gradf') if need_gradient else None
+
         #######################################################################
-        # sanity check: if they are asking for an adjoint calculation with no
-        #               forward calculation, make sure we previously completed
-        #               a forward calculation for the current design function
+        # an adjoint calculation requires forward fields for the current
+        # design, which are either already present in the DFT cells, or
+        # restorable from a cached snapshot, or must be recomputed
         #######################################################################
-        if need_value == False and self.stepper.state == 'reset':
-            warnings.warn('forward run not yet run for this design; ignoring request to omit')
-            need_value = True
-
-        if self.dashboard_state is None:
+        need_forward = need_value and fq is None
+        need_adjoint = need_gradient and gradf is None
+        if need_adjoint and self.fields_key != key:
+            if 'fields' in entry:
+                self.set_forward_fields(entry['fields'])
+            else:
+                if not need_value:
+                    warnings.warn('forward run not yet run for this design; ignoring request to omit')
+                need_forward = True
+
+        if (need_forward or need_adjoint) and self.dashboard_state is None:
             launch_dashboard(name=adj_opt('filebase'))
             self.dashboard_state = 'launched'
 
         with ConsoleManager() as cm:
-            fq    = self.stepper.run('forward') if need_value else None
-            gradf = self.stepper.run('adjoint') if need_gradient else None
+            if need_forward:
+                fq = self.run_forward(key)
+            if need_adjoint:
+                gradf = self.stepper.run('adjoint')
+                self.cache.store(key, gradf=gradf)
+
+        return (fq if need_value else None), gradf
+
+
+    def run_forward(self, key):
+        """Forward run for the current design (whose cache key is key),
+           with bookkeeping of cache, history, and checkpoints."""
+        fq = self.stepper.run('forward')
+        self.fields_key = key
+        fields = self.get_forward_fields() if adj_opt('cache_fields') else None
+        self.cache.store(key, fq=fq, fields=fields)
+        self.history.append(float(np.real(fq[0])))
+        interval = adj_opt('checkpoint_interval')
+        if interval > 0 and time.time() - self.last_checkpoint >= interval:
+            self.save_checkpoint()
+        return fq
+
+
+    def quantity_gradients(self, qnames=None, beta_vector=None):
+        """Compute gradients of individual objective quantities.
+
+        Each gradient dQ/dbeta requires its own adjoint run, but all of them
+        use the same forward fields, and the runs are independent of one
+        another. They are therefore distributed over
+
+            (a) the line-search process groups, if the 'line_search_groups'
+                option is greater than 1 (group g computes the gradients of
+                quantities g, g+K, g+2K, ...; see parallel.py), or
+            (b) forked local worker processes, if the 'adjoint_workers'
+                option is greater than 1 in a serial run. The workers
+                inherit the forward fields of the parent process
+                copy-on-write, so the fields are neither copied nor pickled.
+                This is unavailable (with a warning) if meep is built with
+                MPI, which does not survive a fork (see parallel.can_fork).
+
+        Otherwise the adjoint runs are done one after another.
 
-        return fq, gradf
+        Parameters
+        ----------
+        qnames: list of str, optional
+            names of objective quantities (default: all)
+
+        beta_vector: np.array, optional
+            new vector of design variables (default: the current design)
+
+        Returns
+        -------
+        dict {qname: real-valued gradient of Q w.r.t. design variables}
+        """
+        if beta_vector is not None:
+            self.update_design(beta_vector=beta_vector)
+        obj_func = self.stepper.obj_func
+        qnames   = list(obj_func.qnames if qnames is None else qnames)
+        unknown  = [ q for q in qnames if q not in obj_func.qnames ]
+        if unknown:
+            raise ValueError('unknown objective quantities {}'.format(unknown))
+
+        # all adjoint runs need forward fields for the current design
+        key   = self.cache.key(self.beta_vector)
+        entry = self.cache.lookup(key) or {}
+        if self.dashboard_state is None:
+            launch_dashboard(name=adj_opt('filebase'))
+            self.dashboard_state = 'launched'
+        with ConsoleManager() as cm:
+            if self.fields_key != key:
+                if 'fields' in entry:
+                    self.set_forward_fields(entry['fields'])
+                else:
+                    self.run_forward(key)
+
+            K, workers = num_groups(), adj_opt('adjoint_workers')
+            forked     = K == 1 and workers > 1 and len(qnames) > 1
+            if forked and not can_fork():
+                warnings.warn('adjoint_workers={} ignored: cannot fork worker processes '
+                              '(meep built with MPI, or no fork on this platform)'.format(workers))
+                forked = False
+            if K > 1:
+                mine  = { q: np.real(self.stepper.run(q)) for q in qnames[group()::K] }
+                zero  = np.zeros(self.basis.dim)
+                grads = [ merge(mine.get(q, zero))[n % K] for n, q in enumerate(qnames) ]
+            elif forked:
+                grads = [ np.real(g) for g in pool_map(self.stepper.run, qnames, workers) ]
+                for q in qnames:    # runs done by the workers
+                    self.stepper.run_counts[q] = self.stepper.run_counts.get(q, 0) + 1
+            else:
+                grads = [ np.real(self.stepper.run(q)) for q in qnames ]
+
+        return dict(zip(qnames, grads))
 
 
     def get_fdf_funcs(self):
@@ -254,7 +406,7 @@ class OptimizationProblem(object):
             return fq[0]
 
         def _df(x=None):
-            (_, df) = self.__call__(need_value = False)
+            (_, df) = self.__call__(beta_vector = x, need_value = False)
             return df
 
         return _f, _df
@@ -263,6 +415,229 @@ class OptimizationProblem(object):
     #####################################################################
     # ancillary API methods #############################################
     #####################################################################
+    def get_forward_fields(self):
+        """Return a snapshot of the state left behind by the most recent forward run.
+
+        The snapshot contains everything needed to launch an adjoint run
+        without repeating the forward run: the saved forward DFT fields
+        of all DFT cells and the values of the objective quantities.
+        """
+        return { 'EH':    [ cell.EH_cache.get('forward') for cell in self.stepper.dft_cells ],
+                 'qvals': np.copy(self.stepper.obj_func.qvals) }
+
+
+    def set_forward_fields(self, snapshot):
+        """Restore a snapshot returned by get_forward_fields() for the current design."""
+        for cell, EH in zip(self.stepper.dft_cells, snapshot['EH']):
+            cell.EH_cache['forward'] = EH
+        self.stepper.obj_func.qvals = np.copy(snapshot['qvals'])
+        self.stepper.state = 'forward.complete'
+        self.fields_key = self.cache.key(self.beta_vector)
+
+
+    #####################################################################
+    # optimization ######################################################
+    #####################################################################
+    def optimize(self, beta_vector=None, method=None, options={}):
+        """Maximize the objective function over the design variables.
+
+        Parameters
+        ----------
+        beta_vector: np.array, optional
+            initial design (default: the current design)
+
+        method: str, optional
+            'lbfgs' (default, bound-constrained L-BFGS; see lbfgs.py) or
+            'duhscent' (see gradient_duhscent.py); default from the
+            'optimizer' option
+
+        options: dict, optional
+            overrides of the default options of the optimizer. By default
+            the bounds are the 'beta_min' and 'beta_max' options, and the
+            other settings are taken from the optimizer options in
+            adjoint_options.py.
+
+        If the 'resume' option is set, the optimization resumes from the
+        optimizer state restored from the checkpoint file, or, if the
+        checkpoint was written before the first iteration completed, from
+        the last accepted iterate stored there (not from the design of the
+        most recent forward run, which may be a rejected trial point); if the
+        'checkpoint_interval' option is positive, the optimizer state
+        (for L-BFGS including its curvature history) is checkpointed
+        after each iteration at most once per interval. If the
+        'line_search_groups' option is greater than 1, line-search trial
+        points are evaluated concurrently by groups of processes (see
+        parallel.py).
+
+        Returns
+        -------
+        4-tuple (beta*, f*, df*, result) as returned by lbfgs()
+        """
+        method = method or adj_opt('optimizer')
+        if beta_vector is not None:
+            x0 = beta_vector
+        elif self.restart_x is not None:
+            x0 = self.restart_x
+        else:
+            x0 = self.beta_vector
+        self.restart_x = np.clip(x0, adj_opt('beta_min'), adj_opt('beta_max'))
+        interval = adj_opt('checkpoint_interval')
+
+        def _hook(event, *state):
+            if event=='major':
+                self.restart_x = np.copy(state[0]['x'] if method=='lbfgs' else state[0])
+            if event=='major' and interval>0 and time.time()-self.last_checkpoint >= interval:
+                if method=='lbfgs':
+                    self.save_checkpoint(optimizer_state=state[0])
+                else:
+                    x, f, alpha, iters = state
+                    self.save_checkpoint(optimizer_state={ 'x': x, 'f': f, 'alpha': alpha, 'iters': iters })
+
+        opts = { 'xmin': adj_opt('beta_min'), 'xmax': adj_opt('beta_max'),
+                 'max_iters': adj_opt('max_iters'), 'hook': _hook,
+                 'state': self.optimizer_state if adj_opt('resume') else None,
+                 'line_search': speculative_line_search if num_groups() > 1 else None }
+        if method=='lbfgs':
+            from .lbfgs import lbfgs
+            opts.update({ 'memory': adj_opt('lbfgs_memory'), 'step0': adj_opt('alpha'),
+                          'gtol': adj_opt('gtol'), 'ftol': adj_opt('ftol') })
+            opts.update(options)
+            def _fdf(x, need_gradient):
+                if need_gradient:
+                    return self.shared_fdf(x)
+                fq, _ = self.__call__(beta_vector=x, need_gradient=False)
+                return np.real(fq[0]), None
+            result = lbfgs(_fdf, x0, options=opts)
+        elif method=='duhscent':
+            from .gradient_duhscent import gradient_duhscent
+            opts.update({ k: adj_opt(k) for k in ['alpha_min', 'alpha_max', 'boldness', 'timidity'] })
+            opts.update({ 'alpha0': adj_opt('alpha') })
+            opts.update(options)
+            f_func, _ = self.get_fdf_funcs()
+            x, f, df = gradient_duhscent(lambda x: np.real(f_func(x)),
+                                         lambda x: self.shared_fdf(x)[1], x0, options=opts)
+            result   = (x, f, df, 'done')
+        else:
+            raise ValueError('unknown optimizer {}'.format(method))
+        self.restart_x = np.copy(result[0])
+
+        log('optimization terminated ({}) after {} forward and {} adjoint runs: f={}',
+            result[3], self.stepper.run_counts.get('forward', 0),
+            self.stepper.run_counts.get('adjoint', 0), result[1])
+        return result
+
+
+    def shared_fdf(self, x):
+        """Objective-function value and gradient at x.
+
+        If the processes are divided into line-search groups (see parallel.py),
+        the calculation is done only by a group that already holds forward
+        fields (or results) for x---typically the group that evaluated the
+        accepted line-search trial point---and the results are shared with
+        the other groups. Must then be called on all processes.
+        """
+        if num_groups() == 1:
+            fq, gradf = self.__call__(beta_vector=x)
+            return np.real(fq[0]), gradf
+
+        key    = self.cache.key(np.clip(x, adj_opt('beta_min'), adj_opt('beta_max')))  # as in update_design
+        entry  = self.cache.lookup(key) or {}
+        source = max(owner(self.fields_key==key or 'fields' in entry or 'gradf' in entry), 0)
+        fdf    = np.zeros(1 + len(x))
+        if group() == source:
+            fq, gradf = self.__call__(beta_vector=x)
+            fdf = np.concatenate(([np.real(fq[0])], np.real(gradf)))
+        else:
+            self.update_design(beta_vector=x)
+        fdf = merge(fdf)[source]
+        return fdf[0], fdf[1:]
+
+
+    #####################################################################
+    # checkpoint/restart ################################################
+    #####################################################################
+    def checkpoint_file(self, filename=None):
+        return filename or adj_opt('checkpoint_file') or adj_opt('filebase') + '.checkpoint.npz'
+
+
+    def save_checkpoint(self, filename=None, optimizer_state=None):
+        """Write the state of the optimization to a checkpoint file.
+
+        The checkpoint contains the design vector, the last iterate accepted
+        by the optimizer (the design vector itself outside of optimize()),
+        the objective-function history, the optimizer state (as passed in,
+        or else as recorded by the most recent call), and---if they are
+        available for the current
+        design---the objective values and saved forward DFT fields, from
+        which a pending adjoint run can be launched after a restart without
+        repeating the forward run. See checkpoint.py for the file format.
+        """
+        if optimizer_state is not None:
+            self.optimizer_state = optimizer_state
+        key   = self.cache.key(self.beta_vector)
+        entry = self.cache.lookup(key) or {}
+        state = { 'beta_vector': self.beta_vector,
+                  'restart_x':   self.beta_vector if self.restart_x is None else self.restart_x,
+                  'design_key':  key,
+                  'history':     np.array(self.history),
+                  'optimizer':   self.optimizer_state }
+        snapshot = self.get_forward_fields() if self.fields_key==key else entry.get('fields')
+        if snapshot is not None:
+            state['forward'] = { 'fq':    entry.get('fq'),
+                                 'qvals': snapshot['qvals'],
+                                 'EH':    { str(n): EH for n, EH in enumerate(snapshot['EH']) } }
+        write_checkpoint(self.checkpoint_file(filename), state)
+        self.last_checkpoint = time.time()
+
+
+    def load_checkpoint(self, filename=None):
+        """Restore the state of the optimization from a checkpoint file.
+
+        The design vector, the last accepted iterate (from which optimize()
+        resumes) and the objective history are restored, and if the
+        checkpoint holds forward fields for its design they are reinstated
+        in the DFT cells (and the objective values in the design cache),
+        so that the next request for the value or gradient at that design
+        skips the forward run.
+
+        Returns
+        -------
+        The optimizer state stored in the checkpoint (None if there is
+        none, or if the checkpoint file does not exist).
+        """
+        filename = self.checkpoint_file(filename)
+        state    = read_checkpoint(filename)
+        if state is None:
+            warnings.warn('checkpoint file {} not found'.format(filename))
+            return None
+        self.update_design(beta_vector=state['beta_vector'])
+        self.restart_x       = state.get('restart_x', state['beta_vector'])
+        self.history         = list(np.atleast_1d(state.get('history', [])))
+        self.optimizer_state = state.get('optimizer')
+
+        key, forward = self.cache.key(self.beta_vector), state.get('forward')
+        if forward is not None and key==state.get('design_key'):
+            snapshot = { 'EH':    [ forward['EH'].get(str(n)) for n in range(len(self.stepper.dft_cells)) ],
+                         'qvals': forward['qvals'] }
+            # the DFT cells must be registered in a simulation (without timestepping)
+            # to initialize their grids and enable eigenmode calculations
+            self.stepper.prepare('forward')
+            self.set_forward_fields(snapshot)
+            self.cache.store(key, fq=forward.get('fq'),
+                             fields=snapshot if adj_opt('cache_fields') else None)
+        return self.optimizer_state
+
+
+    def checkpoint_hook(self, filename=None):
+        """Hook for gradient_duhscent that writes a checkpoint, including
+           the optimizer state, after each iteration."""
+        def _hook(event, x, f, alpha, iters):
+            if event=='major':
+                self.restart_x = np.copy(x)
+                self.save_checkpoint(filename, optimizer_state={ 'x': x, 'f': f, 'alpha': alpha, 'iters': iters })
+        return _hook
+
+
     def update_design(self, beta_vector=None, design=None):
         """Update the design permittivity function.
 
@@ -284,6 +659,10 @@ class OptimizationProblem(object):
            implement, and we should probably introduce a mechanism for
            building the constraints into the Basis class and subclasses.
 
+           If the clipped coefficient vector equals the current one, nothing
+           changes: in particular, forward fields already computed for the
+           current design remain available for an adjoint run.
+
 
         Parameters
         ----------
@@ -293,10 +672,15 @@ class OptimizationProblem(object):
         design: function-like
             new permittivity function
         """
-        self.beta_vector = self.basis.project(design) if design else beta_vector
-        self.beta_vector.clip(adj_opt('beta_min'), adj_opt('beta_max'))
+        beta_vector = self.basis.project(design) if design is not None else beta_vector
+        beta_vector = np.clip(beta_vector, adj_opt('beta_min'), adj_opt('beta_max'))
+        if self.cache.key(beta_vector) == self.cache.key(self.beta_vector):
+            return
+        self.beta_vector = beta_vector
         self.design_function.set_coefficients(self.beta_vector)
         self.stepper.state='reset'
+        self.stepper.eps_stale=True
+        self.fields_key=None
 
 
     #####################################################################
@@ -307,6 +691,7 @@ class OptimizationProblem(object):
            as appropriately autodetermined based on the current state of
            progress.
         """
+        from .visualization import visualize_sim
         if self.stepper.state=='reset':
             self.stepper.prepare('forward')
 
@@ -0,0 +1,181 @@
+"""Speculative line search over groups of MPI processes.
+
+    With the 'line_search_groups' option set to K > 1, the processes of
+    an MPI run are divided (once, before any simulation is initialized)
+    into K groups by mp.divide_parallel_processes, each of which runs its
+    own copy of every simulation. A line search then evaluates K trial
+    step lengths at once---one per group---and exchanges the resulting
+    objective-function values via mp.merge_subgroup_data, so that all
+    groups agree on the accepted point. The adjoint run for the accepted
+    point is done by the group holding its forward fields, and the
+    gradient is likewise shared with all groups.
+
+    This trades core-hours for wall-clock time: it pays off when the
+    simulation no longer scales to the full process count.
+
+    The same groups compute the independent per-quantity adjoint runs of
+    OptimizationProblem.quantity_gradients concurrently; in serial runs,
+    these may instead be farmed out to forked local processes (pool_map).
+"""
+from os.path import isfile
+import numpy as np
+import meep as mp
+
+from . import get_adjoint_option as adj_opt
+from . import flush_log
+from .line_search import _DEFAULTS as _LS_DEFAULTS, interpolate_step, line_search
+
+
+_num_groups, _group = 1, 0
+
+
+def divide_groups(num_groups):
+    """Divide the MPI processes into num_groups groups (at most once).
+
+    Returns
+    -------
+    index of the group to which this process belongs
+    """
+    global _num_groups, _group
+    if num_groups > 1 and _num_groups == 1:
+        if adj_opt('dft_distributed'):
+            raise ValueError("options 'line_search_groups' and 'dft_distributed' are mutually exclusive")
+        if mp.count_processors() < num_groups:
+            raise ValueError('line_search_groups={} exceeds number of processes ({})'
+                             .format(num_groups, mp.count_processors()))
+        _group      = mp.divide_parallel_processes(num_groups)
+        _num_groups = num_groups
+    return _group
+
+
+def num_groups():
+    return _num_groups
+
+
+def group():
+    return _group
+
+
+def am_root():
+    """True on exactly one process of the whole run (even when divided)."""
+    return mp.am_really_master() if _num_groups > 1 else mp.am_master()
+
+
+def merge(x):
+    """Values of the scalar or 1D array x on all groups, stacked along a new
+    leading axis. Must be called on all processes."""
+    x = np.atleast_1d(np.asarray(x, dtype=float))
+    if _num_groups == 1:
+        return x[None, :]
+    return np.transpose(mp.merge_subgroup_data(x))
+
+
+def owner(have):
+    """Index of the first group for which have is True (-1 if none)."""
+    flags = merge(1.0 if have else 0.0)[:,0]
+    return int(np.argmax(flags)) if np.any(flags) else -1
+
+
+def speculative_line_search(f_func, x0, f0, df0, dir, alpha, options={}):
+    """one-dimensional line search evaluating one trial point per group
+
+    Drop-in replacement for line_search.line_search (same arguments,
+    options, and return value). In each round, group g evaluates the trial
+    step length alpha * shrink_max**(g-1): one bold step beyond alpha,
+    alpha itself, and increasingly timid steps. Of the trials satisfying
+    the sufficient-increase condition, the one with the largest f is
+    accepted; if none does, the next round is centered on the maximizer
+    of the interpolant of the values found (see line_search.py), below
+    the smallest step tried. Each round costs the wall-clock time of a single
+    forward run. The trials count returned is the number of rounds.
+    If the processes are not divided into groups, this is line_search.
+    """
+    if _num_groups == 1:
+        return line_search(f_func, x0, f0, df0, dir, alpha, options)
+
+    opts   = { k:options.get(k,v) for k,v in _LS_DEFAULTS.items() }
+    x0     = np.asarray(x0, dtype=float)
+    dir    = np.asarray(dir, dtype=float)
+    shrink = opts['shrink_max']
+    slope  = np.dot(df0, dir)
+
+    def trial_point(a):
+        x = x0 + a*dir
+        if opts['xmin'] is not None or opts['xmax'] is not None:
+            x = np.clip(x, opts['xmin'], opts['xmax'])
+        return x
+
+    for rnd in range(1, 1 + opts['max_trials']):
+        alphas = [ max(alpha*shrink**(g-1), opts['alpha_min']) for g in range(_num_groups) ]
+        f      = f_func(trial_point(alphas[_group]))
+        fs     = merge(f)[:,0]
+
+        points = [ trial_point(a) for a in alphas ]
+        if opts['hook']:
+            for a, x, fx in zip(alphas, points, fs):
+                opts['hook']('minor', x, fx, a, rnd)
+        ok = [ fx > f0 + opts['c1']*np.dot(df0, x-x0) and np.any(x != x0)
+               for x, fx in zip(points, fs) ]
+        if any(ok):
+            g = max( (g for g in range(_num_groups) if ok[g]), key=lambda g: fs[g] )
+            return points[g], fs[g], alphas[g], 'success', rnd
+
+        result = 'alpha' if alphas[-1] <= opts['alpha_min']           \
+            else 'iters' if rnd == opts['max_trials']                 \
+            else 'user'  if opts['stopfile'] and isfile(opts['stopfile']) \
+            else None
+        if result:
+            return points[-1], fs[-1], alphas[-1], result, rnd
+
+        # center the next round on the maximizer of the interpolant through
+        # the two smallest steps tried, keeping its bold step below them
+        a_min = alphas[-1]
+        a_new = interpolate_step(f0, slope, list(zip(alphas, fs))[-2:]) if slope > 0.0 else None
+        a_new = shrink*shrink*a_min if a_new is None or not np.isfinite(a_new) else a_new
+        alpha = min(max(a_new, opts['shrink_min']*a_min), shrink*shrink*a_min)
+
+
+######################################################################
+# local process pool for serial runs
+######################################################################
+_pool_func = None
+
+def _pool_call(arg):
+    # workers exit without running atexit handlers, so log lines
+    # buffered in the worker must be written out here
+    try:
+        return _pool_func(arg)
+    finally:
+        flush_log()
+
+
+def can_fork():
+    """True if worker processes can be forked: the platform supports fork,
+    and meep is not built with MPI (which is initialized on import even in
+    serial runs, and MPI implementations do not support fork after MPI_Init)."""
+    import multiprocessing
+    return 'fork' in multiprocessing.get_all_start_methods() and not mp.with_mpi()
+
+
+def pool_map(func, args, workers):
+    """[func(a) for a in args], evaluated in up to workers forked processes.
+
+    func is not pickled: the workers are forked after it is installed
+    as a module global, so they inherit it---and all data it refers to,
+    such as saved forward DFT fields---from the parent process by
+    copy-on-write. Only the arguments and return values are pickled.
+    Requires a serial run; if workers cannot be forked (see can_fork), or if
+    there is nothing to parallelize, func is evaluated in this process.
+    """
+    global _pool_func
+    if mp.count_processors() > 1:
+        raise ValueError("option 'adjoint_workers' is only available in serial runs (see 'line_search_groups')")
+    if workers <= 1 or len(args) <= 1 or not can_fork():
+        return [ func(a) for a in args ]
+    import multiprocessing
+    _pool_func = func
+    try:
+        with multiprocessing.get_context('fork').Pool(min(workers, len(args))) as pool:
+            return pool.map(_pool_call, args)
+    finally:
+        _pool_func = None
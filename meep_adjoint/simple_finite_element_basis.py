@@ -0,0 +1,255 @@
+######################################################################
+# simple_finite_element_basis.py
+######################################################################
+from itertools import permutations
+from math import factorial
+
+import numpy as np
+from scipy.sparse import csr_matrix, coo_matrix
+
+from . import Basis, Grid, v3
+from .basis import GridFunc, grid_samples
+
+
+#----------------------------------------------------------------------
+#----------------------------------------------------------------------
+# SimpleFiniteElementBasis is a pure-numpy implementation of the space
+# of piecewise-linear ('Lagrange 1') finite-element functions on a
+# structured triangular (2D) or tetrahedral (3D) mesh of a rectangle or
+# box, for adjoint modeling when the dolfin / FENICS module is not
+# available. It spans the same function space as FiniteElementBasis for
+# element_type='Lagrange 1' on the default (rectangle or box) mesh.
+#
+# How it works: The sides of the domain are subdivided into nseg[d]
+# segments. Each rectangle (box) of the resulting lattice is split into 2
+# triangles (6 tetrahedra) exactly as in dolfin's RectangleMesh with
+# diagonal='left' (BoxMesh). To each node in the resulting
+# (N0+1)*(N1+1)[*(N2+1)] lattice of nodes we assign a single basis function,
+# which takes the value 1 at its node and falls linearly to zero at the
+# neighboring nodes. Indexing: The node with lattice coordinates (n0,n1,n2)
+# is assigned index (n0*(N1+1) + n1)*(N2+1) + n2, following the
+# conventional MEEP scheme for grid indexing (x slowest, z fastest).
+#
+# Because the mesh is structured, locating the simplex that contains a
+# point and computing its barycentric coordinates are closed-form array
+# operations, so basis functions are evaluated in bulk over arbitrary
+# arrays of points, and the mass (Gram) and stiffness matrices are
+# assembled analytically.
+#----------------------------------------------------------------------
+#----------------------------------------------------------------------
+class SimpleFiniteElementBasis(Basis):
+    """
+    Basis of piecewise-linear finite-element functions on a structured
+    triangular or tetrahedral mesh of a rectangle or box, implemented
+    in numpy/scipy without dolfin (FENICS).
+
+    The constructor accepts the same arguments as FiniteElementBasis,
+    except that explicit meshes are not supported and element_type must
+    be degree-1 Lagrange ('Lagrange 1', 'CG 1', or 'P 1').
+    """
+    def __init__(self, region=None, size=None, center=np.zeros(3),
+                       nseg=None, element_length=None,
+                       element_type='Lagrange 1', offset=1.0):
+
+        family, degree = (element_type.split() + ['1'])[0:2]
+        if family not in ['Lagrange', 'CG', 'P'] or int(degree)!=1:
+            raise ValueError('SimpleFiniteElementBasis: unsupported element type {}'.format(element_type))
+
+        (center,size) = (v3(region.center), v3(region.size)) if region else (v3(center),v3(size))
+        if not element_length:
+            element_length=np.amax(size)/10.0
+        nn = list(nseg) if nseg else [ int(np.ceil(s/element_length)) for s in size ]
+        nd = 3 if (len(nn)==3 and nn[2]>0 and size[2]>0) else 2
+
+        self.nd    = nd
+        self.nseg  = np.array(nn[0:nd], dtype=int)
+        self.pmin  = (center - 0.5*size)[0:nd]
+        self.pmax  = (center + 0.5*size)[0:nd]
+        self.delta = (self.pmax - self.pmin) / self.nseg
+        self.nodes = self.nseg + 1
+
+        # the triangle or tetrahedra into which each lattice cell is split,
+        # described by the corner offsets of their vertices. All are Kuhn
+        # simplices (the vertices are visited by stepping along the axes in
+        # the order given by a permutation); in 2D the x axis is reflected,
+        # which yields the diagonal='left' triangulation of dolfin.
+        self.flip      = np.array([True, False] if nd==2 else [False]*3)
+        self.simplices = [ simplex_corners(perm, self.flip) for perm in permutations(range(nd)) ]
+
+        self.element_type = element_type
+        super().__init__(int(np.prod(self.nodes)), size=size, center=center, offset=offset)
+
+
+    ######################################################################
+    # vectorized basis-function evaluation
+    ######################################################################
+    def locate(self, points):
+        """Node indices and barycentric weights of the simplices containing points.
+
+        Args:
+            points (array-like of shape (npoints,3) or (3,)):
+                evaluation points. Points outside the domain are snapped
+                to its boundary.
+
+        Returns:
+            2-tuple (indices, weights) of arrays of shape (npoints, nd+1):
+            global indices of the vertices of the simplex containing each
+            point, and the values at the point of the corresponding basis
+            functions.
+        """
+        p    = np.reshape(np.asarray(points, dtype=float), (-1, 3))[:, 0:self.nd]
+        s    = (p - self.pmin) / self.delta
+        cell = np.clip(np.floor(s).astype(int), 0, self.nseg-1)
+        xi   = np.clip(s - cell, 0.0, 1.0)
+
+        # in (reflected) local coordinates, the simplex containing xi is the
+        # Kuhn simplex for the permutation that sorts xi in decreasing order;
+        # its barycentric coordinates are differences of the sorted values
+        xi     = np.where(self.flip, 1.0-xi, xi)
+        order  = np.argsort(-xi, axis=1, kind='stable')
+        xs     = np.take_along_axis(xi, order, axis=1)
+        ones   = np.ones((len(xs),1))
+        padded = np.hstack([ones, xs, 0.0*ones])
+        weights = padded[:,:-1] - padded[:,1:]
+
+        # corner offsets of the simplex vertices: vertex k is reached by
+        # stepping along the first k axes in order
+        steps   = np.zeros((len(xs), self.nd+1, self.nd), dtype=int)
+        for k in range(1, self.nd+1):
+            steps[:, k, :] = steps[:, k-1, :]
+            np.put_along_axis(steps[:, k, :], order[:, k-1:k], 1, axis=1)
+        corners = np.where(self.flip, 1-steps, steps)
+        nodes   = cell[:,None,:] + corners
+        indices = np.ravel_multi_index(tuple(np.moveaxis(nodes, -1, 0)), self.nodes)
+        return indices, weights
+
+
+    def mesh_key(self):
+        return (self.element_type, tuple(self.nseg), tuple(self.pmin), tuple(self.pmax))
+
+
+    def get_bmatrix(self, points):
+        """Sparse (npoints x dim) matrix of basis-function values at points."""
+        indices, weights = self.locate(points)
+        rows = np.repeat(np.arange(len(indices)), self.nd+1)
+        B = csr_matrix( (weights.ravel(), (rows, indices.ravel())), shape=(len(indices), self.dim) )
+        B.eliminate_zeros()
+        return B
+
+
+    ######################################################################
+    # analytically assembled mass (Gram) and stiffness matrices
+    ######################################################################
+    def assemble(self, element_matrix):
+        """Assemble a sparse global matrix from the (nd+1)x(nd+1) element matrices
+           element_matrix(corners) of all simplices of the mesh."""
+        cells = np.indices(self.nseg).reshape(self.nd, -1).T
+        rows, cols, vals = [], [], []
+        for corners in self.simplices:
+            nodes   = cells[:,None,:] + corners[None,:,:]
+            indices = np.ravel_multi_index(tuple(np.moveaxis(nodes, -1, 0)), self.nodes)
+            Ke      = element_matrix(corners)
+            rows.append(np.repeat(indices, self.nd+1, axis=1).ravel())
+            cols.append(np.tile(indices, (1, self.nd+1)).ravel())
+            vals.append(np.tile(Ke.ravel(), len(cells)))
+        shape = (self.dim, self.dim)
+        return coo_matrix( (np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))), shape=shape ).tocsr()
+
+
+    def simplex_volume(self):
+        return np.prod(self.delta) / factorial(self.nd)
+
+
+    def mass_matrix(self):
+        """Sparse matrix of basis-function overlap integrals M_{ij} = <b_i|b_j>."""
+        cache = self.cache()
+        if 'mass_matrix' not in cache:
+            nd, vol = self.nd, self.simplex_volume()
+            Me = vol/((nd+1)*(nd+2)) * (np.ones((nd+1,nd+1)) + np.identity(nd+1))
+            cache['mass_matrix'] = self.assemble(lambda corners: Me)
+        return cache['mass_matrix']
+
+
+    def stiffness_matrix(self):
+        """Sparse matrix of basis-function gradient overlap integrals K_{ij} = <grad b_i|grad b_j>."""
+        cache = self.cache()
+        if 'stiffness_matrix' not in cache:
+            vol = self.simplex_volume()
+            def Ke(corners):
+                # rows 1: of the inverse of [1 x_k] are the gradients of the barycentric coordinates
+                A = np.hstack([np.ones((self.nd+1,1)), corners*self.delta])
+                G = np.linalg.inv(A)[1:,:]
+                return vol * (G.T @ G)
+            cache['stiffness_matrix'] = self.assemble(Ke)
+        return cache['stiffness_matrix']
+
+
+    def sparse_gram_matrix(self, grid=None):
+        """exact Gram matrix (the grid argument is ignored, as in FiniteElementBasis)"""
+        return self.mass_matrix()
+
+
+    ######################################################################
+    # projection
+    ######################################################################
+    def quadrature_rule(self):
+        """Points, weights, and basis-function matrix of a degree-2 cubature rule
+           over the mesh (exact for products of two basis functions)."""
+        cache = self.cache()
+        if 'quadrature_rule' not in cache:
+            nd    = self.nd
+            a, b  = ( (2.0/3.0, 1.0/6.0) if nd==2 else (0.5854101966249685, 0.1381966011250105) )
+            lam   = b + (a-b)*np.identity(nd+1)      # barycentric coordinates of the nd+1 points
+            cells = np.indices(self.nseg).reshape(nd, -1).T
+            points = [ np.einsum('qk,ckd->cqd', lam, self.pmin + (cells[:,None,:]+corners)*self.delta).reshape(-1,nd)
+                       for corners in self.simplices ]
+            points  = np.hstack([np.vstack(points), np.zeros((len(cells)*len(self.simplices)*(nd+1), 3-nd))])
+            weights = (self.simplex_volume()/(nd+1)) * np.ones(len(points))
+            cache['quadrature_rule'] = (points, weights, self.get_bmatrix(points))
+        return cache['quadrature_rule']
+
+
+    def inner_product(self, g, grid=None, offset=None):
+        """vector of inner products <b_n | g-f_0>, evaluated by cubature on
+           grid if specified, or otherwise by the rule of quadrature_rule()"""
+        offset = self.offset if offset is None else offset
+        if grid is not None:
+            return self.grid_operator(grid).inner(grid_samples(g, grid), offset=offset)
+        points, weights, B = self.quadrature_rule()
+        samples = GridFunc(g, Grid(None, None, None, points=points, weights=weights, shape=[len(points)])).values()
+        return B.T.dot(weights*(samples - offset))
+
+
+    def project(self, g, grid=None, differential=False):
+        """
+        Compute the coefficients of the projection of g(x) onto the basis.
+
+        Sample arrays on a grid are handled by the cached GridOperator
+        for that grid (see Basis.project), as in FiniteElementBasis.
+        Otherwise, the inner products of g with the basis functions are
+        evaluated by cubature (on grid if specified) and the linear system
+        is solved with the exact mass matrix, whose factorization is cached
+        (see Basis.factorization).
+
+        Parameters:
+            g, grid, differential: as in FiniteElementBasis.project
+
+        Return value:
+            Projection coefficients as numpy array of dimension self.dim
+        """
+        if isinstance(g, np.ndarray) and grid is not None:
+            return super().project(g, grid=grid, differential=differential)
+        rhs = self.inner_product(g, grid=grid, offset=0.0 if differential else self.offset)
+        return self.factorization('mass_matrix', self.mass_matrix).solve(rhs)
+
+
+def simplex_corners(perm, flip):
+    """Corner offsets (nd+1, nd) of the vertices of the Kuhn simplex
+       for permutation perm, with the axes in flip reflected."""
+    nd    = len(perm)
+    steps = np.zeros((nd+1, nd), dtype=int)
+    for k, axis in enumerate(perm):
+        steps[k+1]       = steps[k]
+        steps[k+1, axis] = 1
+    return np.where(flip, 1-steps, steps)
+
@@ -8,10 +8,12 @@ import numpy as np
 import meep as mp
 
 import warnings
+from functools import lru_cache
 from datetime import datetime as dt2
 
-from . import (ObjectiveFunction, Basis, v3, V3, E_CPTS, log, update_dashboard)
+from . import (Basis, v3, V3, E_CPTS, log, debug, update_dashboard)
 from . import get_adjoint_option as adj_opt
+from .distributed import is_distributed, allreduce
 
 from .console_manager import CODEWORD as CONSOLE_CODEWORD
 from .console_manager import termsty
@@ -116,7 +118,11 @@ class TimeStepper(object):
         self.sim         = sim
         self.fwd_sources = fwd_sources
         self.dfdEps      = None
+        self.adjoint_nf  = 0      # frequency index of adjoint fields, or None for broadband adjoint runs
+        self.adjoint_split = None # frequency index of the current run of a split broadband adjoint run
+        self.run_counts  = {}     # number of timestepping runs of each job type
         self.state       = 'reset'
+        self.eps_stale   = False  # True if the design has changed since self.sim was initialized
 
 
     def __update__(self, job):
@@ -141,6 +147,8 @@ class TimeStepper(object):
         ** If job==`forward`: **
         fq: numpy array of length N+1 storing values of the objective
             function and the N objective quantities [F, Q0, Q1, ... QN]
+            (with the 'broadband' option: the aggregated objective followed
+            by the N quantities at each of the nfreq frequencies in turn)
 
         ** If job==`adjoint`: **
         df: numpy array of length `basis.dim` storing components of the
@@ -148,20 +156,56 @@ class TimeStepper(object):
 
         """
         if job=='forward':
-            retvals = self.obj_func(self.dft_cells)
-            log('   ** {:10s}={:.5f}  ** '.format('t',self.sim.round_time()))
+            retvals = self.obj_func(self.dft_cells, nf=None if adj_opt('broadband') else 0)
+            log('   ** {:10s}={:.5f}  ** ', 't', self.sim.round_time())
             for n,v in zip(['f'] + self.obj_func.qnames, retvals):
-                log('   ** {:10s}={:+.5e}    '.format(n,v))
+                log('   ** {:10s}={:+.5e}    ', n, v)
         else: # job=='adjoint'
-            EH_fwd = self.design_cell.get_EH_slices(label='forward')
-            EH_adj = self.design_cell.get_EH_slices()
-            self.dfdEps = np.zeros(self.design_cell.grid.shape)
+            # for broadband adjoint runs (adjoint_nf==None) the field arrays
+            # have a leading frequency axis, and df/dEps is summed over it
+            nf     = self.adjoint_nf
+            EH_fwd = self.design_cell.get_EH_slices(label='forward', nf=nf)
+            EH_adj = self.design_cell.get_EH_slices(nf=nf)
+            self.dfdEps = np.zeros(self.design_cell.local_shape)
             for n in [ n for (n,c) in enumerate(self.design_cell.components) if c in E_CPTS]:
-                self.dfdEps += np.real( EH_fwd[n]*EH_adj[n] )
-            retvals = self.basis.project(self.dfdEps, grid=self.design_cell.grid, differential=True)
+                if nf is None:
+                    self.dfdEps += np.real( np.sum(EH_fwd[:,n]*EH_adj[:,n], axis=0) )
+                else:
+                    self.dfdEps += np.real( EH_fwd[n]*EH_adj[n] )
+            if is_distributed():
+                # dfdEps covers only the local slab of the design grid: sum the
+                # partial inner products with the basis functions over ranks
+                op      = self.basis.grid_operator(self.design_cell.grid)
+                rhs     = op.inner(self.dfdEps, points=self.design_cell.local_points())
+                retvals = op.solve(allreduce(rhs))
+            else:
+                retvals = self.basis.project(self.dfdEps, grid=self.design_cell.grid, differential=True)
         return retvals
 
 
+    def __proxy__(self):
+        """
+        Cheap proxy for the output of an adjoint run, used for intermediate convergence checks.
+
+        Returns the norms of the raw (unprojected) df/dEps, evaluated on a
+        subsample of every Nth point of the design grid (N='dft_proxy_stride'),
+        at each frequency of the adjoint fields: at all DFT frequencies for
+        broadband adjoint runs (adjoint_nf==None), so that the convergence
+        check covers every frequency that contributes to the gradient.
+        """
+        stride = max(1, adj_opt('dft_proxy_stride'))
+        nfs    = range(self.design_cell.nfreq) if self.adjoint_nf is None else [self.adjoint_nf]
+        norms  = []
+        for nf in nfs:
+            EH_fwd = self.design_cell.get_EH_slices(label='forward', nf=nf)
+            dfdEps = 0.0
+            for n, c in [ (n,c) for (n,c) in enumerate(self.design_cell.components) if c in E_CPTS ]:
+                EH_adj  = self.design_cell.get_EH_slice(c, nf=nf)
+                dfdEps += np.real( np.ravel(EH_fwd[n])[::stride] * np.ravel(EH_adj)[::stride] )
+            norms.append(np.sum(dfdEps**2))
+        return np.sqrt(allreduce(np.array(norms)))
+
+
     #########################################################
     # main timestepper routine that keeps going until the
     # relevant output quantity has converged
@@ -175,12 +219,30 @@ class TimeStepper(object):
             'forward' or 'adjoint'
 
         """
+        if job=='adjoint' and self.adjoint_split is None:
+            nfs = self.split_frequencies()
+            if nfs:
+                # broadband gradient as the sum of narrowband gradients
+                grads = []
+                try:
+                    for nf in nfs:
+                        self.adjoint_split = nf
+                        grads.append(self.run(job))
+                finally:
+                    self.adjoint_split = None
+                return np.sum(grads, axis=0)
+
         self.prepare(job)
+        self.run_counts[job] = self.run_counts.get(job, 0) + 1
 
-        last_source_time = self.fwd_sources[0].src.swigobj.last_time()
+        last_source_time = max( s.src.swigobj.last_time() for s in (self.sim.sources or self.fwd_sources) )
         max_time         = adj_opt('dft_timeout')*last_source_time
         check_interval   = adj_opt('dft_interval')*last_source_time
+        min_interval     = adj_opt('dft_interval_min')*last_source_time
+        max_interval     = adj_opt('dft_interval_max')*last_source_time
         reltol           = adj_opt('dft_reltol')
+        adaptive         = adj_opt('dft_adaptive')
+        use_proxy        = adj_opt('dft_proxy') and job!='forward'
 
         # configure real-time animations of evolving time-domain fields
 #        step_funcs = []
@@ -210,11 +272,17 @@ class TimeStepper(object):
         wtdb, wtcpu, dt = wt0, wt0, (mtb-mta)/100.0
 
         self.sim.run(mp.at_every(dt, dashboard_sf), until=mtb)
-        vals = self.__update__(job)
+        vals  = self.__update__(job)
+        pvals = self.__proxy__() if use_proxy else None
 
         # now continue timestepping with intermittent convergence checks until
-        # we converge or timeout
-        stage, max_rel_delta = 0, 1.0e9
+        # we converge or timeout. If the 'dft_adaptive' option is set, the
+        # interval between checks is adjusted after each check to the time at
+        # which the observed decay of max_rel_delta predicts convergence. If
+        # the 'dft_proxy' option is set, intermediate checks of adjoint runs
+        # monitor a cheap proxy for the gradient, and the full gradient is
+        # recomputed only when the proxy has converged.
+        stage, max_rel_delta, history = 0, 1.0e9, {'proxy': [], 'full': []}
         while max_rel_delta>reltol and self.sim.round_time() < max_time:
 
             #check_time = self.sim.round_time() + check_interval
@@ -232,11 +300,28 @@ class TimeStepper(object):
             wtdb, wtcpu, dt = wt0, wt0, (mtb-mta)/100.0
             self.sim.run(mp.at_every(dt, dashboard_sf), until=mtb)
 
-            last_vals, vals = vals, self.__update__(job)
-            rel_delta = np.array( [rel_diff(v,lv) for v,lv in zip(vals,last_vals)] )
-            max_rel_delta = np.amax(rel_delta)
+            # the proxy and the full output converge at different rates, so
+            # each has its own history of (time, max_rel_delta) pairs, and
+            # the next interval is predicted from the one that was checked last
+            metric = 'full'
+            if use_proxy:
+                last_pvals, pvals = pvals, self.__proxy__()
+                max_rel_delta = max_rel_diff(pvals, last_pvals)
+                history['proxy'].append( (self.sim.round_time(), max_rel_delta) )
+                metric = 'proxy'
+                debug('   ** t={} proxy MRD={} ** ', self.sim.round_time(), max_rel_delta)
+            if not use_proxy or max_rel_delta<=reltol or mtb>=max_time:
+                last_vals, vals = vals, self.__update__(job)
+                max_rel_delta = max_rel_diff(vals, last_vals)
+                history['full'].append( (self.sim.round_time(), max_rel_delta) )
+                metric = 'full'
             log('   ** t={} MRD={} ** '.format(self.sim.round_time(), max_rel_delta))
 
+            if adaptive:
+                check_interval = next_check_interval(history[metric], reltol, check_interval,
+                                                     min_interval, max_interval)
+                debug('   ** next check interval {} ** ', check_interval)
+
         # for forward runs we save the converged DFT fields for later use
         if job=='forward':
             [ cell.save_fields('forward') for cell in self.dft_cells ]
@@ -275,24 +360,68 @@ class TimeStepper(object):
             raise ValueError('unknown job {} in TimeStepper.prepare'.format(job))
 
         # place sources, register cells, initialize fields
-        reuse_simulation = False
+        if adj_opt('reuse_simulation') and self.sim.structure is not None:
+            if self.recycle_simulation(sources):
+                self.state = target_state
+                return
         if adj_opt('reuse_simulation'):
-            self.sim.reset_meep()
-            self.sim.change_sources(sources)
-        else:
-            cell_size, geometry = self.sim.cell_size, self.sim.geometry
-            self.sim = mp.Simulation(resolution=self.sim.resolution,
-                                     boundary_layers=self.sim.boundary_layers,
-                                     cell_size=self.sim.cell_size,
-                                     geometry=self.sim.geometry,
-                                     sources=sources)
-        self.force_complex_fields = cmplx
+            # a recyclable simulation tabulates complex fields in all cells for all jobs
+            cells, cmplx = self.dft_cells, True
+        self.sim = mp.Simulation(resolution=self.sim.resolution,
+                                 boundary_layers=self.sim.boundary_layers,
+                                 cell_size=self.sim.cell_size,
+                                 geometry=self.sim.geometry,
+                                 sources=sources)
+        self.sim.force_complex_fields = cmplx
         self.sim.init_sim()
         for cell in cells:
             cell.register(self.sim)
+        self.eps_stale = False
         self.state = target_state
 
 
+    def recycle_simulation(self, sources):
+        """Prepare the existing simulation for a new timestepping run in place.
+
+        Instead of constructing a new mp.Simulation, we keep the existing
+        structure (grid chunks, PML, chunk decomposition) alive and
+        (1) re-tabulate the material properties if the design has changed;
+        (2) zero the fields and reset the clock; (3) swap in the new sources;
+        (4) zero the DFT registers of the DFT cells, which remain registered
+        from the run that created the simulation.
+
+        This saves the allocations, but not the material tabulation:
+        pymeep can only re-tabulate the whole cell (set_materials), so
+        step (1) still costs a sweep over every grid point of the cell
+        (with a call to the design function for each point of the design
+        region), as for a new simulation.
+
+        Because the same simulation serves all jobs, it is created with
+        complex fields and with all DFT cells registered (see prepare),
+        which makes adjoint runs somewhat more expensive than without reuse.
+
+        Parameters
+        ----------
+        sources : list of `meep.Source`
+
+        Returns
+        -------
+        True on success, False if this version of pymeep cannot update
+        material properties in place (in which case the caller should
+        construct a new simulation).
+        """
+        if self.eps_stale:
+            if not callable(getattr(self.sim, 'set_materials', None)):
+                return False
+            self.sim.set_materials()
+            self.eps_stale = False
+        self.sim.restart_fields()
+        self.sim.change_sources(sources)
+        for cell in self.dft_cells:
+            cell.zero_dfts()
+        return True
+
+
     ##############################################################
     ##############################################################
     ##############################################################
@@ -306,17 +435,29 @@ class TimeStepper(object):
 
         The optional parameter qname may be set to the name of an objective quantity Q,
         in which case we instead compute dQ/deps.
+
+        If the objective function was last evaluated at all DFT frequencies
+        (the 'broadband' option), df/dq has one row per frequency. In that case
+        the sources for frequency nf are driven by a time profile whose spectrum
+        is 1 at that frequency and vanishes at all other DFT frequencies (see
+        filtered_pulses), so that a single adjoint run yields the adjoint
+        fields at all frequencies, each excited only by its own sources, and
+        df/dEps is accumulated over frequencies by __update__. The sources of
+        each (quantity, component) pair are merged as described in
+        broadband_sources. If no suitable time profiles exist, run() instead
+        does one adjoint run per frequency, setting self.adjoint_split to the
+        frequency index of the current run.
         """
         ######################################################################
         # extract the temporal envelope of the forward sources and use it to
         # set the overall amplitude prefactor for the adjoint sources
         ######################################################################
         envelope = self.fwd_sources[0].src
-        freq     = envelope.frequency
-        omega    = 2.0*np.pi*freq
-        factor   = 2.0j*omega
-        if callable(getattr(envelope, "fourier_transform", None)):
-            factor /= envelope.fourier_transform(freq)
+        def factor(freq):
+            f = 2.0j*(2.0*np.pi*freq)
+            if callable(getattr(envelope, "fourier_transform", None)):
+                f /= envelope.fourier_transform(freq)
+            return f
 
         ######################################################################
         # make a list of (qrule, qweight) pairs for all objective quantities
@@ -324,35 +465,217 @@ class TimeStepper(object):
         ######################################################################
         if qname is None or qname=='adjoint':
             dfdq   = self.obj_func.get_dfdq()
-            iwlist = [ (i,w) for i,w in enumerate(dfdq) if w is not 0.0 ]
+            if np.ndim(dfdq)>1 and len(dfdq)==1:
+                dfdq = dfdq[0]
+            iwlist = [ (i,w) for i,w in enumerate(np.transpose(dfdq)) if np.any(w != 0.0) ]
         elif qname in self.obj_func.qnames:
+            dfdq   = None
             iwlist = [ (self.obj_func.qnames.index(qname), 1.0) ]
         else:
             warnings.warn('unknown objective quantity {} in get_adjoint_sources (skipping)'.format(qname))
             return []
-        rwlist = [ (self.obj_func.qrules[i], w) for (i,w) in iwlist if w!=0.0 ]
+        split  = self.adjoint_split if np.ndim(dfdq)>1 else None
+        rwlist = [ (self.obj_func.qrules[i], w if split is None else w[split])
+                   for (i,w) in iwlist if np.any(w!=0.0) and (split is None or w[split]!=0.0) ]
+        self.adjoint_nf = split if split is not None else None if np.ndim(dfdq)>1 else 0
 
         ######################################################################
         # loop over all contributing objective quantities
         ######################################################################
+        def fields(cell, mode, nf):
+            EH = cell.get_eigenmode_slices(mode,nf) if mode>0 else cell.get_EH_slices('forward',nf)
+            return cell.gather(np.asarray(EH), root=None)
+
         sources = []
         for (qrule, qweight) in rwlist:
             code, mode, cell = qrule.code, qrule.mode, self.dft_cells[qrule.ncell]
-            EH = cell.get_eigenmode_slices(mode) if mode>0 else cell.get_EH_slices('forward')
-            shape = [ len(tics) for tics in [cell.grid.xtics, cell.grid.ytics, cell.grid.ztics] ]
-
-            if code in 'PM':
-                sign  =  1.0 if code=='P' else -1.0
-                signs = [ +1.0, -1.0, +1.0*sign, -1.0*sign ]
-                sources += [ mp.Source(envelope, cell.components[3-nc],
-                                       V3(cell.region.center), V3(cell.region.size),
-                                       amplitude=signs[nc]*factor*qweight,
-                                       amp_data=np.reshape(np.conj(EH[nc]),shape)
-                                      ) for nc in range(len(cell.components))
-                           ]
+            if self.adjoint_nf is None:
+                nfs  = [ nf for nf, w in enumerate(qweight) if w!=0.0 ]
+                EH   = [ fields(cell, mode, nf) for nf in nfs ]
+                amps = [ 2.0j*(2.0*np.pi*cell.freqs[nf])*qweight[nf] for nf in nfs ]
+                sources += broadband_sources(self.filter_pulses(cell), nfs, cell, code, EH, amps)
+            else:
+                nf   = self.adjoint_nf
+                freq = envelope.frequency if split is None else cell.freqs[nf]
+                sources += quantity_sources(envelope, cell, code, fields(cell, mode, nf), factor(freq)*qweight)
         return sources
 
 
+    def filter_pulses(self, cell):
+        """filtered_pulses for the DFT frequencies of cell, or None if a broadband
+           adjoint run would take longer than separate runs at each frequency.
+
+           The pulse width is capped so that the filtered sources are not on
+           for longer than the forward sources would be in nfreq runs.
+        """
+        cutoff    = 5.0
+        last_time = max( s.src.swigobj.last_time() for s in self.fwd_sources )
+        return filtered_pulses(tuple(cell.freqs), cutoff=cutoff,
+                               max_width=len(cell.freqs)*last_time/(2.0*cutoff))
+
+
+    def split_frequencies(self):
+        """Frequency indices at which separate adjoint runs are needed to compute
+           the gradient of a broadband objective, or None if one run suffices."""
+        dfdq = self.obj_func.get_dfdq()
+        if np.ndim(dfdq)<2 or len(dfdq)==1:
+            return None
+        cells = [ self.dft_cells[self.obj_func.qrules[i].ncell]
+                  for i, w in enumerate(np.transpose(dfdq)) if np.any(w!=0.0) ]
+        if all( self.filter_pulses(cell) is not None for cell in cells ):
+            return None
+        return [ nf for nf, w in enumerate(dfdq) if np.any(w!=0.0) ]
+
+
+def quantity_signs(cell, code):
+    """Signs of the adjoint sources of objective quantity code for the components
+       of cell, in the order cell.components[3], ..., cell.components[0]
+       (an empty list if code has no adjoint sources)."""
+    if code not in 'PM':
+        return []
+    sign  =  1.0 if code=='P' else -1.0
+    return [ +1.0, -1.0, +1.0*sign, -1.0*sign ][:len(cell.components)]
+
+
+def quantity_sources(src, cell, code, EH, amplitude):
+    """Adjoint sources with time profile src for objective quantity code in cell,
+       given the fields EH (list of component arrays as returned by get_EH_slices)
+       and an overall complex amplitude."""
+    shape = [ len(tics) for tics in [cell.grid.xtics, cell.grid.ytics, cell.grid.ztics] ]
+    return [ mp.Source(src, cell.components[3-nc],
+                       V3(cell.region.center), V3(cell.region.size),
+                       amplitude=sign*amplitude,
+                       amp_data=np.reshape(np.conj(EH[nc]),shape)
+                      ) for nc, sign in enumerate(quantity_signs(cell, code))
+           ]
+
+
+def broadband_sources(pulses, nfs, cell, code, EH, amps, rtol=1.0e-6):
+    """Adjoint sources for objective quantity code in cell at several frequencies.
+
+    The source distribution for component c is sum_n s_n(t) A_n(x), with
+    A_n = amps[n]*conj(EH[n][c]) and s_n the time profile exciting only the
+    frequency nfs[n] (see filtered_pulses). Rather than one source per
+    frequency, we factor the matrix of the A_n by its singular-value
+    decomposition A_n = sum_k U[n,k] S[k] V[k] and create one source per
+    singular value above rtol*S[0], with spatial profile S[k]*V[k] and
+    time profile sum_n U[n,k] s_n(t). If the shape of the field profile
+    does not depend on frequency, this is a single source per component.
+
+    Parameters
+    ----------
+    pulses : tuple returned by filtered_pulses for cell.freqs
+    nfs : list of int, frequency indices
+    EH : list of field arrays (as returned by get_EH_slices) at each frequency in nfs
+    amps : list of complex amplitudes at each frequency in nfs
+    """
+    shape   = [ len(tics) for tics in [cell.grid.xtics, cell.grid.ytics, cell.grid.ztics] ]
+    sources = []
+    for nc, sign in enumerate(quantity_signs(cell, code)):
+        A = np.array([ a*np.conj(np.ravel(fields[nc])) for a, fields in zip(amps, EH) ])
+        U, S, V = np.linalg.svd(A, full_matrices=False)
+        for k in range(np.count_nonzero(S > rtol*S[0])):
+            weights      = np.zeros(len(cell.freqs), dtype=complex)
+            weights[nfs] = U[:,k]
+            sources.append( mp.Source(filtered_source_time(pulses, weights), cell.components[3-nc],
+                                      V3(cell.region.center), V3(cell.region.size),
+                                      amplitude=sign, amp_data=np.reshape(S[k]*V[k],shape)) )
+    return sources
+
+
+# largest condition number of the weight matrix accepted by filtered_pulses
+FILTER_MAX_CONDITION = 1.0e2
+
+@lru_cache(maxsize=8)
+def filtered_pulses(freqs, cutoff=5.0, max_width=np.inf):
+    """Gaussian pulses from which time profiles with prescribed spectra at a set of DFT frequencies are built.
+
+    The pulses are centered at the frequencies freqs, with a common temporal
+    width chosen so that the pulses of neighboring frequencies overlap
+    moderately in the frequency domain, but no larger than max_width. The
+    coefficients coeff[:,n] are fixed by requiring that the Fourier
+    transform (in MEEP's convention, int dt e^{i*omega*t} f(t)) of
+    the nth combination of pulses be 1 at freqs[n] and 0 at every other
+    frequency in freqs. If the width is capped, the pulses overlap more
+    strongly and the matrix of Fourier transforms becomes ill-conditioned;
+    beyond FILTER_MAX_CONDITION, no pulses are returned.
+
+    Parameters
+    ----------
+    freqs : tuple of float
+        DFT frequencies (at least two).
+    cutoff : float
+        Number of temporal widths for which the pulses are turned on
+        on either side of their common peak time.
+    max_width : float
+        Upper bound on the temporal width.
+
+    Returns
+    -------
+    tuple (freqs, width, t0, coeff) for use by filtered_source_time, or None
+    """
+    freqs = np.array(freqs)
+    width = min(1.0/(np.pi*np.amin(np.diff(np.sort(freqs)))), max_width)
+    t0    = cutoff*width
+    df    = freqs[:,None] - freqs[None,:]
+    ft    = np.exp(2.0j*np.pi*freqs[:,None]*t0) * width*np.sqrt(2.0*np.pi) * np.exp(-2.0*(np.pi*width*df)**2)
+    if np.linalg.cond(ft) > FILTER_MAX_CONDITION:
+        return None
+    return freqs, width, t0, np.linalg.inv(ft)
+
+
+def filtered_source_time(pulses, weights):
+    """Source time profile whose spectrum at the DFT frequencies is weights.
+
+    Parameters
+    ----------
+    pulses : tuple returned by filtered_pulses
+    weights : array of complex, one per frequency
+
+    Returns
+    -------
+    `meep.CustomSource`
+    """
+    freqs, width, t0, coeff = pulses
+    c = coeff @ weights
+    profile = lambda t: complex(np.dot(c, np.exp(-2.0j*np.pi*freqs*(t-t0)))*np.exp(-0.5*((t-t0)/width)**2))
+    return mp.CustomSource(profile, start_time=0.0, end_time=2.0*t0,
+                           center_frequency=freqs[np.argmax(np.abs(weights))], fwidth=1.0/width)
+
+
+
+
+def max_rel_diff(vals, last_vals):
+    """Return the largest rel_diff between corresponding entries of two arrays."""
+    return np.amax( [rel_diff(v,lv) for v,lv in zip(vals,last_vals)] )
+
+
+def next_check_interval(history, reltol, interval, min_interval, max_interval):
+    """Predict the time interval until the next convergence check of a timestepping run.
+
+    Assuming the convergence metric decays exponentially in time, its decay rate is
+    estimated from the two most recent checks and used to predict the time
+    remaining until it falls below reltol. If no decay has been observed yet,
+    the current interval is retained.
+
+    Parameters
+    ----------
+    history : list of (time, max_rel_delta) pairs for all checks so far
+    reltol : float, convergence tolerance
+    interval : float, current check interval
+    min_interval, max_interval : float, bounds on the returned interval
+
+    Returns
+    -------
+    float, the interval to the next check
+    """
+    if len(history) < 2:
+        return interval
+    (t1, d1), (t2, d2) = history[-2:]
+    if not (reltol < d2 < d1) or t2 <= t1:
+        return float(np.clip(interval, min_interval, max_interval))
+    rate = np.log(d1/d2) / (t2-t1)
+    return float(np.clip( np.log(d2/reltol)/rate, min_interval, max_interval ))
 
 
 def rel_diff(a,b):
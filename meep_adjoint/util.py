@@ -7,44 +7,156 @@ import traceback
 import socket
 import re
 import warnings
+import hashlib
+import atexit
+import threading
+from collections import deque
 from datetime import datetime as dt2
 from tempfile import gettempdir
 
-"""module-global filename and timestamp format for log files"""
+import numpy as np
+
+"""module-global filename, timestamp format, and verbosity threshold for log files"""
 LOGFILE, LOGFMT = None, '%D<>%T.%f '
+LOGLEVELS = {'debug': 10, 'info': 20, 'warning': 30}
+LOGLEVEL = LOGLEVELS['info']
+
+"""module-global BufferedLog instance, created on first write to LOGFILE"""
+_logger = None
+
+
+class BufferedLog(object):
+    """Log-file backend with a persistent file handle and deferred writes.
+
+    Lines are appended to an in-memory buffer and written out in batches by
+    a background thread every `interval` seconds, or synchronously by the
+    caller if the buffer fills up (so no lines are ever dropped). The file
+    is opened once and stays open, which avoids the open/close churn of
+    one-shot appends on network filesystems.
+
+    Args:
+        filename (str): log file, opened in append mode
+        capacity (int): number of buffered lines that triggers a synchronous flush
+        interval (float): seconds between background flushes
+    """
+    def __init__(self, filename, capacity=1024, interval=1.0):
+        self.file     = open(filename,'a')
+        self.buffer   = deque()
+        self.lock     = threading.Lock()
+        self.capacity = capacity
+        self.interval = interval
+        self.stop     = threading.Event()
+        self.thread   = threading.Thread(target=self._flush_periodically, daemon=True)
+        self.thread.start()
+
+    def write(self, line):
+        self.buffer.append(line)
+        if len(self.buffer) >= self.capacity:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            lines = [ self.buffer.popleft() for _ in range(len(self.buffer)) ]
+            if lines and not self.file.closed:
+                self.file.write(''.join(lines))
+                self.file.flush()
+
+    def close(self):
+        self.stop.set()
+        self.flush()
+        with self.lock:
+            self.file.close()
+
+    def _flush_periodically(self):
+        while not self.stop.wait(self.interval):
+            self.flush()
+
+
+def _close_log():
+    """flush and close the log file (registered to run at exit)"""
+    global _logger
+    if _logger is not None:
+        _logger.close()
+        _logger = None
 
-def init_log(filename='meep_adjoint.log', usecs=None):
+
+def _abandon_log():
+    """discard the parent's logger in a forked child (its flush thread does not survive fork)"""
+    global _logger
+    _logger = None
+
+
+atexit.register(_close_log)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_abandon_log)
+
+
+def init_log(filename='meep_adjoint.log', usecs=None, loglevel=None):
     """configure global logfile settings
 
     Args:
         filename (str): name of logfile or '' to disable logging.
         usecs (bool): True/False for microsecond/second resolution in logfile timestamps
+        loglevel (str): 'debug', 'info', or 'warning'; messages logged at
+                        lower levels are discarded without being formatted
 
     Returns:
-        Nothing (sets module-global variables LOGFILE, LOGFMT)
+        Nothing (sets module-global variables LOGFILE, LOGFMT, LOGLEVEL)
     """
-    global LOGFILE, LOGFMT
+    global LOGFILE, LOGFMT, LOGLEVEL
     if filename is not None:
+        _close_log()
         LOGFILE = filename or None
     if LOGFILE and LOGFILE!=os.path.abspath(LOGFILE):
         LOGFILE = gettempdir() + PATHSEP + LOGFILE
     if usecs is not None:
         LOGFMT = '%D<>%T' + ('.%f ' if usecs else ' ')
+    if loglevel is not None:
+        LOGLEVEL = LOGLEVELS.get(loglevel, LOGLEVEL)
+
+
+def log(msg, *args, level='info'):
+    """write a timestamped line to the log file.
 
+    Args:
+        msg (str): message, or format string if args are present
+        args: optional arguments for msg.format(); formatting is skipped
+              entirely if the message is filtered out by the log level
+        level (str): 'debug', 'info', or 'warning'
+    """
+    global _logger
+    if not (msg and LOGFILE) or LOGLEVELS[level] < LOGLEVEL:
+        return
+    if _logger is None:
+        _logger = BufferedLog(LOGFILE)
+    _logger.write(dt2.now().strftime(LOGFMT) + (msg.format(*args) if args else msg) + '\n')
+
+
+def debug(msg, *args):
+    """log a message at debug level (free if the log level is above debug)"""
+    log(msg, *args, level='debug')
 
-def log(msg):
-    global LOGFILE
-    if msg and LOGFILE:
-        with open(LOGFILE,'a') as f:
-            f.write(dt2.now().strftime(LOGFMT) + msg + '\n')
+
+def flush_log():
+    """write out any buffered log lines immediately"""
+    if _logger is not None:
+        _logger.flush()
 
 
 def warn(msg, retval=None):
-    log('warning: ' + msg)
+    log('warning: ' + msg, level='warning')
     warnings.warn(msg)
     return retval
 
 
+def array_digest(a):
+    """Return a hex digest identifying the shape, datatype, and contents of an array."""
+    a = np.ascontiguousarray(a)
+    digest = hashlib.sha1(a.tobytes())
+    digest.update('{}{}'.format(a.dtype, a.shape).encode())
+    return digest.hexdigest()
+
+
 def get_exception_info(msg=None,warning=False):
     """Return a detailed description of an exception in string form.
 
@@ -401,7 +401,7 @@ def plot_dft_flux(sim, dft_cells, superpose=True, nf=0, options={}):
     # first pass to get arrays of poynting flux strength for all cells
     flux_cells, flux_arrays = [c for c in dft_cells if c.celltype=='flux'], []
     for cell in flux_cells:
-        w, EH = cell.grid.weights, cell.get_EH_slices(nf=nf)
+        w, EH = cell.grid.weights, cell.get_EH_slices(nf=nf, full=True)
         flux_arrays.append( 0.25*np.real(w*(np.conj(EH[0])*EH[3] - np.conj(EH[1])*EH[2])) )
 
     # second pass to plot
@@ -581,7 +581,7 @@ def plot_dft_fields(sim, dft_cells, superpose=True, field_funcs=None,
 
     for n, cell in enumerate(field_cells):
         x, y, z, w = cell.grid.xtics, cell.grid.ytics, cell.grid.ztics, cell.grid.weights
-        cEH, EH = cell.components, cell.get_EH_slices(nf=nf)
+        cEH, EH = cell.components, cell.get_EH_slices(nf=nf, full=True)
         X, Y = np.meshgrid(x, y)
         fig = plt.gcf()
         ax  = fig.gca(projection='3d')
@@ -0,0 +1,14 @@
+"""pytest configuration for the meep_adjoint tests.
+
+   If the real meep (pymeep) cannot be imported, the lightweight stand-in in
+   benchmarks/standin is put on sys.path instead, so that the tests of the
+   Python-side code paths of meep_adjoint run without libmeep.
+"""
+import sys
+import os
+
+try:
+    import meep
+except ImportError:
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                    os.pardir, 'benchmarks', 'standin'))
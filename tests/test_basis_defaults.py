@@ -0,0 +1,47 @@
+""" Test of the default Basis methods for a minimal subclass.
+
+    A subclass implementing only the per-point evaluator get_bvector must
+    get the cubature Gram matrix (as a dense array), inner products and
+    projections of the original point-by-point formulas, now evaluated
+    through the default get_bmatrix.
+"""
+import sys
+import os
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.abspath('..'))
+from meep_adjoint import Basis, make_grid
+
+
+class Monomials(Basis):
+    def __init__(self, size):
+        super().__init__(4, size=size, offset=0.5)
+
+    def get_bvector(self, p):
+        return np.array([1.0, p[0], p[1], p[0]*p[1]])
+
+
+def test_minimal_subclass():
+    size  = [2.0, 1.0, 0.0]
+    basis = Monomials(size)
+    grid  = make_grid(size, dims=[9, 5])
+    g     = lambda p: np.exp(p[0]) * np.cos(p[1])
+
+    bvecs = np.array([ basis.get_bvector(p) for p in grid.points ])
+    gvals = np.array([ g(p) for p in grid.points ])
+    gram  = np.sum([ w*np.outer(b,b) for b, w in zip(bvecs, grid.weights) ], axis=0)
+    rhs   = np.sum([ w*b*(gv-basis.offset) for b, gv, w in zip(bvecs, gvals, grid.weights) ], axis=0)
+
+    gm = basis.gram_matrix(grid=grid)
+    assert isinstance(gm, np.ndarray) and np.allclose(gm, gram)
+    assert np.allclose(basis.sparse_gram_matrix(grid=grid).toarray(), gram)
+    assert np.allclose(basis.inner_product(g, grid=grid), rhs)
+    assert np.allclose(basis.project(g, grid=grid), np.linalg.solve(gram, rhs))
+
+
+def test_abstract_subclass():
+    class Empty(Basis):
+        pass
+    with pytest.raises(TypeError):
+        Empty(1, size=[1.0, 1.0, 0.0])
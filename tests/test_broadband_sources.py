@@ -0,0 +1,66 @@
+""" Test of the adjoint sources for broadband objectives.
+
+    Checks that the time profiles built from filtered_pulses have the
+    prescribed spectrum at each DFT frequency, that filtered_pulses
+    declines ill-conditioned pulse sets, and that the merged sources of
+    broadband_sources reproduce the per-frequency source distributions.
+"""
+import sys
+import os
+import numpy as np
+
+sys.path.insert(0, os.path.abspath('..'))
+import meep as mp
+import meep_adjoint as ma
+from meep_adjoint.timestepper import filtered_pulses, filtered_source_time, broadband_sources
+
+
+FREQS = (0.9, 1.0, 1.1)
+
+
+def spectrum(src, freqs, dt=0.005):
+    """Fourier transforms int dt e^{i*omega*t} f(t) of a CustomSource at freqs."""
+    t = np.arange(0.0, src.swigobj.last_time(), dt)
+    f = np.array([ src.src_func(tt) for tt in t ])
+    return np.array([ dt*np.sum(np.exp(2.0j*np.pi*freq*t)*f) for freq in freqs ])
+
+
+def test_filtered_weights():
+    pulses  = filtered_pulses(FREQS)
+    weights = np.array([1.0, -0.5j, 0.25+0.25j])
+    assert np.allclose(spectrum(filtered_source_time(pulses, weights), FREQS), weights, atol=1.0e-4)
+    for n in range(len(FREQS)):
+        assert np.allclose(spectrum(filtered_source_time(pulses, np.eye(len(FREQS))[n]), FREQS),
+                           np.eye(len(FREQS))[n], atol=1.0e-4)
+
+
+def test_filtered_conditioning():
+    width  = filtered_pulses(FREQS)[1]
+    pulses = filtered_pulses(FREQS, max_width=0.5*width)
+    assert pulses[1] == 0.5*width
+    assert np.allclose(spectrum(filtered_source_time(pulses, np.ones(len(FREQS))), FREQS), 1.0, atol=1.0e-4)
+    assert filtered_pulses(FREQS, max_width=0.1*width) is None
+
+
+def test_broadband_sources():
+    sim  = mp.Simulation(cell_size=mp.Vector3(4, 4), resolution=10)
+    cell = ma.DFTCell(ma.Subregion(center=[1.5, 0, 0], size=[0, 3, 0], normal=mp.X, name='port'),
+                      fcen=1.0, df=0.2, nfreq=len(FREQS))
+    cell.register(sim)
+    pulses = filtered_pulses(tuple(cell.freqs))
+    nfs    = [0, 2]
+    EH     = [ np.asarray(cell.get_eigenmode_slices(1, nf)) for nf in nfs ]
+    amps   = [ 2.0, 1.0j ]
+    srcs   = broadband_sources(pulses, nfs, cell, 'P', EH, amps)
+
+    signs  = [ +1.0, -1.0, +1.0, -1.0 ]
+    for nc in range(len(cell.components)):
+        mine = [ s for s in srcs if s.component == cell.components[3-nc] ]
+        assert 0 < len(mine) <= len(nfs)
+        # spectrum of the summed sources at each DFT frequency
+        total = sum( s.amplitude*s.amp_data[None,...]*spectrum(s.src, cell.freqs)[:,None,None,None]
+                     for s in mine )
+        for n, nf in enumerate(nfs):
+            assert np.allclose(np.ravel(total[nf]), signs[nc]*amps[n]*np.conj(np.ravel(EH[n][nc])),
+                               atol=1.0e-4)
+        assert np.allclose(total[1], 0.0, atol=1.0e-4)
@@ -0,0 +1,63 @@
+""" Test of the adaptive interval between DFT convergence checks.
+
+    For an exactly exponential decay of the convergence metric, the
+    predicted interval lands on the time at which the metric reaches the
+    tolerance; without observed decay the current interval is retained.
+    Also checks that the proxy metric for convergence checks of adjoint
+    runs covers every frequency of the adjoint fields.
+"""
+import sys
+import os
+import numpy as np
+
+sys.path.insert(0, os.path.abspath('..'))
+import meep as mp
+import meep_adjoint as ma
+from meep_adjoint.timestepper import next_check_interval, max_rel_diff
+
+
+def test_exponential_decay():
+    rate, reltol = 0.5, 1.0e-6
+    delta   = lambda t: np.exp(-rate*t)
+    history = [ (t, delta(t)) for t in (2.0, 4.0, 6.0) ]
+    t_conv  = np.log(1.0/reltol)/rate
+    assert np.isclose(next_check_interval(history, reltol, 2.0, 0.1, 100.0), t_conv - 6.0)
+    assert next_check_interval(history, reltol, 2.0, 0.1, 5.0) == 5.0
+    assert next_check_interval(history, reltol, 2.0, 50.0, 100.0) == 50.0
+
+
+def test_no_decay():
+    assert next_check_interval([], 1.0e-6, 2.0, 0.1, 100.0) == 2.0
+    assert next_check_interval([(1.0, 1.0e-2)], 1.0e-6, 2.0, 0.1, 100.0) == 2.0
+    assert next_check_interval([(1.0, 1.0e-2), (3.0, 2.0e-2)], 1.0e-6, 2.0, 0.1, 100.0) == 2.0
+    assert next_check_interval([(1.0, 1.0e-2), (3.0, 1.0e-7)], 1.0e-6, 200.0, 0.1, 100.0) == 100.0
+
+
+def test_proxy_frequencies(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    ma.set_option_defaults({'dashboard': 'off', 'fcen': 1.0, 'df': 0.2, 'nfreq': 3, 'res': 10,
+                            'dft_reltol': 1.0e-3, 'filebase': 'test', 'element_length': 0.5,
+                            'eps_design': '2.0', 'dft_proxy_stride': 3}, search_env=False)
+    del ma.dft_cell_names[:]
+    prob = ma.OptimizationProblem(cell_size=[4,4,0],
+               sources=[mp.Source(mp.GaussianSource(1.0, fwidth=0.2), mp.Ez, center=mp.Vector3(-1.5))],
+               objective_regions=[ma.Subregion(center=[1.5,0,0], size=[0,3,0], normal=mp.X, name='east')],
+               design_region=ma.Subregion(center=[0,0,0], size=[2,2,0], name='design'),
+               objective_function='Abs(P1_east)**2')
+    stepper = prob.stepper
+    stepper.run('forward')
+    proxy   = stepper.__proxy__
+
+    # a change of the adjoint fields at any one frequency shows up in the proxy
+    # of a broadband adjoint run, but only in that of a run at that frequency
+    get_EH_slice = stepper.design_cell.get_EH_slice
+    for nf in range(3):
+        for adjoint_nf, changed in [ (None, True), (nf, True), ((nf+1)%3, False) ]:
+            stepper.adjoint_nf = adjoint_nf
+            monkeypatch.setattr(stepper.design_cell, 'get_EH_slice', get_EH_slice)
+            p0 = proxy()
+            monkeypatch.setattr(stepper.design_cell, 'get_EH_slice',
+                                lambda c, nf=0, n=nf: (1.5 if nf==n else 1.0)*get_EH_slice(c, nf=nf))
+            p1 = proxy()
+            assert len(p0) == (3 if adjoint_nf is None else 1)
+            assert (max_rel_diff(p1, p0) > 0.1) == changed
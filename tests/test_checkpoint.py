@@ -0,0 +1,92 @@
+""" Test of checkpoint files.
+
+    Checks that a nested dict of arrays, strings, and numbers survives
+    a round trip through write_checkpoint/read_checkpoint, that
+    rewriting a checkpoint replaces it without leaving temporary files,
+    and that OptimizationProblem resumes an interrupted optimization from
+    its last accepted iterate.
+"""
+import sys
+import os
+from tempfile import TemporaryDirectory
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.abspath('..'))
+import meep as mp
+import meep_adjoint as ma
+from meep_adjoint.checkpoint import write_checkpoint, read_checkpoint
+
+
+def test_checkpoint_round_trip():
+    rng   = np.random.RandomState(0)
+    state = { 'beta_vector': rng.rand(10),
+              'design_key':  'abc123',
+              'history':     np.array([0.1, 0.2]),
+              'optimizer':   { 'alpha': 0.5, 'iters': 3, 'x': rng.rand(10) },
+              'forward':     { 'fq': None,
+                               'EH': { '0': rng.rand(2,4,5) + 1.0j*rng.rand(2,4,5) } } }
+
+    with TemporaryDirectory() as tmpdir:
+        filename = os.path.join(tmpdir, 'test.checkpoint.npz')
+        assert read_checkpoint(filename) is None
+
+        write_checkpoint(filename, state)
+        state['optimizer']['iters'] = 4
+        write_checkpoint(filename, state)
+        assert os.listdir(tmpdir) == ['test.checkpoint.npz']
+
+        restored = read_checkpoint(filename)
+        assert restored['design_key'] == 'abc123'
+        assert restored['optimizer']['iters'] == 4 and restored['optimizer']['alpha'] == 0.5
+        assert 'fq' not in restored['forward']
+        for a, b in [ (state['beta_vector'], restored['beta_vector']),
+                      (state['history'], restored['history']),
+                      (state['optimizer']['x'], restored['optimizer']['x']),
+                      (state['forward']['EH']['0'], restored['forward']['EH']['0']) ]:
+            assert np.array_equal(a, b)
+
+
+class Interrupted(Exception):
+    pass
+
+
+def make_problem(resume):
+    ma.set_option_defaults({'dashboard': 'off', 'fcen': 1.0, 'df': 0.2, 'res': 10, 'dft_reltol': 1.0e-3,
+                            'filebase': 'test', 'element_length': 0.5, 'eps_design': '2.0',
+                            'beta_max': 12.0, 'checkpoint_interval': 1.0e-9, 'resume': resume},
+                           search_env=False)
+    del ma.dft_cell_names[:]     # objective cells are looked up by name among all DFTCells
+    return ma.OptimizationProblem(cell_size=[4,4,0],
+               sources=[mp.Source(mp.GaussianSource(1.0, fwidth=0.2), mp.Ez, center=mp.Vector3(-1.5))],
+               objective_regions=[ma.Subregion(center=[1.5,0,0], size=[0,3,0], normal=mp.X, name='east')],
+               design_region=ma.Subregion(center=[0,0,0], size=[2,2,0], name='design'),
+               objective_function='Abs(P1_east)**2')
+
+
+def test_resume(tmp_path, monkeypatch):
+    """An optimization interrupted during its first line search, after a
+       checkpoint was written for a trial point, resumes from its initial
+       point and not from the trial point."""
+    monkeypatch.chdir(tmp_path)
+    prob, designs = make_problem(resume=False), []
+    run = prob.stepper.run
+    def interrupted_run(job):
+        if job=='forward':
+            if len(designs) == 2:
+                raise Interrupted()
+            designs.append(np.copy(prob.beta_vector))
+        return run(job)
+    monkeypatch.setattr(prob.stepper, 'run', interrupted_run)
+    x0 = 2.0 + np.linspace(0.0, 1.0, prob.basis.dim)
+    with pytest.raises(Interrupted):
+        prob.optimize(beta_vector=x0)
+    x0, trial = designs
+    assert not np.array_equal(x0, trial)
+
+    prob = make_problem(resume=True)
+    assert np.array_equal(prob.beta_vector, trial) and prob.optimizer_state is None
+    assert np.array_equal(prob.restart_x, x0)
+    assert prob.cache.lookup(prob.cache.key(trial)) is not None      # trial value restored
+    x, _, _, _ = prob.optimize(options={'max_iters': 0})
+    assert np.array_equal(x, x0) and prob.stepper.run_counts == {'forward': 1, 'adjoint': 1}
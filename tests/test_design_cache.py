@@ -0,0 +1,86 @@
+""" Test of the design cache.
+
+    Checks least-recently-used eviction of entries and of field snapshots,
+    that equal design vectors have equal keys however they are stored,
+    and that OptimizationProblem keys its cache on the design vector as
+    clipped by update_design, discarding stale forward fields when the
+    design changes but keeping them (even if they are not cached) when
+    it does not.
+"""
+import sys
+import os
+import numpy as np
+
+sys.path.insert(0, os.path.abspath('..'))
+import meep as mp
+import meep_adjoint as ma
+from meep_adjoint import DesignCache, get_adjoint_option as adj_opt
+
+
+def test_lru_eviction():
+    cache = DesignCache(max_entries=2, max_bytes=1000)
+    cache.store('a', fq=np.ones(2), fields=[np.zeros(100)])
+    cache.store('b', fq=np.ones(2))
+    assert cache.lookup('a') is not None          # now most recently used
+    cache.store('c', fq=np.ones(2))
+    assert list(cache.entries) == ['a', 'c']
+
+    cache.store('c', fields={'EH': [np.zeros(100)]})
+    assert 'fields' not in cache.lookup('a') and 'fq' in cache.lookup('a')
+    assert 'fields' in cache.lookup('c')
+    assert DesignCache(max_entries=0).store('a', fq=1.0) is None
+
+
+def test_key_equality():
+    beta = np.random.RandomState(0).uniform(size=10)
+    assert DesignCache.key(beta) == DesignCache.key(beta.copy())
+    assert DesignCache.key(np.arange(20.0)[::2]) == DesignCache.key(np.arange(0.0, 20.0, 2.0))
+    assert DesignCache.key(beta) != DesignCache.key(beta + 1.0e-15)
+    assert DesignCache.key(beta) != DesignCache.key(beta.reshape(2,5))
+    assert DesignCache.key(np.zeros(4)) != DesignCache.key(np.zeros(2, dtype=complex))
+
+
+def make_problem(options={}):
+    ma.set_option_defaults(dict({'dashboard': 'off', 'fcen': 1.0, 'df': 0.2, 'res': 10, 'dft_reltol': 1.0e-3,
+                                 'filebase': 'test', 'element_length': 0.5, 'eps_design': '2.0',
+                                 'beta_max': 12.0}, **options), search_env=False)
+    del ma.dft_cell_names[:]     # objective cells are looked up by name among all DFTCells
+    return ma.OptimizationProblem(cell_size=[4,4,0],
+               sources=[mp.Source(mp.GaussianSource(1.0, fwidth=0.2), mp.Ez, center=mp.Vector3(-1.5))],
+               objective_regions=[ma.Subregion(center=[1.5,0,0], size=[0,3,0], normal=mp.X, name='east')],
+               design_region=ma.Subregion(center=[0,0,0], size=[2,2,0], name='design'),
+               objective_function='Abs(P1_east)**2')
+
+
+def test_clipped_design(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    prob = make_problem()
+    bmin, bmax = adj_opt('beta_min'), adj_opt('beta_max')
+    x     = np.linspace(bmin - 1.0, bmax + 1.0, prob.basis.dim)
+    assert np.all(np.isfinite(x)) and np.any(x < bmin) and np.any(x > bmax)
+    fq, _ = prob(beta_vector=x, need_gradient=False)
+    assert prob.fields_key == DesignCache.key(np.clip(x, bmin, bmax))
+
+    # the unclipped and the clipped design are the same design
+    for y in [ x, np.clip(x, bmin, bmax) ]:
+        fy, _ = prob(beta_vector=y, need_gradient=False)
+        assert fy[0] == fq[0] and prob.stepper.run_counts == {'forward': 1}
+
+    # a new design invalidates the forward fields, so its gradient needs a new forward run
+    prob.update_design(beta_vector=0.5*(bmin + bmax)*np.ones(prob.basis.dim))
+    assert prob.fields_key is None
+    prob(need_value=False, need_gradient=True)
+    assert prob.stepper.run_counts == {'forward': 2, 'adjoint': 1}
+
+
+def test_same_design_keeps_fields(tmp_path, monkeypatch):
+    """Without cached field snapshots, the gradient at the design of the
+       last forward run reuses the fields left in the DFT cells."""
+    monkeypatch.chdir(tmp_path)
+    prob  = make_problem({'cache_fields': False})
+    f, df = prob.get_fdf_funcs()
+    x     = 2.0 + np.linspace(0.0, 1.0, prob.basis.dim)
+    f(x)
+    df(x.copy())
+    assert prob.stepper.run_counts == {'forward': 1, 'adjoint': 1}
+    assert prob.fields_key == DesignCache.key(x)
@@ -0,0 +1,121 @@
+""" Test of the distributed-DFT code path.
+
+    Checks that objective quantities computed at all frequencies at once
+    equal those computed at each frequency in turn. Then runs DFTCell
+    registration, objective quantities (at one and at all frequencies),
+    slab gathering, and the gradient projection of
+    TimeStepper.__update__ through the 'dft_distributed' code path with a
+    one-rank communicator, and checks the results against the serial path.
+    Then fakes the two ranks of a two-rank run in turn, and checks that
+    their slabs tile the grid and that their partial inner products and
+    gradients add up to the serial ones.
+"""
+import sys
+import os
+import numpy as np
+
+sys.path.insert(0, os.path.abspath('..'))
+import meep as mp
+import meep_adjoint as ma
+from meep_adjoint import distributed
+
+
+class FakeRank(object):
+    """Stand-in for an mpi4py communicator, as seen from rank `rank` of `size`,
+       whose collective operations see only the contribution of that rank
+       (and so are exact for size 1)."""
+    def __init__(self, rank=0, size=1):
+        self.rank, self.size = rank, size
+    def Get_rank(self):           return self.rank
+    def Get_size(self):           return self.size
+    def allreduce(self, x):       return x
+    def allgather(self, x):       return [x]
+    def gather(self, x, root=0):  return [x]
+
+
+def run_cells():
+    del ma.dft_cell_names[:]
+    sim    = mp.Simulation(cell_size=mp.Vector3(4, 4), resolution=10)
+    flux   = ma.DFTCell(ma.Subregion(center=[1.5, 0, 0], size=[0, 3, 0], normal=mp.X, name='east'),
+                        fcen=1.0, df=0.4, nfreq=3)
+    design = ma.DFTCell(ma.Subregion(center=[0, 0, 0], size=[2, 2, 0], name='design'),
+                        components=ma.E_CPTS, fcen=1.0, df=0.4, nfreq=3)
+    for cell in (flux, design):
+        cell.register(sim)
+    sim.run(until=10.0)
+    for cell in (flux, design):
+        cell.save_fields('forward')
+    return flux, design
+
+
+def gradient(design, basis):
+    """Gradient computed by TimeStepper.__update__ from the saved forward fields
+       and the current DFT fields of the design cell (equal here, so that
+       dfdEps = sum of squares of the E components)."""
+    return ma.TimeStepper(None, [design], basis, design.sim, []).__update__('adjoint')
+
+
+def results(flux, design):
+    basis  = ma.SimpleFiniteElementBasis(size=[2, 2, 0], nseg=[4, 4])
+    EH     = design.EH_cache['forward'][0]
+    dfdEps = np.real(np.sum(EH*EH, axis=0))
+    return [ flux('P', mode=1, nf=None), flux('S', nf=None), flux('P', mode=1, nf=1),
+             design.gather(np.asarray(design.get_EH_slices(label='forward', nf=2)), root=None),
+             gradient(design, basis), basis.project(dfdEps, grid=design.grid, differential=True) ]
+
+
+def test_all_frequencies():
+    """Quantities at all frequencies at once (nf=None) are those at each frequency, stacked."""
+    flux, design = run_cells()
+    for cell, code, mode in [ (flux, 'P', 1), (flux, 'M', 1), (flux, 'S', 0), (design, 'UE', 0) ]:
+        stacked = np.array([ cell(code, mode=mode, nf=n) for n in range(len(cell.freqs)) ])
+        assert np.allclose(cell(code, mode=mode, nf=None), stacked)
+        assert np.any(stacked != stacked[0])
+
+
+def test_one_rank(monkeypatch):
+    serial = results(*run_cells())
+
+    monkeypatch.setattr(mp, 'count_processors', lambda: 2)
+    monkeypatch.setattr(distributed, 'communicator', lambda: FakeRank())
+    ma.set_option_defaults({'dft_distributed': True}, search_env=False)
+    try:
+        assert distributed.is_distributed()
+        flux, design = run_cells()
+        assert design.slab == slice(0, design.grid.shape[0])
+        dist = results(flux, design)
+    finally:
+        ma.set_option_defaults({'dft_distributed': False}, search_env=False)
+
+    for a, b in zip(serial, dist):
+        assert np.allclose(a, b)
+    assert np.allclose(dist[4], dist[5])
+
+
+def test_two_ranks(monkeypatch):
+    basis  = ma.SimpleFiniteElementBasis(size=[2, 2, 0], nseg=[4, 4])
+    _, serial = run_cells()
+    EH        = serial.EH_cache['forward'][0]
+    op        = basis.grid_operator(serial.grid)
+    projected = basis.project(np.real(np.sum(EH*EH, axis=0)), grid=serial.grid, differential=True)
+    grad      = gradient(serial, basis)
+
+    monkeypatch.setattr(mp, 'count_processors', lambda: 2)
+    ma.set_option_defaults({'dft_distributed': True}, search_env=False)
+    slabs, rhs, grads = [], 0.0, 0.0
+    try:
+        for rank in [0, 1]:
+            monkeypatch.setattr(distributed, 'communicator', lambda rank=rank: FakeRank(rank, 2))
+            _, design = run_cells()
+            local     = design.EH_cache['forward'][0]
+            assert np.array_equal(local, EH[:, design.slab])
+            slabs.append(design.slab)
+            rhs   = rhs + op.inner(np.real(np.sum(local*local, axis=0)), points=design.local_points())
+            grads = grads + gradient(design, basis)
+    finally:
+        ma.set_option_defaults({'dft_distributed': False}, search_env=False)
+
+    n = serial.grid.shape[0]
+    assert n % 2 == 1 and slabs == [slice(0, n//2), slice(n//2, n)]     # unequal slabs
+    assert np.allclose(op.solve(rhs), projected)
+    assert np.allclose(grads, grad) and np.allclose(grad, projected)
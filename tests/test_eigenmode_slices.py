@@ -0,0 +1,27 @@
+""" Test of eigenmode tabulation in DFTCell.
+
+    Checks that get_eigenmode_slices, which hands pre-built meep::vecs to
+    the low-level evaluator, reproduces the per-point output of
+    EigenmodeData.amplitude() used previously, for every component and
+    frequency.
+"""
+import sys
+import os
+import numpy as np
+
+sys.path.insert(0, os.path.abspath('..'))
+import meep as mp
+import meep_adjoint as ma
+
+
+def test_eigenmode_slices():
+    sim  = mp.Simulation(cell_size=mp.Vector3(4, 4), resolution=10)
+    cell = ma.DFTCell(ma.Subregion(center=[1.5, 0, 0], size=[0, 3, 0], normal=mp.X, name='port'),
+                      fcen=1.0, df=0.4, nfreq=3)
+    cell.register(sim)
+    vol  = mp.Volume(ma.V3(cell.region.center), ma.V3(cell.region.size))
+    for nf, freq in enumerate(cell.freqs):
+        eigenmode = sim.get_eigenmode(freq, cell.normal, vol, 1, mp.Vector3())
+        old = [ np.reshape([eigenmode.amplitude(mp.Vector3(*p), c) for p in cell.grid.points],
+                           cell.grid.shape) for c in cell.components ]
+        assert np.array_equal(cell.get_eigenmode_slices(1, nf), old)
@@ -0,0 +1,30 @@
+""" Test of the public names of the package.
+
+    __all__ lists the eagerly imported public names, all of which are
+    bound without touching the lazily imported subsystems. The lazily
+    imported names are attributes of the package but not in __all__, so
+    a star import works even without PyQt5.
+"""
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath('..'))
+import meep_adjoint as ma
+
+
+def test_all():
+    assert len(set(ma.__all__)) == len(ma.__all__)
+    assert not set(ma._LAZY_ATTRIBUTES) & set(ma.__all__)
+    assert all( name in vars(ma) for name in ma.__all__ )
+    assert 'mp' not in ma.__all__ and 'importlib' not in ma.__all__
+    assert set(ma.__all__) | set(ma._LAZY_ATTRIBUTES) <= set(dir(ma))
+
+
+def test_star_import_without_pyqt(monkeypatch):
+    monkeypatch.setitem(sys.modules, 'PyQt5', None)      # import PyQt5 --> ImportError
+    monkeypatch.delitem(sys.modules, 'meep_adjoint.dashboard_server', raising=False)
+    monkeypatch.delitem(vars(ma), 'run_dashboard', raising=False)
+    namespace = {}
+    exec('from meep_adjoint import *', namespace)
+    assert 'OptimizationProblem' in namespace and 'run_dashboard' not in namespace
+    assert 'meep_adjoint.dashboard_server' not in sys.modules
@@ -0,0 +1,62 @@
+""" Test of disk-backed storage of DFT fields.
+
+    Checks that FieldStore returns the arrays stored in it whether or not
+    they are resident in RAM, that the backing files of disk_array leave
+    nothing behind in the cache directory, and that DFTCell.save_fields
+    keeps fields in memory unless a cache directory is given, with the
+    same results either way.
+"""
+import sys
+import os
+import gc
+import numpy as np
+
+sys.path.insert(0, os.path.abspath('..'))
+import meep as mp
+import meep_adjoint as ma
+from meep_adjoint.dft_cell import FieldStore, disk_array
+
+
+def test_round_trip(tmp_path):
+    rng    = np.random.RandomState(0)
+    shape  = (4, 2, 3, 5)
+    fields = rng.rand(*shape) + 1.0j*rng.rand(*shape)
+    for hot_size in [0, 1, 2]:
+        store = FieldStore(shape, directory=str(tmp_path), hot_size=hot_size)
+        for nf in range(shape[0]):
+            store[nf] = fields[nf]
+        assert len(store) == shape[0] and store.shape == shape
+        for nf in [0, 1, 0, 3, 2, 3]:
+            assert np.array_equal(store[nf], fields[nf])
+        assert len(store.hot) == hot_size
+        store[3] = 2.0*fields[3]                 # overwrite a resident frequency
+        assert np.array_equal(store[3], 2.0*fields[3])
+
+
+def test_cleanup(tmp_path):
+    data = disk_array((3, 4), directory=str(tmp_path))
+    data[...] = 1.0j
+    assert os.listdir(str(tmp_path)) == [] and np.all(data == 1.0j)
+    store = FieldStore((2, 3), directory=str(tmp_path))
+    store[0] = np.ones(3)
+    del data, store
+    gc.collect()
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_memory_fallback(tmp_path):
+    del ma.dft_cell_names[:]
+    sim  = mp.Simulation(cell_size=mp.Vector3(4, 4), resolution=10,
+                         sources=[mp.Source(mp.GaussianSource(1.0, fwidth=0.4), mp.Ez, center=mp.Vector3())])
+    cell = ma.DFTCell(ma.Subregion(center=[0, 0, 0], size=[2, 2, 0], name='design'),
+                      components=ma.E_CPTS, fcen=1.0, df=0.4, nfreq=3)
+    cell.register(sim)
+    sim.run(until=10.0)
+    assert not cell.cache_dir
+    cell.save_fields('memory')
+    cell.cache_dir = str(tmp_path)
+    cell.save_fields('disk')
+    assert isinstance(cell.EH_cache['memory'], np.ndarray) and np.any(cell.EH_cache['memory'] != 0.0)
+    assert isinstance(cell.EH_cache['disk'], FieldStore)
+    for nf in range(len(cell.freqs)):
+        assert np.array_equal(cell.get_EH_slices(label='memory', nf=nf), cell.get_EH_slices(label='disk', nf=nf))
@@ -0,0 +1,36 @@
+""" Test of the evaluation of functions at grid points by GridFunc.
+
+    Checks that expression strings, callables that handle (N,3) arrays of
+    points, callables that handle only single points given as arrays, and
+    callables written for meep's per-point mp.Vector3 argument all yield
+    the values of the function at the points of the grid.
+"""
+import sys
+import os
+import math
+import numpy as np
+
+sys.path.insert(0, os.path.abspath('..'))
+import meep as mp
+from meep_adjoint import make_grid
+from meep_adjoint.basis import GridFunc
+
+
+def test_grid_func():
+    grid = make_grid([2.0, 1.0, 0.0], dims=[9, 5])
+    x, y = np.transpose(grid.points)[:2]
+    vals = 1.0 + x*x*y
+
+    args = []
+    def vector3_func(p):
+        val = 1.0 + p.x*p.x*p.y
+        args.append(p)
+        return val
+
+    for f in [ '1.0 + x*x*y',
+               lambda p: 1.0 + p[...,0]**2*p[...,1],             # vectorized
+               lambda p: 1.0 + math.pow(p[0], 2)*p[1],           # single points only
+               vector3_func ]:
+        assert np.allclose(GridFunc(f, grid).values(), vals)
+    assert len(args) == len(grid) and all(isinstance(p, mp.Vector3) for p in args)
+    assert np.allclose(GridFunc(2.5, grid).values(), 2.5*np.ones(len(grid)))
@@ -0,0 +1,38 @@
+""" Test of the bound-constrained L-BFGS optimizer.
+
+    Maximizes a concave quadratic whose unconstrained maximum lies partly
+    outside the box [0,1]^D, checks the result against the known constrained
+    optimum, and checks that an optimization interrupted and resumed from
+    the state passed to the hook reaches the same point.
+"""
+import sys
+import os
+import numpy as np
+
+sys.path.insert(0, os.path.abspath('..'))
+from meep_adjoint.lbfgs import lbfgs
+
+
+D   = 12
+rng = np.random.RandomState(1)
+A   = np.diag(np.linspace(1.0, 20.0, D))
+b   = A @ rng.uniform(-0.5, 1.5, D)
+x_opt = np.clip(np.linalg.solve(A, b), 0.0, 1.0)   # A is diagonal
+
+
+def fdf(x, need_gradient=True):
+    f = np.dot(b, x) - 0.5*np.dot(x, A @ x)
+    return f, (b - A @ x if need_gradient else None)
+
+
+def test_lbfgs_box_quadratic():
+    opts = {'xmin': 0.0, 'xmax': 1.0, 'gtol': 1.0e-6, 'ftol': 0.0}
+    x, f, g, result = lbfgs(fdf, 0.5*np.ones(D), opts)
+    assert result in ('gtol', 'ftol')
+    assert np.allclose(x, x_opt, atol=1.0e-6)
+
+    states = []
+    hook   = lambda stage, state: states.append(dict(state))
+    lbfgs(fdf, 0.5*np.ones(D), dict(opts, max_iters=3, hook=hook))
+    xr, fr, _, _ = lbfgs(fdf, None, dict(opts, state=states[-1]))
+    assert np.allclose(xr, x_opt, atol=1.0e-6) and np.isclose(fr, f)
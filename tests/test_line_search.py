@@ -0,0 +1,29 @@
+""" Test of the interpolating line search.
+
+    On a quadratic line function the first interpolated step lands on the
+    exact maximizer; the cubic interpolant reproduces the maximizer of a
+    cubic (or quadratic) line function from two trial points.
+"""
+import sys
+import os
+import numpy as np
+
+sys.path.insert(0, os.path.abspath('..'))
+from meep_adjoint.line_search import line_search, interpolate_step
+
+
+def test_quadratic_step():
+    f      = lambda x: -np.sum((x - 0.3)**2)
+    x0, g0 = np.zeros(2), 0.6*np.ones(2)
+    calls  = []
+    x, fx, alpha, result, trials = line_search(lambda x: calls.append(x) or f(x),
+                                               x0, f(x0), g0, g0, 10.0, {'shrink_min': 0.01})
+    assert result == 'success' and trials == 2 == len(calls)
+    assert np.allclose(x, 0.3) and np.isclose(alpha, 0.5)
+
+
+def test_cubic_step():
+    phi = lambda a: a - a**3
+    assert np.isclose(interpolate_step(0.0, 1.0, [(2.0, phi(2.0)), (1.5, phi(1.5))]), 1.0/np.sqrt(3.0))
+    phi = lambda a: -3.6*(a - 0.5)**2                     # cubic coefficient 0
+    assert np.isclose(interpolate_step(phi(0.0), 3.6, [(10.0, phi(10.0)), (5.0, phi(5.0))]), 0.5)
@@ -0,0 +1,80 @@
+""" Test of the buffered log file.
+
+    Checks that messages below the log level are discarded without being
+    formatted, that buffered lines are written out when the buffer fills
+    up or the log is closed (and not before), and that lines logged by
+    forked pool_map workers reach the log file.
+"""
+import sys
+import os
+import pytest
+
+sys.path.insert(0, os.path.abspath('..'))
+from meep_adjoint import util, parallel
+from meep_adjoint.util import BufferedLog, init_log, log, debug, flush_log
+
+
+class Unformattable(object):
+    def __format__(self, spec):
+        raise AssertionError('suppressed message was formatted')
+
+
+@pytest.fixture
+def logfile(tmp_path):
+    filename = str(tmp_path / 'test.log')
+    init_log(filename=filename, loglevel='info')
+    yield filename
+    init_log(filename='', loglevel='info')
+
+
+def lines(filename):
+    with open(filename) as f:
+        return [ l.split(' ', 1)[1].rstrip('\n') for l in f ]
+
+
+def test_level_threshold(logfile):
+    debug('hidden {}', Unformattable())
+    log('shown {}', 1)
+    log('warned', level='warning')
+    flush_log()
+    assert lines(logfile) == ['shown 1', 'warned']
+
+    init_log(filename=None, loglevel='warning')
+    log('hidden {}', Unformattable())
+    init_log(filename=None, loglevel='debug')
+    debug('debug {}', 2)
+    flush_log()
+    assert lines(logfile) == ['shown 1', 'warned', 'debug 2']
+
+
+def test_flush_on_close(tmp_path):
+    filename = str(tmp_path / 'buffered.log')
+    logger   = BufferedLog(filename, capacity=3, interval=3600.0)
+    logger.write('a\n')
+    logger.write('b\n')
+    assert os.path.getsize(filename) == 0          # buffered
+    logger.write('c\n')                            # buffer full: synchronous flush
+    assert open(filename).read() == 'a\nb\nc\n'
+    logger.write('d\n')
+    logger.close()
+    assert open(filename).read() == 'a\nb\nc\nd\n'
+
+    filename = str(tmp_path / 'test.log')
+    init_log(filename=filename, loglevel='info')
+    try:
+        log('e')
+        util._close_log()                          # as at exit
+        assert lines(filename) == ['e'] and util._logger is None
+    finally:
+        init_log(filename='')
+
+
+def test_pool_workers(logfile):
+    if not parallel.can_fork():
+        pytest.skip('cannot fork worker processes')
+    def work(n):
+        log('worker {}', n)
+        return n
+    assert parallel.pool_map(work, [0, 1, 2, 3], 2) == [0, 1, 2, 3]
+    flush_log()
+    assert sorted(lines(logfile)) == ['worker 0', 'worker 1', 'worker 2', 'worker 3']
@@ -0,0 +1,124 @@
+""" Test of the numerical evaluation of objective functions.
+
+    ObjectiveFunction.evaluate computes the objective function and its
+    partial derivatives with a single compiled NumPy function. Checks its
+    results for a nonlinear objective against sympy.diff and evalf, for a
+    single set of objective-quantity values and for a batch of them with
+    a leading frequency axis. For evaluations at all frequencies, checks
+    each rule for aggregating the per-frequency values ('sum', 'min',
+    'max', 'weighted') and the corresponding weighting of dfdq.
+"""
+import sys
+import os
+import numpy as np
+import sympy
+import pytest
+
+sys.path.insert(0, os.path.abspath('..'))
+from meep_adjoint import dft_cell_names
+from meep_adjoint.objective import ObjectiveFunction
+
+FSTR = 'Abs(P1_0)**2*exp(-S_1/2) + P1_0*M1_0**2 + 3*log(1 + Abs(M1_0)**2)'
+
+
+@pytest.fixture(autouse=True)
+def two_cells():
+    """Objective quantities refer to DFT cells 0 and 1."""
+    saved = dft_cell_names[:]
+    dft_cell_names[:] = ['west_flux', 'east_flux']
+    yield
+    dft_cell_names[:] = saved
+
+
+def reference(fstr, qnames, qvals):
+    """f (real part) and [df/dq] at qvals, differentiating f(q = r + I*i)
+       symbolically and evaluating with evalf."""
+    fexpr    = sympy.sympify(fstr)
+    ri       = [ sympy.symbols(['r'+q, 'i'+q], real=True) for q in qnames ]
+    fri      = fexpr.subs({ sympy.Symbol(q): r + sympy.I*i for q, (r, i) in zip(qnames, ri) })
+    subs     = { s: v for (r, i), q in zip(ri, qvals) for s, v in ((r, np.real(q)), (i, np.imag(q))) }
+    f        = complex(fri.evalf(subs=subs))
+    dfdq     = [ complex((sympy.diff(fri, r) - sympy.I*sympy.diff(fri, i)).evalf(subs=subs)) for r, i in ri ]
+    return f.real, np.array(dfdq)
+
+
+def test_evaluate():
+    obj  = ObjectiveFunction(fstr=FSTR)
+    assert obj.qnames == ['M1_0', 'P1_0', 'S_1']
+    rng  = np.random.RandomState(0)
+    qs   = rng.uniform(-1, 1, (4, 3)) + 1.0j*rng.uniform(-1, 1, (4, 3))
+    qs[:, 2] = np.real(qs[:, 2])                        # a flux is real
+
+    for q in qs:
+        f, dfdq = obj.evaluate(q)
+        fref, dref = reference(FSTR, obj.qnames, q)
+        assert np.ndim(f) == 0 and dfdq.shape == (3,)
+        assert np.isclose(f, fref) and np.allclose(dfdq, dref)
+
+    # batched over a leading frequency axis
+    f, dfdq = obj.evaluate(qs)
+    assert f.shape == (4,) and dfdq.shape == (4, 3)
+    for n, q in enumerate(qs):
+        fref, dref = reference(FSTR, obj.qnames, q)
+        assert np.isclose(f[n], fref) and np.allclose(dfdq[n], dref)
+
+
+def test_constant_derivative():
+    """A derivative that does not depend on the quantities is broadcast over
+       the batch (for analytic f, df/dr - i df/di is twice f'(q))."""
+    obj     = ObjectiveFunction(fstr='2*S_0 + S_1**2')
+    f, dfdq = obj.evaluate(np.array([[1.0, 2.0], [3.0, 4.0], [5.0, 6.0]]))
+    assert np.allclose(f, [6.0, 22.0, 46.0])
+    assert np.allclose(dfdq, [[4.0, 8.0], [4.0, 16.0], [4.0, 24.0]])
+
+
+class FakeCell(object):
+    """DFT cell returning given values of quantities at each frequency."""
+    def __init__(self, values):
+        self.values = values               # {code: array of values over frequencies}
+    def __call__(self, code, mode=0, nf=0):
+        v = np.asarray(self.values[code + str(mode)])
+        return v if nf is None else v[nf]
+
+
+def test_aggregation():
+    rng   = np.random.RandomState(1)
+    cells = [ FakeCell({ 'P1': rng.rand(3) + 1.0j*rng.rand(3) }),
+              FakeCell({ 'S0': rng.rand(3) }) ]
+    fstr  = 'Abs(P1_0)**2 - S_1'
+    w     = [0.2, 0.5, 0.3]
+    for rule, weights in [('sum', None), ('min', None), ('max', None), ('weighted', w)]:
+        obj = ObjectiveFunction(fstr=fstr, freq_aggregate=rule, freq_weights=weights)
+
+        # per-frequency values and derivatives
+        single = [ obj(cells, nf=n) for n in range(3) ]
+        dsingle= []
+        for n in range(3):
+            obj(cells, nf=n)
+            dsingle.append(obj.get_dfdq())
+        fn     = np.array([ s[0] for s in single ])
+        qn     = np.array([ s[1:] for s in single ])
+
+        fq   = obj(cells, nf=None)
+        assert np.allclose(obj.fvals, np.real(fn))
+        assert np.allclose(fq[1:], qn.ravel())           # quantities listed for each frequency in turn
+        expected = { 'sum': np.sum(fn), 'min': np.amin(fn), 'max': np.amax(fn),
+                     'weighted': np.dot(w, fn) }[rule]
+        assert np.isclose(fq[0], expected)
+
+        # the derivative of the aggregate is the weighted per-frequency derivative
+        n_active = { 'min': np.argmin(fn), 'max': np.argmax(fn) }.get(rule)
+        weights  = { 'sum': np.ones(3), 'weighted': np.array(w) }.get(rule)
+        if weights is None:
+            weights = np.eye(3)[n_active]
+        assert np.allclose(obj.get_dfdq(), weights[:,None]*np.array(dsingle))
+
+
+def test_aggregation_errors():
+    with pytest.raises(ValueError):
+        ObjectiveFunction(fstr='S_0', freq_aggregate='mean')
+    with pytest.raises(ValueError):
+        ObjectiveFunction(fstr='S_0', freq_aggregate='weighted')
+    obj = ObjectiveFunction(fstr='S_0', freq_aggregate='weighted', freq_weights=[1.0, 2.0])
+    with pytest.raises(ValueError):
+        obj([FakeCell({'S0': np.ones(3)})], nf=None)
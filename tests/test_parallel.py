@@ -0,0 +1,200 @@
+""" Test of the process-group helpers in a single process.
+
+    With a single group, the group helpers reduce to their serial
+    counterparts, and the speculative line search makes exactly the
+    function evaluations of the serial line search. With K groups faked
+    by substituting merge (which supplies the values the other groups
+    would have computed), the speculative line search tries the expected
+    step lengths, accepts the best acceptable trial, re-centers failed
+    rounds and stops as documented, and owner/shared_fdf pick the group
+    holding the forward fields. pool_map returns the serial results,
+    whether it forks workers or falls back to serial evaluation, and
+    per-quantity gradients are the same whether or not they are computed
+    by forked workers.
+"""
+import sys
+import os
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.abspath('..'))
+import meep as mp
+import meep_adjoint as ma
+from meep_adjoint import parallel, optimization_problem
+from meep_adjoint.line_search import line_search
+
+
+def test_one_group():
+    assert parallel.divide_groups(1) == 0
+    assert parallel.num_groups() == 1 and parallel.group() == 0 and parallel.am_root()
+    assert np.array_equal(parallel.merge(2.0), [[2.0]])
+    assert np.array_equal(parallel.merge([1.0, 2.0]), [[1.0, 2.0]])
+    assert parallel.owner(True) == 0 and parallel.owner(False) == -1
+
+
+def test_one_group_line_search():
+    f      = lambda x: -np.sum((x - np.array([0.3, 0.9, -0.2]))**2)
+    x0     = np.zeros(3)
+    g0     = np.array([0.6, 1.8, -0.4])
+    for alpha, options in [ (10.0, {}), (40.0, {'xmin': -0.1, 'xmax': 0.5}), (1.0e3, {'max_trials': 3}) ]:
+        runs = []
+        for search in [line_search, parallel.speculative_line_search]:
+            calls  = []
+            result = search(lambda x: calls.append(x) or f(x), x0, f(x0), g0, g0, alpha, options)
+            runs.append((result, calls))
+        (serial, serial_calls), (spec, spec_calls) = runs
+        assert np.array_equal(serial[0], spec[0]) and serial[1:] == spec[1:]
+        assert len(serial_calls) == len(spec_calls) == serial[4]
+        assert all(np.array_equal(a, b) for a, b in zip(serial_calls, spec_calls))
+
+
+def fake_groups(monkeypatch, K, g, others):
+    """Make this process group g of K, with merge(x) returning others(n, x)
+       as the value of x on each other group n."""
+    def merge(x):
+        x = np.atleast_1d(np.asarray(x, dtype=float))
+        return np.array([ x if n==g else np.atleast_1d(others(n, x)) for n in range(K) ])
+    for module in [parallel, optimization_problem]:
+        monkeypatch.setattr(module, 'merge', merge)
+    monkeypatch.setattr(parallel, '_num_groups', K)
+    monkeypatch.setattr(parallel, '_group', g)
+    monkeypatch.setattr(optimization_problem, 'num_groups', lambda: K)
+    monkeypatch.setattr(optimization_problem, 'group', lambda: g)
+
+
+@pytest.mark.parametrize('K,g', [(3, 0), (3, 1), (5, 4)])
+def test_speculative_line_search(monkeypatch, tmp_path, K, g):
+    f      = lambda x: -np.sum((x - np.array([0.3, 0.9]))**2)
+    x0, g0 = np.zeros(2), np.array([0.6, 1.8])          # phi(a) = f(a*g0) is maximal at a=0.5
+    shrink = 0.5
+    calls  = []
+
+    def others(n, fx):
+        # value that group n computes in the same round: its step length is
+        # that of this group, scaled by shrink**(n-g)
+        a = np.dot(calls[-1] - x0, g0)/np.dot(g0, g0)
+        return f(x0 + a*shrink**(n-g)*g0)
+    fake_groups(monkeypatch, K, g, others)
+
+    def search(alpha, **options):
+        del calls[:]
+        rounds = {}
+        hook   = lambda event, x, fx, a, rnd: rounds.setdefault(rnd, []).append(a)
+        result = parallel.speculative_line_search(lambda x: calls.append(x) or f(x),
+                                                  x0, f(x0), g0, g0, alpha, dict(options, hook=hook))
+        assert len(calls) == len(rounds) == result[4]          # one evaluation per round
+        for a, x in zip(rounds.values(), calls):
+            assert np.allclose(a, [ a[1]*shrink**(n-1) for n in range(K) ])   # bold, alpha, timid...
+            assert np.allclose(x, x0 + a[g]*g0)                               # this group's trial
+        return result, list(rounds.values())
+
+    # of the acceptable trials 0.8, 0.4, 0.2, ... the one closest to the maximizer wins
+    (x, fx, alpha, result, trials), rounds = search(0.4)
+    assert (result, trials) == ('success', 1) and np.isclose(alpha, 0.4)
+    assert np.isclose(fx, f(x0 + 0.4*g0))
+
+    # round 1 fails, round 2 is centered on the interpolated maximizer
+    # a=0.5 (no bold trial is acceptable), which has the largest value
+    (x, fx, alpha, result, trials), rounds = search(2.5/shrink**(K-2))
+    assert result == 'success' and trials == 2
+    assert np.isclose(rounds[0][-1], 2.5) and np.isclose(rounds[1][1], 0.5)
+    assert np.isclose(alpha, 0.5) and np.allclose(x, [0.3, 0.9]) and np.isclose(fx, 0.0)
+
+    # the interpolated maximizer 0.5 exceeds shrink**2 times the smallest step
+    # tried, so the next round is re-centered on that bold step instead, and
+    # its bold trial (closest to the maximizer) is accepted
+    (x, fx, alpha, result, trials), rounds = search(2.0/shrink**(K-3))
+    assert result == 'success' and trials == 2
+    assert np.isclose(rounds[1][1], shrink**2*rounds[0][-1])
+    assert np.isclose(alpha, rounds[1][0]) and np.allclose(x, alpha*g0)
+
+    # unsuccessful exits return the smallest step tried
+    (x, fx, alpha, result, trials), rounds = search(10.0, alpha_min=10.0*shrink**(K-2))
+    assert (result, trials) == ('alpha', 1) and np.isclose(alpha, rounds[0][-1])
+    (x, fx, alpha, result, trials), rounds = search(10.0, max_trials=1)
+    assert (result, trials) == ('iters', 1) and np.isclose(alpha, rounds[0][-1])
+    stopfile = tmp_path / 'stop'
+    stopfile.write_text('')
+    (x, fx, alpha, result, trials), rounds = search(10.0, stopfile=str(stopfile))
+    assert (result, trials) == ('user', 1) and np.allclose(x, x0 + alpha*g0)
+
+
+def test_owner(monkeypatch):
+    flags = [0.0, 1.0, 1.0]
+    fake_groups(monkeypatch, 3, 2, lambda n, x: flags[n])
+    assert parallel.owner(True) == 1 and parallel.owner(False) == 1
+    flags = [0.0, 0.0, 0.0]
+    assert parallel.owner(True) == 2 and parallel.owner(False) == -1
+
+
+def make_problem(objective_function='Abs(P1_east)**2', options={}):
+    ma.set_option_defaults(dict({'dashboard': 'off', 'fcen': 1.0, 'df': 0.2, 'res': 10, 'dft_reltol': 1.0e-3,
+                                 'filebase': 'test', 'element_length': 0.5, 'eps_design': '2.0',
+                                 'beta_max': 12.0}, **options), search_env=False)
+    del ma.dft_cell_names[:]     # objective cells are looked up by name among all DFTCells
+    return ma.OptimizationProblem(cell_size=[4,4,0],
+               sources=[mp.Source(mp.GaussianSource(1.0, fwidth=0.2), mp.Ez, center=mp.Vector3(-1.5))],
+               objective_regions=[ma.Subregion(center=[1.5,0,0], size=[0,3,0], normal=mp.X, name='east')],
+               design_region=ma.Subregion(center=[0,0,0], size=[2,2,0], name='design'),
+               objective_function=objective_function)
+
+
+def test_shared_fdf(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    prob = make_problem()
+    x   = 2.0 + np.linspace(0.0, 1.0, prob.basis.dim)
+    row = np.arange(1.0 + prob.basis.dim)               # results of another group
+
+    # nobody has fields for x: group 0 computes, so group 1 only updates its design
+    fake_groups(monkeypatch, 3, 1, lambda n, v: 0.0 if v.size==1 else row)
+    f, df = prob.shared_fdf(x)
+    assert f == row[0] and np.array_equal(df, row[1:]) and prob.stepper.run_counts == {}
+    assert np.array_equal(prob.beta_vector, x)
+
+    # only group 2 has fields for x: it computes
+    fake_groups(monkeypatch, 3, 1, lambda n, v: float(n==2) if v.size==1 else row)
+    f, df = prob.shared_fdf(x)
+    assert f == row[0] and prob.stepper.run_counts == {}
+
+    # this group holds the forward fields for x (e.g. as the group that evaluated
+    # the accepted trial point) and is the first to do so: it computes, with one
+    # adjoint run
+    fq, _ = prob(beta_vector=x, need_gradient=False)
+    fake_groups(monkeypatch, 3, 1, lambda n, v: float(n==2) if v.size==1 else row)
+    f, df = prob.shared_fdf(x)
+    assert f == np.real(fq[0]) and prob.stepper.run_counts == {'forward': 1, 'adjoint': 1}
+    assert np.array_equal(df, np.real(prob(beta_vector=x)[1]))
+
+
+def test_quantity_gradients(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    fstr, x = 'Abs(P1_east)**2 - Abs(M1_east)**2', None
+    grads, counts = [], []
+    for workers, mpi in [(1, False), (3, False), (3, True)]:
+        monkeypatch.setattr(mp, 'with_mpi', lambda: mpi)
+        prob = make_problem(fstr, {'adjoint_workers': workers})
+        x    = 2.0 + np.linspace(0.0, 1.0, prob.basis.dim)
+        if mpi:
+            with pytest.warns(UserWarning, match='adjoint_workers=3 ignored'):
+                grads.append(prob.quantity_gradients(beta_vector=x))
+        else:
+            grads.append(prob.quantity_gradients(beta_vector=x))
+        counts.append(prob.stepper.run_counts)
+
+    assert sorted(grads[0]) == ['M1_east', 'P1_east']
+    for g, c in zip(grads, counts):
+        assert c == {'forward': 1, 'M1_east': 1, 'P1_east': 1}
+        for q in grads[0]:
+            assert g[q].dtype == float and np.allclose(g[q], grads[0][q])
+    assert np.any(grads[0]['P1_east'] != 0.0)
+
+
+def test_pool_map(monkeypatch):
+    data   = np.random.RandomState(0).uniform(size=(50, 50))
+    func   = lambda n: float(np.sum(data**n))          # not picklable
+    args   = [1, 2, 3, 4, 5]
+    serial = [ func(n) for n in args ]
+    assert parallel.pool_map(func, args, 3) == serial
+    assert parallel.pool_map(func, args, 1) == serial
+    monkeypatch.setattr(parallel, 'can_fork', lambda: False)
+    assert parallel.pool_map(func, args, 3) == serial
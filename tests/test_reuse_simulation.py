@@ -0,0 +1,75 @@
+""" Test of simulation reuse (the 'reuse_simulation' option).
+
+    With reuse, TimeStepper constructs one mp.Simulation and recycles it
+    for every later forward and adjoint run: it re-tabulates the materials
+    only after a design change, restarts the fields, swaps in the sources
+    of the new run and zeroes the DFT registers. Checks that the objective
+    values, gradients and DFT fields of a sequence of runs agree with
+    those of fresh simulations, and that the simulation is neither rebuilt
+    nor its materials re-tabulated more often than needed.
+"""
+import sys
+import os
+import numpy as np
+
+sys.path.insert(0, os.path.abspath('..'))
+import meep as mp
+import meep_adjoint as ma
+
+
+def make_problem(options={}):
+    ma.set_option_defaults(dict({'dashboard': 'off', 'fcen': 1.0, 'df': 0.2, 'res': 10, 'dft_reltol': 1.0e-3,
+                                 'filebase': 'test', 'element_length': 0.5, 'eps_design': '2.0',
+                                 'beta_max': 12.0, 'cache_fields': False}, **options), search_env=False)
+    del ma.dft_cell_names[:]
+    return ma.OptimizationProblem(cell_size=[4,4,0],
+               sources=[mp.Source(mp.GaussianSource(1.0, fwidth=0.2), mp.Ez, center=mp.Vector3(-1.5))],
+               objective_regions=[ma.Subregion(center=[1.5,0,0], size=[0,3,0], normal=mp.X, name='east')],
+               design_region=ma.Subregion(center=[0,0,0], size=[2,2,0], name='design'),
+               objective_function='Abs(P1_east)**2')
+
+
+def run_sequence(prob):
+    """Value and gradient at two designs, with the design-cell fields of each forward run."""
+    results = []
+    for x in [ 2.0*np.ones(prob.basis.dim), np.linspace(1.0, 10.0, prob.basis.dim) ]:
+        fq, grad = prob(beta_vector=x, need_gradient=True)
+        EH       = prob.stepper.design_cell.get_EH_slices(label='forward')
+        results.append((fq, grad, EH))
+    return results
+
+
+def test_reuse_simulation(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    fresh  = run_sequence(make_problem())
+
+    counts = {'Simulation': 0, 'set_materials': 0}
+    class CountingSimulation(mp.Simulation):
+        def __init__(self, *args, **kwargs):
+            counts['Simulation'] += 1
+            super(CountingSimulation, self).__init__(*args, **kwargs)
+        def set_materials(self, *args, **kwargs):
+            counts['set_materials'] += 1
+            super(CountingSimulation, self).set_materials(*args, **kwargs)
+    monkeypatch.setattr(mp, 'Simulation', CountingSimulation)
+
+    prob   = make_problem({'reuse_simulation': True})
+    sims, run = [], prob.stepper.run
+    def logged_run(job):
+        result = run(job)
+        sims.append(prob.stepper.sim)
+        return result
+    monkeypatch.setattr(prob.stepper, 'run', logged_run)
+    counts['Simulation'] = 0          # do not count the simulation built by OptimizationProblem
+    reused = run_sequence(prob)
+
+    # one simulation serves all four runs; the materials are re-tabulated
+    # only for the forward run at the second design
+    assert len(sims) == 4 and all(sim is sims[0] for sim in sims)
+    assert counts == {'Simulation': 1, 'set_materials': 1}
+    assert prob.stepper.run_counts == {'forward': 2, 'adjoint': 2}
+    assert not prob.stepper.eps_stale
+
+    for (fq, grad, EH), (fq0, grad0, EH0) in zip(reused, fresh):
+        assert np.allclose(fq, fq0) and np.allclose(grad, grad0)
+        assert all(np.allclose(e, e0) for e, e0 in zip(EH, EH0))
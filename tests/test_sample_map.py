@@ -0,0 +1,34 @@
+""" Test of the map from finite-element degrees of freedom to grid samples.
+
+    FunctionFromSamples assigns to each degree of freedom the grid sample
+    nearest to it. Checks that the vectorized map agrees with the original
+    per-DOF loop, for DOF coordinates in arbitrary order and perturbed by
+    roundoff, on 2D and 3D grids.
+"""
+import sys
+import os
+import numpy as np
+
+sys.path.insert(0, os.path.abspath('..'))
+from meep_adjoint.finite_element_basis import nearest_samples
+
+
+def old_samples(coords, g_samples, vmin, delta):
+    nd, v = len(vmin), np.zeros(len(coords))
+    for i, p in enumerate(coords):
+        n = [ int(round((p[d]-vmin[d])/delta[d])) for d in range(nd) ]
+        v[i] = g_samples[tuple(n)]
+    return v
+
+
+def test_sample_map():
+    rng = np.random.RandomState(2)
+    for n, vmin, vmax in [ ((9, 5), (-1.0, -0.5), (1.0, 0.5)),
+                           ((4, 3, 6), (0.0, -1.0, 2.0), (1.5, 1.0, 3.0)) ]:
+        tics    = [ np.linspace(a, b, m) for a, b, m in zip(vmin, vmax, n) ]
+        delta   = [ t[1]-t[0] for t in tics ]
+        coords  = np.stack(np.meshgrid(*tics, indexing='ij'), axis=-1).reshape(-1, len(n))
+        coords  = rng.permutation(coords) + 1.0e-10*rng.uniform(-1.0, 1.0, coords.shape)
+        samples = rng.uniform(size=n)
+        index   = nearest_samples(coords, n, vmin, delta)
+        assert np.array_equal(np.ravel(samples)[index], old_samples(coords, samples, vmin, delta))
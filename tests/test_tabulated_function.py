@@ -0,0 +1,35 @@
+""" Test of tabulated parameterized functions.
+
+    With a grid, Basis.parameterized_function interpolates multilinearly
+    in a table of values instead of summing basis functions. Checks that
+    the table is exact at the grid points and that elsewhere the error
+    is bounded by |grad f| * (distance to the farthest cell corner) <=
+    nd * (range of beta) * h / delta, for grid spacing h and element
+    size delta of a piecewise-linear basis.
+"""
+import sys
+import os
+import numpy as np
+
+sys.path.insert(0, os.path.abspath('..'))
+from meep_adjoint import SimpleFiniteElementBasis, make_grid
+
+
+def test_tabulated_function_error():
+    size, nseg = [2.0, 1.0, 0.0], [8, 4]
+    basis = SimpleFiniteElementBasis(size=size, nseg=nseg)
+    beta  = np.random.RandomState(0).uniform(0.0, 1.0, basis.dim)
+    exact = basis.parameterized_function(beta)
+    for refine in [2, 4, 8]:
+        dims   = [ refine*n + 1 for n in nseg ]
+        grid   = make_grid(size, dims=dims)
+        table  = basis.parameterized_function(beta, grid=grid)
+        assert np.allclose([table(p) for p in grid.points[::7]],
+                           [exact(p) for p in grid.points[::7]])
+
+        h      = max( s/(d-1) for s, d in zip(size, dims) )
+        delta  = min( s/n for s, n in zip(size, nseg) )
+        bound  = 2 * (beta.max() - beta.min()) * h / delta
+        points = np.random.RandomState(1).uniform(-0.5, 0.5, (300, 3)) * [2.0, 1.0, 0.0]
+        error  = max( abs(table(p) - exact(p)) for p in points )
+        assert error <= bound